@@ -0,0 +1,227 @@
+"""
+Converts every saved game under a directory at once, spreading the work over all the machine's cores.
+
+Unpacking turns each .GladiusSave file into a .json (or .bjson) and an .ini file in the unpacked directory next to it,
+as serial_to_json.py does. Packing turns each .json or .bjson file with an .ini file next to it, as unpacking leaves
+them, back into a .GladiusSave file in the same directory. Other json files, such as the manifest or reports from
+--report, are left alone.
+
+Progress is recorded in a manifest, a JSON file in the top directory, after every file. If the batch is interrupted,
+running it again skips every file that was already converted and hasn't changed since.
+"""
+
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import bulk_parser
+import json_stream
+import savegame_tools
+
+master_config_name = "Config.ini"
+manifest_name = "batch_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def find_inputs(root, extensions, skip_directory=None):
+    """
+    :param root: The directory to search.
+    :param extensions: The file extensions to look for, such as [".GladiusSave"]. Case is ignored.
+    :param skip_directory: The name of directories not to search, such as the unpacked directory.
+    :return: A sorted list of paths.
+    """
+    found = []
+    for directory, subdirectories, files in os.walk(root):
+        if skip_directory is not None and skip_directory in subdirectories:
+            subdirectories.remove(skip_directory)
+        found.extend(os.path.join(directory, file) for file in files
+                     if os.path.splitext(file)[1].lower() in [extension.lower() for extension in extensions])
+    return sorted(found)
+
+
+def unpack(save_path, unpack_dir_name, output_extension=".json"):
+    """
+    Converts a .GladiusSave file into a .json (or .bjson) and an .ini file.
+    :return: A list of the paths written.
+    """
+    directory, name = os.path.split(save_path)
+    directory = os.path.join(directory, unpack_dir_name)
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.splitext(name)[0]
+    json_output_path = os.path.join(directory, name + output_extension)
+    config_output_path = os.path.join(directory, name + ".ini")
+
+    header, mods, offset = savegame_tools.read_savegame_header(save_path)
+    sections = savegame_tools.iter_savegame(save_path, offset)
+    # Both files are written under temporary names and only moved into place once they're complete, the .ini file
+    # last, so that pack never picks up a save that failed partway
+    if output_extension == ".json":
+        with savegame_tools.replacing(json_output_path) as temporary_path, open(temporary_path, 'w') as file:
+            json_stream.dump_bulk(sections, file)
+    else:
+        savegame_tools.write_data(bulk_parser.zip_passes(bulk_parser.collect_passes(sections)), json_output_path)
+    with savegame_tools.replacing(config_output_path) as temporary_path:
+        savegame_tools.write_header_config(header, mods, temporary_path)
+    return [json_output_path, config_output_path]
+
+
+def pack(json_path, versions):
+    """
+    Converts a .json or .bjson file back into a .GladiusSave file. The header is read from the .ini file with the same
+    name if there is one, otherwise it's made up from the data as json_to_serial.py does.
+    :param versions: The GLADIUS section of the master config file.
+    :return: A list of the paths written.
+    """
+    config_path = os.path.splitext(json_path)[0] + ".ini"
+    save_output_path = os.path.splitext(json_path)[0] + ".GladiusSave"
+
+    data = savegame_tools.read_data(json_path)
+    if os.path.isfile(config_path):
+        header, mods = savegame_tools.read_header_config(config_path)
+    else:
+        header = savegame_tools.header_from_data(data, versions)
+        mods = data["world_params"][0]["mods"]
+    # Next to the user's own saves, so it mustn't be left half-written if anything goes wrong
+    with savegame_tools.replacing(save_output_path) as temporary_path:
+        savegame_tools.write_savegame(temporary_path, header, mods, savegame_tools.serialize(data))
+    return [save_output_path]
+
+
+def convert_one(path, direction, config_path, output_extension=".json"):
+    """
+    Converts a single file, in a worker process. Never raises: any error is reported in the result instead, so that
+    one corrupt save doesn't stop the batch.
+    :return: A manifest entry for the file.
+    """
+    start = time.perf_counter()
+    try:
+        config = savegame_tools.read_config(config_path)
+        if direction == "unpack":
+            outputs = unpack(path, config["GLADIUS"]["unpacked directory"], output_extension)
+        else:
+            outputs = pack(path, config["GLADIUS"])
+    except Exception as error:
+        return dict(status="failed",
+                    seconds=time.perf_counter() - start,
+                    error=f"{type(error).__name__}: {error}",
+                    traceback=traceback.format_exc())
+    return dict(status="done",
+                seconds=time.perf_counter() - start,
+                outputs={output: os.path.getsize(output) for output in outputs})
+
+
+def read_manifest(path):
+    if not os.path.isfile(path):
+        return dict(version=MANIFEST_VERSION, files={})
+    with open(path, 'r') as file:
+        manifest = json.load(file)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return dict(version=MANIFEST_VERSION, files={})
+    return manifest
+
+
+def write_manifest(manifest, path):
+    # Written to a temporary file first, so an interruption can't leave a half-written manifest behind
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(manifest, file, indent="    ")
+    os.replace(temporary_path, path)
+
+
+def is_done(entry, path, direction):
+    """
+    Whether a manifest entry shows that a file was already converted, and neither it nor its outputs have changed.
+    """
+    if entry is None or entry["status"] != "done" or entry["direction"] != direction:
+        return False
+    stat = os.stat(path)
+    if entry["input_size"] != stat.st_size or entry["input_mtime_ns"] != stat.st_mtime_ns:
+        return False
+    return all(os.path.isfile(output) and os.path.getsize(output) == size
+               for output, size in entry["outputs"].items())
+
+
+def run_batch(root, direction, config_path=master_config_name, manifest_path=None, workers=None, retry_failed=False,
+              output_extension=".json"):
+    """
+    Converts every file under a directory.
+    :param root: The directory to search.
+    :param direction: "unpack" to turn .GladiusSave files into .json files, or "pack" to do the reverse.
+    :param config_path: The master config file, read by each worker.
+    :param manifest_path: Where to keep the manifest. Defaults to batch_manifest.json in root.
+    :param workers: How many processes to use. Defaults to the number of cores.
+    :param retry_failed: Whether to try files that failed last time again. Otherwise only new or changed files are.
+    :param output_extension: ".json" or ".bjson", the format to unpack into.
+    :return: The manifest.
+    """
+    config = savegame_tools.read_config(config_path)
+    unpack_dir_name = config["GLADIUS"]["unpacked directory"]
+    if manifest_path is None:
+        manifest_path = os.path.join(root, manifest_name)
+    manifest = read_manifest(manifest_path)
+    entries = manifest["files"]
+
+    if direction == "unpack":
+        inputs = find_inputs(root, [".GladiusSave"], skip_directory=unpack_dir_name)
+    else:
+        # Only files that were unpacked, and so have an .ini file next to them, rather than every json file around,
+        # such as the manifest, save catalogs and reports
+        inputs = [path for path in find_inputs(root, [".json", ".bjson"])
+                  if os.path.isfile(os.path.splitext(path)[0] + ".ini")]
+
+    pending = []
+    for path in inputs:
+        entry = entries.get(path)
+        if is_done(entry, path, direction):
+            continue
+        if entry is not None and entry["status"] == "failed" and not retry_failed \
+                and entry["input_mtime_ns"] == os.stat(path).st_mtime_ns:
+            continue
+        pending.append(path)
+
+    print(f"{len(inputs)} files found, {len(pending)} to convert")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        # Stats are taken before converting, so that a file that changes while it's converted is done again next time
+        stats = {path: os.stat(path) for path in pending}
+        futures = {executor.submit(convert_one, path, direction, config_path, output_extension): path
+                   for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                entry = future.result()
+            except Exception as error:
+                # Only happens if the worker process itself dies
+                entry = dict(status="failed", seconds=None, error=f"{type(error).__name__}: {error}")
+            entry.update(direction=direction,
+                         input_size=stats[path].st_size,
+                         input_mtime_ns=stats[path].st_mtime_ns)
+            entries[path] = entry
+            write_manifest(manifest, manifest_path)
+            print(f"{entry['status']}: {os.path.relpath(path, root)}"
+                  + (f" ({entry['error']})" if entry["status"] == "failed" else ""))
+
+    failed = sum(1 for path in pending if entries[path]["status"] == "failed")
+    print(f"Converted {len(pending) - failed} files in {time.perf_counter() - start:.1f}s, {failed} failed")
+    return manifest
+
+
+if __name__ == "__main__":
+    master_config = savegame_tools.read_config(master_config_name)
+    parser = argparse.ArgumentParser(description="Converts every saved game under a directory, in parallel.")
+    parser.add_argument("direction", choices=["unpack", "pack"],
+                        help="unpack turns .GladiusSave files into .json files, pack does the reverse.")
+    parser.add_argument("directory", nargs="?", default=master_config["GLADIUS"]["saved games directory"],
+                        help="Defaults to the saved games directory in the master config file.")
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to the number of cores.")
+    parser.add_argument("--manifest", default=None, help=f"Defaults to {manifest_name} in the directory.")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Try files that failed last time again, even if they haven't changed.")
+    parser.add_argument("--bjson", action="store_true",
+                        help="Unpack into the compact binary format described in bjson.py rather than json.")
+    args = parser.parse_args()
+    run_batch(os.path.abspath(args.directory), args.direction, os.path.abspath(master_config_name),
+              args.manifest and os.path.abspath(args.manifest), args.workers, args.retry_failed,
+              ".bjson" if args.bjson else ".json")
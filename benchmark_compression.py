@@ -0,0 +1,69 @@
+"""
+Compares compressing the bulk data of a saved game with zlib.compress, as serial_to_savegame.py used to, and with
+parallel_compress.py, at every compression level: how long each takes, and how big the result is.
+
+By default the bulk data of a save made up with synthetic_save.py is used. A real .bin file can be given with --bin
+instead, which gives more realistic sizes, as the made-up data is more random than the real thing.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import zlib
+import parallel_compress
+import synthetic_save
+from benchmark_pipeline import fixture_sizes
+
+
+def best_time(function, repeats):
+    """
+    :return: (the fastest time in seconds out of repeats calls, what the function returned)
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks compressing the bulk data at every compression level.")
+    parser.add_argument("--bin", help="A .bin file to compress instead of a made-up save.")
+    parser.add_argument("--scale", type=int, default=50000, help="Roughly how many traits and notifications to make "
+                                                                 "up.")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(range(1, 10)))
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to the number of cores.")
+    parser.add_argument("--block-size", type=int, default=parallel_compress.DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--repeats", type=int, default=3, help="The fastest of this many runs is recorded.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.bin is None:
+        synthetic_save.use_synthetic_weapons()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fixture.bin")
+            synthetic_save.write_bin(synthetic_save.make_data(args.seed, **fixture_sizes(args.scale)), path)
+            with open(path, 'rb') as file:
+                data = file.read()
+    else:
+        with open(args.bin, 'rb') as file:
+            data = file.read()
+
+    print(f"{len(data) / 1e6:.1f} MB of bulk data, {args.workers or os.cpu_count()} threads, "
+          f"{args.block_size // 1024} KiB blocks")
+    print(f"{'level':>5}{'zlib s':>10}{'zlib MB':>10}{'parallel s':>12}{'parallel MB':>13}{'speedup':>9}{'size':>8}")
+    for level in args.levels:
+        serial_time, serial = best_time(lambda: zlib.compress(data, level), args.repeats)
+        parallel_time, parallel = best_time(
+            lambda: parallel_compress.compress(data, level, args.block_size, args.workers), args.repeats)
+        if zlib.decompress(parallel) != data:
+            raise AssertionError(f"Level {level} didn't decompress to the same data.")
+        print(f"{level:>5}{serial_time:>10.3f}{len(serial) / 1e6:>10.2f}{parallel_time:>12.3f}"
+              f"{len(parallel) / 1e6:>13.2f}{serial_time / parallel_time:>8.1f}x"
+              f"{len(parallel) / len(serial) - 1:>+8.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Times deleting half the units in a saved game with json_editor_tools.GladiusSave, along with all their actions,
+traits and weapons, one at a time and all at once with GladiusSave.delete_many. Both are compared with the linear
+lookups and list.remove calls GladiusSave used to make.
+
+By default a late-game-sized save is made up with just the parts that deleting units touches, so no saved games are
+needed. A real one can be given with --save instead.
+"""
+
+import argparse
+import copy
+import random
+import time
+import savegame_tools
+from json_editor_tools import GladiusSave
+
+
+class LinearGladiusSave(GladiusSave):
+    """
+    GladiusSave with the lookups and deletions it used to do: a scan of the section whenever an object isn't at the
+    position matching its id, list.remove to delete it, and recursion for everything that goes along with it.
+    """
+
+    def get(self, type_, id_):
+        section = self._data[type_]
+        if 0 <= id_ < len(section) and section[id_][0]["id"] == id_:
+            return section[id_]
+        for entry in section:
+            if entry[0]["id"] == id_:
+                return entry
+        raise KeyError(id_)
+
+    def remove(self, type_, id_):
+        entry = self.get(type_, id_)
+        self._data[type_].remove(entry)
+        return entry
+
+    def delete_action(self, action_id):
+        try:
+            action = self.remove("actions", action_id)
+        except KeyError:
+            return
+        for trait_id in action[1]["linked_traits"]:
+            self.delete_trait(trait_id)
+
+    def delete_trait(self, trait_id):
+        try:
+            trait = self.remove("traits", trait_id)
+        except KeyError:
+            return
+        self.delete_action(trait[2]["linked_action"])
+
+    def delete_weapon(self, weapon_id):
+        try:
+            weapon = self.remove("weapons", weapon_id)
+        except KeyError:
+            return
+        for trait in weapon[1]["traits"]:
+            self.delete_trait(trait["id"])
+
+    def delete_unit(self, unit_id, via_transport=False):
+        try:
+            unit = self.remove("units", unit_id)
+        except KeyError:
+            return
+        for action_id in unit[1]["actions"]:
+            self.delete_action(action_id)
+        for trait in unit[1]["traits"]:
+            self.delete_trait(trait["id"])
+        for weapon_id in unit[1]["weapons"]:
+            self.delete_weapon(weapon_id)
+        if unit[1]["transport"] != -1 and not via_transport:
+            try:
+                self.get("units", unit[1]["transport"])[1]["transported_units"].remove(unit_id)
+            except KeyError:
+                pass
+        for subunit_id in unit[1]["transported_units"]:
+            self.delete_unit(subunit_id, via_transport=True)
+
+
+def make_data(unit_count, rng):
+    """
+    Makes up the units, actions, traits and weapons of a saved game, with only the values GladiusSave looks at.
+    Every unit has a few actions, traits and weapons of its own, and some are in transports.
+    """
+    data = dict(units=[], actions=[], traits=[], weapons=[])
+
+    def new(type_, *later_passes):
+        id_ = len(data[type_])
+        data[type_].append([{"id": id_}, *later_passes])
+        return id_
+
+    def new_trait():
+        return new("traits", {}, {"linked_action": -1})
+
+    for unit_id in range(unit_count):
+        traits = [{"name": "Trait", "id": new_trait()} for _ in range(rng.randint(2, 6))]
+        actions = [new("actions", {"linked_traits": [new_trait()]}) for _ in range(rng.randint(1, 4))]
+        weapons = [new("weapons", {"traits": [{"name": "Trait", "id": new_trait()}]}) for _ in range(rng.randint(1, 3))]
+        data["units"].append([{"id": unit_id}, dict(actions=actions, traits=traits, weapons=weapons, transport=-1,
+                                                    transported_units=[], owner=rng.randrange(8))])
+
+    # Put a few units in transports
+    for transport in rng.sample(data["units"], unit_count // 50):
+        passenger = rng.choice(data["units"])
+        if passenger is not transport and passenger[1]["transport"] == -1 and not passenger[1]["transported_units"]:
+            passenger[1]["transport"] = transport[0]["id"]
+            transport[1]["transported_units"].append(passenger[0]["id"])
+    return data
+
+
+def time_deletions(save_class, data, unit_ids, batch=False):
+    """
+    :param batch: Whether to delete all the units with one call to delete_many, rather than one at a time.
+    :return: (seconds taken, the data afterwards)
+    """
+    save = save_class(copy.deepcopy(data))
+    start = time.perf_counter()
+    if batch:
+        save.delete_many(("units", unit_id) for unit_id in unit_ids)
+    else:
+        for unit_id in unit_ids:
+            save.delete_unit(unit_id)
+    result = save.data
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks deleting half the units in a saved game.")
+    parser.add_argument("--save", help="A .json or .bjson file to use instead of a made-up save.")
+    parser.add_argument("--units", type=int, default=2000, help="How many units to make up.")
+    parser.add_argument("--fraction", type=float, default=0.5, help="The fraction of the units to delete.")
+    parser.add_argument("--skip-linear", action="store_true", help="Don't time the old linear version.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data = savegame_tools.read_data(args.save) if args.save else make_data(args.units, rng)
+    unit_ids = [unit[0]["id"] for unit in data["units"]]
+    unit_ids = rng.sample(unit_ids, int(len(unit_ids) * args.fraction))
+    print(f"Deleting {len(unit_ids)} of {len(data['units'])} units")
+
+    indexed_time, indexed_result = time_deletions(GladiusSave, data, unit_ids)
+    print(f"{'indexed':<10}{indexed_time:>10.3f}s")
+    batch_time, batch_result = time_deletions(GladiusSave, data, unit_ids, batch=True)
+    if batch_result != indexed_result:
+        raise AssertionError("Deleting all at once and one at a time give different results.")
+    print(f"{'batch':<10}{batch_time:>10.3f}s")
+    if not args.skip_linear:
+        linear_time, linear_result = time_deletions(LinearGladiusSave, data, unit_ids)
+        if linear_result != indexed_result:
+            raise AssertionError("Indexed and linear deletions give different results.")
+        print(f"{'linear':<10}{linear_time:>10.3f}s{linear_time / indexed_time:>9.1f}x slower")
+
+
+if __name__ == "__main__":
+    main()
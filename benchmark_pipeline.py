@@ -0,0 +1,221 @@
+"""
+Times every stage of converting a saved game, and a few GladiusSave edits, and measures how much memory each one
+needs at its peak:
+    decompress      reading the header and decompressing the bulk data, as savegame_to_serial.py does
+    parse           bulk_parser.parse_bulk over the .bin file
+    json_dump       writing the zipped data to a .json file with BytesJSONEncoder
+    json_load       reading it back with bytes_object_hook
+    bjson_dump      writing the zipped data to a .bjson file instead
+    bjson_load      reading it back
+    serialize       turning it back into the bulk data with BinWriter
+    compress        writing the .GladiusSave file, as serial_to_savegame.py does
+    get             GladiusSave.get for every unit
+    delete_units    deleting half the units, along with their actions, traits and weapons
+    flood_terrain   GladiusSave.flood_terrain
+    reveal_map      GladiusSave.reveal_map for every player
+    splice          saving a GladiusSave read from a .bin file as a .bin file again, after revealing the map for one
+                    player, which only writes that section again
+
+The results can be saved as JSON with --output and compared with an earlier run with --baseline. Any stage that got
+slower, or needed more memory, by more than --threshold is reported, and the exit status is 1.
+
+By default a save is made up with synthetic_save.py, so no saved games or game files are needed. A real .GladiusSave
+file can be given with --save instead.
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+import binarizer as b
+import bulk_parser
+import savegame_tools
+import synthetic_save
+from json_editor_tools import GladiusSave
+
+RESULTS_VERSION = 1
+
+
+def fixture_sizes(scale):
+    """
+    :return: The sizes to give synthetic_save.make_data for a save with about scale units, traits and notifications.
+    """
+    side = math.isqrt(2 * scale) + 1
+    return dict(width=side, height=side, units=scale // 4, features=scale // 10, cities=scale // 500 + 1,
+                notifications=scale, quests=scale // 500 + 1)
+
+
+def write_fixture(scale, seed, directory):
+    """
+    Makes up a save and writes it as a .GladiusSave file.
+    :return: Its path.
+    """
+    path = os.path.join(directory, "fixture.GladiusSave")
+    synthetic_save.write_savegame(synthetic_save.make_data(seed, **fixture_sizes(scale)), path)
+    return path
+
+
+# ==== Stages ==== #
+
+def decompress(save_path):
+    with open(save_path, 'rb') as file:
+        data = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+    header, mods = savegame_tools.read_header(data)
+    bulk = zlib.decompress(data.get(len(data) - data.tell()))
+    data.close()
+    return header, mods, bulk
+
+
+def parse(bin_path):
+    with open(bin_path, 'rb') as file:
+        binary = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+    passes = bulk_parser.parse_bulk(binary)
+    binary.close()
+    return bulk_parser.zip_passes(passes)
+
+
+def make_stages(save_path, directory):
+    """
+    Sets up the files each stage needs.
+    :return: A list of (name, setup, run). setup() is called before each timed run(state) to make its state, and isn't
+    timed itself.
+    """
+    header, mods, bulk = decompress(save_path)
+    bin_path = os.path.join(directory, "stage.bin")
+    with open(bin_path, 'wb') as file:
+        file.write(bulk)
+    data = parse(bin_path)
+    json_path = os.path.join(directory, "stage.json")
+    savegame_tools.write_data(data, json_path)
+    bjson_path = os.path.join(directory, "stage.bjson")
+    savegame_tools.write_data(data, bjson_path)
+    output_path = os.path.join(directory, "stage.GladiusSave")
+    spliced_path = os.path.join(directory, "spliced.bin")
+
+    def editable():
+        return GladiusSave(copy.deepcopy(data))
+
+    unit_ids = [entry[0]["id"] for entry in data["units"]]
+    half = unit_ids[::2]
+    player_ids = [entry[0]["id"] for entry in data["players"]]
+    nothing = lambda: None
+
+    def revealed():
+        save = GladiusSave.load(bin_path)
+        save.reveal_map(player_ids[0])
+        return save
+
+    return [
+        ("decompress", nothing, lambda state: decompress(save_path)),
+        ("parse", nothing, lambda state: parse(bin_path)),
+        ("json_dump", nothing, lambda state: savegame_tools.write_data(data, json_path)),
+        ("json_load", nothing, lambda state: savegame_tools.read_data(json_path)),
+        ("bjson_dump", nothing, lambda state: savegame_tools.write_data(data, bjson_path)),
+        ("bjson_load", nothing, lambda state: savegame_tools.read_data(bjson_path)),
+        ("serialize", nothing, lambda state: savegame_tools.serialize(data)),
+        ("compress", lambda: savegame_tools.serialize(data),
+         lambda bulk_data: savegame_tools.write_savegame(output_path, header, mods, bulk_data)),
+        ("get", editable, lambda save: [save.get("units", id_) for id_ in unit_ids]),
+        ("delete_units", editable, lambda save: save.delete_many([("units", id_) for id_ in half])),
+        ("flood_terrain", editable, lambda save: save.flood_terrain("Grassland", 1.0)),
+        ("reveal_map", editable, lambda save: [save.reveal_map(id_) for id_ in player_ids]),
+        ("splice", revealed, lambda save: save.save(spliced_path)),
+    ]
+
+
+def measure(setup, run, repeats):
+    """
+    :return: dict of the fastest time in seconds out of repeats runs, and the peak memory allocated by one more run
+    over what setup left allocated. The memory is measured separately because tracemalloc slows everything down.
+    """
+    times = []
+    for _ in range(repeats):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+        del state
+
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(seconds=min(times), peak_bytes=peak)
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: A list of (stage, metric, baseline value, new value) for every stage that's worse than in the baseline
+    by more than the threshold, a fraction.
+    """
+    regressions = []
+    for name, stage in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if stage[metric] > old[metric] * (1 + threshold):
+                regressions.append((name, metric, old[metric], stage[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times every stage of converting a saved game.")
+    parser.add_argument("--save", help="A .GladiusSave file to use instead of a made-up save.")
+    parser.add_argument("--scale", type=int, default=5000, help="Roughly how many traits and notifications to make up.")
+    parser.add_argument("--repeats", type=int, default=3, help="The fastest of this many runs is recorded.")
+    parser.add_argument("--stages", nargs="+", help="Only run these stages.")
+    parser.add_argument("--output", help="Save the results to this .json file.")
+    parser.add_argument("--baseline", help="Compare with the results saved from an earlier run.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="How much worse than the baseline a stage can be, as a fraction, before it counts as a "
+                             "regression.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.save is None:
+            synthetic_save.use_synthetic_weapons()
+            save_path = write_fixture(args.scale, args.seed, directory)
+        else:
+            save_path = os.path.abspath(args.save)
+        results = dict(version=RESULTS_VERSION,
+                       save=args.save,
+                       scale=None if args.save else args.scale,
+                       size=os.path.getsize(save_path),
+                       python=sys.version.split()[0],
+                       platform=platform.platform(),
+                       stages={})
+
+        print(f"{'stage':<16}{'seconds':>10}{'peak MB':>10}")
+        for name, setup, run in make_stages(save_path, directory):
+            if args.stages and name not in args.stages:
+                continue
+            stage = results["stages"][name] = measure(setup, run, args.repeats)
+            print(f"{name:<16}{stage['seconds']:>10.3f}{stage['peak_bytes'] / 1e6:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent="    ")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION: {name} {metric} went from {old:.6g} to {new:.6g} ({new / old - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
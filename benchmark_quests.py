@@ -0,0 +1,82 @@
+"""
+Times reading the first pass of the quests section with quest_scanner.read_quests, against the regular expression
+search it replaced, for made-up saves with more and more active quests.
+
+Each save has the quests, followed by a few notifications and then a block of filler standing in for the rest of the
+bulk data. The time per kilobyte of quest data should stay about the same as the number of quests grows, and shouldn't
+depend on the size of the filler.
+"""
+
+import argparse
+import mmap
+import random
+import struct
+import tempfile
+import time
+import binarizer as b
+import quest_scanner
+from bulk_reader_tools import quest_structure, notification_structures
+
+
+def make_section(quest_count, payload_size, filler_size, rng):
+    """
+    :return: (the bytes of a quests section and what follows it, the total size of the quests)
+    """
+    parts = [struct.pack("<I", quest_count)]
+    for n in range(quest_count):
+        # Letters and zeroes, like the strings and small numbers the real data seems to be made of
+        payload = bytes(rng.choice(b"\x00\x00\x00\x01abcdefgh") for _ in range(rng.randrange(payload_size * 2)))
+        parts.append(f"Factions/Quest{n}\x00".encode() + struct.pack("<II", n, rng.randrange(5)) + payload)
+    quests_size = sum(map(len, parts))
+
+    notification = notification_structures["QuestAdded"]
+    parts.append(struct.pack("<I", 4))
+    for n in range(4):
+        parts.append(b"QuestAdded\x00" + struct.pack("<II", n, 0) + bytes(sum(notification[key].until for key in
+                                                                              ("bin1", "bin2"))))
+    parts.append(bytes(filler_size))
+    return b"".join(parts), quests_size
+
+
+def time_read(data, read):
+    with tempfile.TemporaryFile() as file:
+        file.write(data)
+        file.flush()
+        binary = b.BinReader(file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = time.perf_counter()
+        quests = read(binary)
+        seconds = time.perf_counter() - start
+        binary.close()
+    return seconds, quests
+
+
+def read_with_regex(binary):
+    # How the quests used to be read
+    return binary.fpop_compiled([quest_structure])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks reading the quests section.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 200, 400, 800, 1600],
+                        help="The numbers of quests to try.")
+    parser.add_argument("--payload", type=int, default=256, help="The average size of each quest's data.")
+    parser.add_argument("--filler", type=int, default=1 << 24, help="How much data comes after the quests.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'quests':>8}{'KB':>10}{'scanner':>12}{'per KB':>12}{'regex':>12}")
+    for count in args.counts:
+        data, quests_size = make_section(count, args.payload, args.filler, rng)
+        scanner_time, scanned = time_read(data, quest_scanner.read_quests)
+        regex_time, searched = time_read(data, read_with_regex)
+        if len(scanned) != count:
+            raise AssertionError(f"The scanner found {len(scanned)} quests rather than {count}.")
+        agreement = "" if scanned == searched else "  (the regex split them differently)"
+        kilobytes = quests_size / 1024
+        print(f"{count:>8}{kilobytes:>10.0f}{scanner_time:>11.4f}s{scanner_time / kilobytes * 1e6:>10.1f}us"
+              f"{regex_time:>11.4f}s{agreement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the speed of BinReader.fpop_structure and BinWriter.write_structure with the compiled decoders and encoders
+from binarizer.compile_decoder and binarizer.compile_encoder, and checks that both give the same output.
+
+Records are generated at random from the structures in bulk_reader_tools, so no saved games are needed.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import binarizer as b
+from synthetic_save import sample_value
+from bulk_reader_tools import *
+
+# Structures to benchmark, and how many records of each to generate per 1000 records requested
+benchmarked_structures = dict(
+    climates=(climate_structure, 1000),
+    actions=(action_structure, 1000),
+    actions2=(action2_normal_structure, 1000),
+    traits=(trait_structure, 1000),
+    traits2=(trait2_structure, 1000),
+    players=(player_structure, 10),
+    players2=(player2_structure, 10),
+    tiles=(tile_structure, 1000),
+    tiles2=(tile2_structure, 1000),
+    tiles4=(tile4_structure, 1000),
+    units=(unit_structure, 100),
+    units2=(unit2_structure, 100),
+    orders=(order_structure, 100),
+)
+
+
+def time_decoding(path, structure, count, decode):
+    with open(path, 'rb') as file:
+        binary = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+    start = time.perf_counter()
+    output = [decode(binary, structure) for _ in range(count)]
+    elapsed = time.perf_counter() - start
+    binary.close()
+    return output, elapsed
+
+
+def time_encoding(path, structure, records, encode):
+    with open(path, 'wb', buffering=0) as raw:
+        # noinspection PyTypeChecker
+        binary = b.BinWriter(raw)
+        start = time.perf_counter()
+        for record in records:
+            encode(binary, record, structure)
+        binary.close()
+        elapsed = time.perf_counter() - start
+    with open(path, 'rb') as file:
+        return file.read(), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks compiled structure decoders and encoders against "
+                                                 "fpop_structure and write_structure.")
+    parser.add_argument("--records", type=int, default=10000, help="Records per structure, before scaling.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'structure':<12}{'records':>10}{'':>4}{'interpreted':>14}{'compiled':>14}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (structure, per_thousand) in benchmarked_structures.items():
+            count = max(1, args.records * per_thousand // 1000)
+            records = [sample_value(structure, rng) for _ in range(count)]
+            path = os.path.join(directory, name + ".bin")
+
+            compiled_bytes, compiled_time = time_encoding(path, structure, records, b.BinWriter.write_compiled)
+            interpreted_bytes, interpreted_time = time_encoding(path, structure, records,
+                                                                b.BinWriter.write_structure)
+            if interpreted_bytes != compiled_bytes:
+                raise AssertionError(f"Compiled encoder for {name} does not match write_structure.")
+            print(f"{name:<12}{count:>10}{'out':>4}{interpreted_time:>13.3f}s{compiled_time:>13.3f}s"
+                  f"{interpreted_time / compiled_time:>9.1f}x")
+
+            interpreted, interpreted_time = time_decoding(path, structure, count, b.BinReader.fpop_structure)
+            compiled, compiled_time = time_decoding(path, structure, count, b.BinReader.fpop_compiled)
+            if interpreted != compiled or interpreted != records:
+                raise AssertionError(f"Compiled decoder for {name} does not match fpop_structure.")
+            print(f"{'':<12}{'':>10}{'in':>4}{interpreted_time:>13.3f}s{compiled_time:>13.3f}s"
+                  f"{interpreted_time / compiled_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
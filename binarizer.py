@@ -8,6 +8,8 @@ import os
 import re
 import json
 import io
+import functools
+import weakref
 
 
 def pretty_hex(b):
@@ -38,6 +40,7 @@ class BytesJSONEncoder(json.JSONEncoder):
     object for easy decoding.
     """
     def default(self, o):
+        # Also takes BytesViews
         return {"bytes": pretty_hex(o)}
 
 
@@ -116,7 +119,137 @@ def format_output(output, form):
                         "is passed as a pattern to struct.unpack.")
 
 
+class _Backing(object):
+    """
+    The data that a BinReader's BytesViews refer to. While the reader is open this is a memoryview of the memory map
+    itself; when it's closed, it's replaced with a copy so that the views stay valid, if there are any.
+    """
+    __slots__ = ("data", "views")
+
+    def __init__(self, data):
+        self.data = data
+        # Every BytesView of the data that's still around
+        self.views = weakref.WeakSet()
+
+
+class BytesView(object):
+    """
+    An opaque field held as a reference into the data it was read from, rather than copied out as bytes. See
+    BinReader.enable_views.
+
+    Compares equal to the bytes it stands for, and can be passed to bytes() or hex()ed like them. ByteAssembler copies
+    it straight from the original data, and BytesJSONEncoder formats it with pretty_hex. Anything else that needs real
+    bytes should call bytes() on it. Pickling it pickles the bytes.
+    """
+    __slots__ = ("_backing", "_start", "_end", "__weakref__")
+
+    def __init__(self, backing, start, end):
+        self._backing = backing
+        self._start = start
+        self._end = end
+        backing.views.add(self)
+
+    def memory(self):
+        """
+        :return: A memoryview of the data, without copying it. Only valid until the BinReader is closed.
+        """
+        return self._backing.data[self._start:self._end]
+
+    def __bytes__(self):
+        return self._backing.data[self._start:self._end].tobytes()
+
+    def hex(self, *args):
+        return self.memory().hex(*args)
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __getitem__(self, index):
+        return bytes(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, BytesView):
+            other = other.memory()
+        elif not isinstance(other, (bytes, bytearray, memoryview)):
+            return NotImplemented
+        return self.memory() == other
+
+    def __hash__(self):
+        return hash(bytes(self))
+
+    def __reduce__(self):
+        return bytes, (bytes(self),)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({bytes(self)!r})"
+
+
+def materialize(o):
+    """
+    For use as the default of bjson.dump and the like: turns a BytesView into bytes.
+    """
+    if isinstance(o, BytesView):
+        return bytes(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not a BytesView")
+
+
 class BinReader(mmap.mmap):
+    # Opaque fields of at least this many bytes are read as BytesViews. 0 means never. See enable_views.
+    views = 0
+
+    def enable_views(self, min_size=64):
+        """
+        From now on, reads opaque fields (DataFormats with no from_bytes) of at least min_size bytes as BytesViews of
+        the memory map instead of copying them out, by fpop_compiled and read_opaque. A view takes about as much memory
+        as a short bytes object and is slower to make, so it's only worth it for big fields. With the default, that's
+        just the quests' blocks of data.
+
+        If any views are still around when the reader is closed, the whole of the data is copied into memory for them
+        to refer to. To avoid that, close the reader only once they've been written or thrown away. Memoryviews from
+        BytesView.memory() aren't moved over to the copy, so if any of those are still around, the memory map can't
+        be closed until they're released; see close.
+        """
+        if "_backing" not in self.__dict__:
+            self._backing = _Backing(memoryview(self))
+        self.views = min_size
+
+    def close(self):
+        """
+        Closes the memory map. If something still has a memoryview of it, such as one from BytesView.memory(), it can't
+        be closed yet, and is instead closed when it's garbage collected after they've all been released.
+        """
+        backing = self.__dict__.pop("_backing", None)
+        try:
+            if backing is not None:
+                memory = backing.data
+                if len(backing.views):
+                    backing.data = memoryview(memory.tobytes())
+                memory.release()
+            mmap.mmap.close(self)
+        except BufferError:
+            pass
+
+    def __exit__(self, *args):
+        self.close()
+
+    def view(self, start, end):
+        """
+        :return: A BytesView of self[start:end]. enable_views must have been called.
+        """
+        if end > len(self):
+            raise EOFError("End of memory-mapped section reached.")
+        return BytesView(self._backing, start, end)
+
+    def read_opaque(self, n):
+        """
+        Reads n bytes as a BytesView, if views are enabled and n is big enough, and otherwise as bytes.
+        """
+        if self.views and n >= self.views:
+            start = self.tell()
+            to_return = self.view(start, start + n)
+            self.seek(n, os.SEEK_CUR)
+            return to_return
+        return self.read(n)
 
     def read(self, n=None):
         to_return = mmap.mmap.read(self, n)
@@ -154,6 +287,14 @@ class BinReader(mmap.mmap):
         else:
             return self.read(match.start() - match.pos)
 
+    def peek(self, n):
+        """
+        :return: Up to n bytes from the current position onwards, without advancing the pointer. Fewer are returned
+        if the data ends first.
+        """
+        position = self.tell()
+        return self[position:position + n]
+
     def fpop(self, until, form=None, allow_zero_length=True, inclusive=False):
         """
         Get a value of the specified type from the current pointer position onwards, advancing the pointer in the
@@ -253,8 +394,216 @@ class BinReader(mmap.mmap):
             # Anything else is probably an iterable.
             return [self.fpop_structure(substructure) for substructure in structure]
 
+    def fpop_compiled(self, structure):
+        """
+        Does exactly what fpop_structure does, but using a decoder compiled from the structure by compile_decoder.
+        Much faster when the same structure is read many times.
+        """
+        return compile_decoder(structure, self.views)(self)
+
+
+class StreamReader(object):
+    """
+    Offers the same reading interface as BinReader, but for data that arrives a chunk at a time, such as the output of
+    zlib.decompressobj. Only a sliding window of the data is kept in memory: everything before the current position
+    may be discarded, so seeking backwards is only possible within the part of the data that hasn't been dropped yet.
+    """
+    # Consumed data is only discarded once there's at least this much of it, so that it isn't shuffled around on every
+    # read.
+    discard_threshold = 1 << 20
+    # The data doesn't stay around to be referred to, so opaque fields are always copied
+    views = 0
+
+    def __init__(self, chunks):
+        """
+        :param chunks: An iterable of bytes-like objects, which together make up the data.
+        """
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self._start = 0  # Offset of the start of the buffer within the data
+        self._pos = 0  # Current position within the buffer
+        self._eof = False
+
+    # These only need read, read_until, read_until_re, tell and seek, so work the same as they do for BinReader.
+    fpop = BinReader.fpop
+    get = BinReader.get
+    fpop_structure = BinReader.fpop_structure
+    fpop_compiled = BinReader.fpop_compiled
+
+    def _discard(self):
+        if self._pos >= self.discard_threshold:
+            del self._buffer[:self._pos]
+            self._start += self._pos
+            self._pos = 0
+
+    def _fill(self):
+        """
+        Adds the next chunk to the buffer.
+        :return: False if there's no more data.
+        """
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer += chunk
+                return True
+        self._eof = True
+        return False
+
+    def tell(self):
+        return self._start + self._pos
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self.tell()
+        elif whence != os.SEEK_SET:
+            raise ValueError("StreamReader can only seek relative to the start or the current position.")
+        if pos < self._start:
+            raise ValueError(f"Position {pos} has already been discarded from the stream.")
+        while pos > self._start + len(self._buffer) and self._fill():
+            pass
+        self._pos = pos - self._start
+
+    def read(self, n=None):
+        self._discard()
+        if n is None or n < 0:
+            while self._fill():
+                pass
+            n = len(self._buffer) - self._pos
+        while len(self._buffer) - self._pos < n:
+            if not self._fill():
+                raise EOFError("End of stream reached.")
+        to_return = bytes(self._buffer[self._pos:self._pos + n])
+        self._pos += n
+        return to_return
+
+    read_opaque = read
+
+    def read_until(self, sub):
+        """
+        Read everything up until the chosen subunit of bytes is found, (not including the subunit itself), then
+        advances the pointer to *after* the subunit.
+        :param sub: Subunit to read until.
+        :return: bytes
+        """
+        self._discard()
+        search_from = self._pos
+        while True:
+            loc = self._buffer.find(sub, search_from)
+            if loc != -1:
+                front = self.read(loc - self._pos)
+                self._pos += len(sub)
+                return front
+            # The separator might be split between this chunk and the next
+            search_from = max(self._pos, len(self._buffer) - len(sub) + 1)
+            if not self._fill():
+                print(f"WARNING: desired bytes unit {sub.__repr__()} not found, returning entire rest of data.")
+                return self.read()
+
+    def read_until_re(self, pattern, inclusive=False):
+        self._discard()
+        while True:
+            match = pattern.search(self._buffer, self._pos)
+            # A match that reaches the end of the buffer might have matched differently with more data
+            if match is not None and (match.end() < len(self._buffer) or self._eof):
+                break
+            if not self._fill():
+                match = pattern.search(self._buffer, self._pos)
+                break
+        if match is None:
+            raise RuntimeError(f"Could not find requested pattern {pattern.pattern} in data.")
+        elif inclusive:
+            return self.read(match.end() - self._pos)
+        else:
+            return self.read(match.start() - self._pos)
+
+    def peek(self, n):
+        self._discard()
+        while len(self._buffer) - self._pos < n and self._fill():
+            pass
+        return bytes(self._buffer[self._pos:self._pos + n])
+
+
+class ByteAssembler(object):
+    """
+    A growable bytearray that compiled encoders pack values into. The buffer grows by doubling, so reserving space is
+    cheap, and it is only ever extended in place so that references to it stay valid.
+    """
+    def __init__(self, initial_size=1 << 16):
+        self.buffer = bytearray(initial_size)
+        self.pos = 0
+
+    def reserve(self, size):
+        """
+        Claims the next size bytes of the buffer, growing it if necessary.
+        :return: The position of the first claimed byte.
+        """
+        start = self.pos
+        self.pos = end = start + size
+        if end > len(self.buffer):
+            self.buffer.extend(bytes(max(end, 2 * len(self.buffer)) - len(self.buffer)))
+        return start
+
+    def append(self, data):
+        if type(data) is BytesView:
+            data = data.memory()
+        start = self.reserve(len(data))
+        self.buffer[start:self.pos] = data
+
 
 class BinWriter(io.BufferedWriter):
+    """
+    Everything written is first assembled in memory, and handed on to the underlying file in chunks of at least
+    chunk_size bytes.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, raw, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        super().__init__(raw, buffer_size)
+        self.assembler = ByteAssembler()
+
+    def write(self, data):
+        self.assembler.append(data)
+        if self.assembler.pos >= self.chunk_size:
+            self.drain()
+        return len(data)
+
+    def drain(self):
+        """
+        Hands everything assembled so far on to the underlying file.
+        """
+        if self.assembler.pos:
+            with memoryview(self.assembler.buffer) as view:
+                io.BufferedWriter.write(self, view[:self.assembler.pos])
+            self.assembler.pos = 0
+
+    def flush(self):
+        self.drain()
+        super().flush()
+
+    def tell(self):
+        return super().tell() + self.assembler.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.drain()
+        return super().seek(offset, whence)
+
+    def write_view(self, data):
+        """
+        Writes a large bytes-like object, such as a memoryview of another file, straight to the underlying file
+        rather than copying it into the assembler first.
+        """
+        self.drain()
+        return io.BufferedWriter.write(self, data)
+
+    def write_compiled(self, data, structure):
+        """
+        Does exactly what write_structure does, but using an encoder compiled from the structure by compile_encoder.
+        Much faster when the same structure is written many times.
+        """
+        compile_encoder(structure)(self.assembler, data)
+        if self.assembler.pos >= self.chunk_size:
+            self.drain()
 
     def translate(self, data, translator):
         if callable(translator):
@@ -308,3 +657,451 @@ class BinWriter(io.BufferedWriter):
 
         else:
             raise TypeError(f"write_structure does not know how to handle {type(spec_structure)}")
+
+
+# Compiled structure decoders
+# These do the same job as BinReader.fpop_structure, but work out how to read each structure once rather than on every
+# call.
+
+# struct format codes that unpack to exactly one value
+_SINGLE_VALUE_CODES = "cbB?hHiIlLqQfd"
+
+# Compiled decoders, keyed by the id of the structure they were compiled from and the reader's views setting. The
+# structure itself is kept alongside the decoder so that its id can't be reused by another object.
+_decoders = {}
+
+
+def _viewed(structure, views):
+    """
+    Whether a structure is an opaque field that's read as a BytesView when BinReader.views is views.
+    """
+    return views and isinstance(structure, DataFormat) and structure.from_bytes is None \
+        and isinstance(structure.until, int) and structure.until >= views
+
+
+def _has_viewed(structure, views):
+    if not views:
+        return False
+    elif isinstance(structure, dict):
+        return any(_viewed(value, views) for value in structure.values())
+    elif isinstance(structure, tuple):
+        return any(_viewed(value, views) for value in structure)
+    return _viewed(structure, views)
+
+
+def _fixed_field(structure):
+    """
+    Works out whether a structure is a DataFormat that always occupies the same number of bytes and can be unpacked by
+    the struct module.
+    :return: A (format code, converter) tuple, or None if the structure isn't fixed-width. converter is a function to
+    call on the unpacked value, or None if the value can be used as-is.
+    """
+    if not isinstance(structure, DataFormat) or not isinstance(structure.until, int):
+        return None
+    form = structure.from_bytes
+    if form is None:
+        return f"{structure.until}s", None
+    elif isinstance(form, str):
+        if len(form) == 1 and form in _SINGLE_VALUE_CODES \
+                and struct.calcsize(form) == struct.calcsize("=" + form) == structure.until:
+            return form, None
+        else:
+            return None
+    elif callable(form):
+        return f"{structure.until}s", form
+    else:
+        return None
+
+
+def _fixed_layout(structure):
+    """
+    Works out whether every value in a structure is fixed-width, so that the whole thing can be unpacked with a single
+    struct.Struct.
+    :return: A (struct.Struct, converters) tuple, or None. converters is a list of (index, function) pairs to apply to
+    the unpacked values.
+    """
+    fields = fixed_width_fields(structure)
+    if fields is None:
+        return None
+    codes = "".join(code for code, _ in fields)
+    converters = [(index, converter) for index, (_, converter) in enumerate(fields) if converter is not None]
+    return struct.Struct("=" + codes), converters
+
+
+def fixed_width_fields(structure):
+    """
+    Works out whether every value in a DataFormat, dict or tuple structure is fixed-width.
+    :return: A list of (struct format code, converter) tuples, one for each value, or None if any value isn't
+    fixed-width. converter is a function to call on the unpacked value, or None if the value can be used as-is.
+    """
+    if isinstance(structure, DataFormat):
+        fields = [structure]
+    elif isinstance(structure, (dict, tuple)):
+        fields = structure.values() if isinstance(structure, dict) else structure
+    else:
+        return None
+    fixed = [_fixed_field(field) for field in fields]
+    if None in fixed:
+        return None
+    return fixed
+
+
+# Lists of the same few lengths come up over and over, but there's no limit to how many different lengths there can be
+# in a long-running process, so only the most recent are kept
+@functools.lru_cache(maxsize=1024)
+def _repeated_struct(code, count):
+    if len(code) == 1:
+        return struct.Struct(f"={count}{code}")
+    else:
+        # Codes like "4s" can't be given a repeat count
+        return struct.Struct("=" + code * count)
+
+
+def _convert(values, converters):
+    values = list(values)
+    for index, converter in converters:
+        values[index] = converter(values[index])
+    return values
+
+
+def _compile_format_decoder(structure, views=0):
+    if _viewed(structure, views):
+        size = structure.until
+        return lambda reader: reader.read_opaque(size)
+    fixed = _fixed_field(structure)
+    if fixed is not None:
+        compiled = struct.Struct("=" + fixed[0])
+        unpack = compiled.unpack
+        size = compiled.size
+        converter = fixed[1]
+        if converter is None:
+            return lambda reader: unpack(reader.read(size))[0]
+        else:
+            return lambda reader: converter(unpack(reader.read(size))[0])
+    elif isinstance(structure.until, bytes) and structure.allow_zero_length:
+        separator = structure.until
+        form = structure.from_bytes
+        if form is None:
+            return lambda reader: reader.read_until(separator)
+        elif callable(form):
+            return lambda reader: form(reader.read_until(separator))
+    # Anything unusual goes the slow way
+    return lambda reader: reader.fpop(*structure)
+
+
+def _compile_sequence_steps(substructures, views=0):
+    """
+    Turns a sequence of structures into a list of steps, each of which takes a reader and a list and extends the list
+    with one or more decoded values. Consecutive fixed-width DataFormats are collapsed into a single step, apart from
+    any that are read as BytesViews.
+    """
+    steps = []
+    run = []
+
+    def close_run():
+        if not run:
+            return
+        compiled, converters = _fixed_layout(tuple(run))
+        unpack = compiled.unpack
+        size = compiled.size
+        if converters:
+            steps.append(lambda reader, values: values.extend(_convert(unpack(reader.read(size)), converters)))
+        else:
+            steps.append(lambda reader, values: values.extend(unpack(reader.read(size))))
+        run.clear()
+
+    for substructure in substructures:
+        if _fixed_field(substructure) is not None and not _viewed(substructure, views):
+            run.append(substructure)
+        else:
+            close_run()
+            decoder = compile_decoder(substructure, views)
+            steps.append(lambda reader, values, decoder=decoder: values.append(decoder(reader)))
+    close_run()
+    return steps
+
+
+def _compile_record_decoder(substructures, build, views=0):
+    """
+    :param substructures: The structures making up each field of the record, in order.
+    :param build: Function that turns the list of decoded values into the final record.
+    :param views: See BinReader.views.
+    """
+    layout = None if _has_viewed(tuple(substructures), views) else _fixed_layout(tuple(substructures))
+    if layout is not None and not layout[1]:
+        unpack = layout[0].unpack
+        size = layout[0].size
+        return lambda reader: build(unpack(reader.read(size)))
+
+    steps = _compile_sequence_steps(substructures, views)
+
+    def decode(reader):
+        values = []
+        for step in steps:
+            step(reader, values)
+        return build(values)
+    return decode
+
+
+def _compile_list_decoder(structure, views=0):
+    substructure = structure[0]
+    if len(structure) == 1:
+        # Shorthand for [substructure, UINT]
+        count_decoder = compile_decoder(UINT)
+    elif isinstance(structure[1], int):
+        # A fixed-length list
+        length = structure[1]
+        count_decoder = lambda reader: length
+    elif isinstance(structure[1], DataFormat):
+        # A list prefixed with the length of the list
+        count_decoder = compile_decoder(structure[1])
+    else:
+        raise TypeError(f"Second element in list must by int or DataFormat, not {type(structure[1])}")
+
+    fixed = None if _viewed(substructure, views) else _fixed_field(substructure)
+    if fixed is not None and struct.calcsize("=" + fixed[0]) > 0:
+        # A list of plain values can be unpacked in one go
+        code, converter = fixed
+        size = struct.calcsize("=" + code)
+
+        def decode(reader):
+            count = count_decoder(reader)
+            values = _repeated_struct(code, count).unpack(reader.read(count * size))
+            if converter is None:
+                return list(values)
+            else:
+                return [converter(value) for value in values]
+        return decode
+
+    layout = None if _has_viewed(substructure, views) else _fixed_layout(substructure)
+    if layout is not None and layout[0].size > 0:
+        # A list of fixed-width records can be unpacked with iter_unpack
+        compiled, converters = layout
+        size = compiled.size
+        if isinstance(substructure, dict):
+            names = tuple(substructure)
+            if converters:
+                build = lambda values: dict(zip(names, _convert(values, converters)))
+            else:
+                build = lambda values: dict(zip(names, values))
+        elif converters:
+            build = lambda values: _convert(values, converters)
+        else:
+            build = list
+
+        def decode(reader):
+            count = count_decoder(reader)
+            return [build(values) for values in compiled.iter_unpack(reader.read(count * size))]
+        return decode
+
+    item_decoder = compile_decoder(substructure, views)
+
+    def decode(reader):
+        return [item_decoder(reader) for _ in range(count_decoder(reader))]
+    return decode
+
+
+def compile_decoder(structure, views=0):
+    """
+    Compiles a structure specification (see BinReader.fpop_structure) into a function that takes a BinReader and
+    returns exactly what fpop_structure would, without having to work out what to do with each part of the structure
+    every time. Runs of fixed-width values are unpacked with a single precompiled struct.Struct.
+
+    Decoders are cached, so compiling the same structure repeatedly is cheap. The exception is lists, which are
+    compiled afresh each time because their lengths are sometimes filled in at run time; the structures inside them are
+    still cached.
+    :param structure: A structure specification, as accepted by BinReader.fpop_structure.
+    :param views: Opaque fields of at least this many bytes are read with reader.read_opaque, which may return
+    BytesViews. See BinReader.enable_views.
+    :return: A function decoder(reader).
+    """
+    if isinstance(structure, list):
+        return _compile_list_decoder(structure, views)
+    try:
+        return _decoders[id(structure), views][1]
+    except KeyError:
+        pass
+
+    if isinstance(structure, DataFormat):
+        decoder = _compile_format_decoder(structure, views)
+    elif isinstance(structure, dict):
+        names = tuple(structure)
+        decoder = _compile_record_decoder(list(structure.values()), lambda values: dict(zip(names, values)), views)
+    else:
+        # Anything else is probably an iterable.
+        decoder = _compile_record_decoder(list(structure), list, views)
+
+    _decoders[id(structure), views] = (structure, decoder)
+    return decoder
+
+
+# Compiled structure encoders
+# These do the same job as BinWriter.write_structure, packing values into a ByteAssembler.
+
+_encoders = {}
+
+
+def _to_bytes(data, translator):
+    """
+    Converts a single value to bytes in the same way as BinWriter.translate.
+    """
+    if callable(translator):
+        return translator(data)
+    elif isinstance(translator, str):
+        return struct.pack(translator, data)
+    elif isinstance(translator, DataFormat):
+        return _to_bytes(data, translator.to_bytes)
+    elif translator is None:
+        return data
+    else:
+        raise TypeError("Currently only supports formatting inputs with callable functions or with a string that "
+                        "is passed as a pattern to struct.pack.")
+
+
+def _packed_field(structure):
+    """
+    :return: The struct format code that a DataFormat is written with, or None if it isn't written by struct.pack or
+    can't safely be packed alongside other values.
+    """
+    if not isinstance(structure, DataFormat):
+        return None
+    code = structure.to_bytes
+    if isinstance(code, str) and len(code) == 1 and code in _SINGLE_VALUE_CODES \
+            and struct.calcsize(code) == struct.calcsize("=" + code):
+        return code
+    return None
+
+
+def _compile_format_encoder(structure):
+    code = _packed_field(structure)
+    if code is not None:
+        compiled = struct.Struct("=" + code)
+        pack_into = compiled.pack_into
+        size = compiled.size
+
+        def encode(assembler, data):
+            pack_into(assembler.buffer, assembler.reserve(size), data)
+        return encode
+    translator = structure.to_bytes
+    if translator is None:
+        return lambda assembler, data: assembler.append(data)
+    elif callable(translator):
+        return lambda assembler, data: assembler.append(translator(data))
+    else:
+        return lambda assembler, data: assembler.append(_to_bytes(data, translator))
+
+
+def _compile_record_encoder(substructures):
+    """
+    Compiles an encoder for a sequence of structures that will be given a sequence of values. Consecutive values that
+    are written by struct.pack are packed in one go.
+    As with write_structure, values are matched to structures by position, and any extra values are ignored.
+    """
+    steps = []
+    run_start = None
+
+    def close_run(end):
+        if run_start is None:
+            return
+        compiled = struct.Struct("=" + "".join(_packed_field(s) for s in substructures[run_start:end]))
+        pack_into = compiled.pack_into
+        size = compiled.size
+        start = run_start
+
+        def step(assembler, values):
+            pack_into(assembler.buffer, assembler.reserve(size), *values[start:end])
+        steps.append(step)
+
+    for index, substructure in enumerate(substructures):
+        if _packed_field(substructure) is not None:
+            if run_start is None:
+                run_start = index
+        else:
+            close_run(index)
+            run_start = None
+            encoder = compile_encoder(substructure)
+            steps.append(lambda assembler, values, encoder=encoder, index=index: encoder(assembler, values[index]))
+    close_run(len(substructures))
+
+    field_encoders = [compile_encoder(substructure) for substructure in substructures]
+    count = len(substructures)
+
+    def encode(assembler, values):
+        if len(values) < count:
+            # write_structure silently stops at the end of the data, so do the same
+            for value, encoder in zip(values, field_encoders):
+                encoder(assembler, value)
+            return
+        for step in steps:
+            step(assembler, values)
+    return encode
+
+
+def _compile_list_encoder(structure):
+    if len(structure) == 1:
+        # This is just shorthand for [substructure, UINT]
+        structure = [structure[0], UINT]
+    elif len(structure) != 2:
+        raise ValueError("Length of list must be 1 or 2.")
+
+    if isinstance(structure[1], int) or structure[1] is None:
+        # Fixed length implies no length indicator
+        length_encoder = None
+    elif isinstance(structure[1], DataFormat):
+        length_encoder = compile_encoder(structure[1])
+    else:
+        raise TypeError(f"Second element in list must by int, DataFormat, or None, not "
+                        f"{type(structure[1])}")
+
+    substructure = structure[0]
+    code = _packed_field(substructure)
+    if code is not None:
+        # A list of plain values can be packed in one go
+        size = struct.calcsize("=" + code)
+
+        def encode(assembler, data):
+            if length_encoder is not None:
+                length_encoder(assembler, len(data))
+            _repeated_struct(code, len(data)).pack_into(assembler.buffer, assembler.reserve(size * len(data)), *data)
+        return encode
+
+    item_encoder = compile_encoder(substructure)
+
+    def encode(assembler, data):
+        if length_encoder is not None:
+            length_encoder(assembler, len(data))
+        for data_instance in data:
+            item_encoder(assembler, data_instance)
+    return encode
+
+
+def compile_encoder(structure):
+    """
+    Compiles a structure specification (see BinWriter.write_structure) into a function that writes data in exactly the
+    same way as write_structure would, but into a ByteAssembler. Runs of values written by struct.pack are packed with a
+    single precompiled struct.Struct.
+
+    As with compile_decoder, encoders are cached, except for lists.
+    :param structure: A structure specification, as accepted by BinWriter.write_structure.
+    :return: A function encoder(assembler, data).
+    """
+    if isinstance(structure, list):
+        return _compile_list_encoder(structure)
+    try:
+        return _encoders[id(structure)][1]
+    except KeyError:
+        pass
+
+    if isinstance(structure, DataFormat):
+        encoder = _compile_format_encoder(structure)
+    elif isinstance(structure, tuple):
+        record_encoder = _compile_record_encoder(list(structure))
+        encoder = lambda assembler, data: record_encoder(assembler, list(data))
+    elif isinstance(structure, dict):
+        record_encoder = _compile_record_encoder(list(structure.values()))
+        encoder = lambda assembler, data: record_encoder(assembler, list(data.values()))
+    else:
+        raise TypeError(f"write_structure does not know how to handle {type(structure)}")
+
+    _encoders[id(structure)] = (structure, encoder)
+    return encoder
@@ -0,0 +1,421 @@
+"""
+A compact binary alternative to the json files written by serial_to_json.py, holding exactly the same data. Files in
+this format have the extension .bjson. They are several times smaller and faster to read and write than the indented
+json files, mostly because bytes are stored as they are rather than as hex, and because lists of similar values are
+packed together and unpacked in one go. They can't be edited by hand.
+
+Every value is a one-byte type tag, followed by:
+    None, False, True           nothing
+    int                         4 or 8 bytes, little-endian signed. Anything bigger is a length-prefixed decimal string.
+    float                       8 bytes, little-endian double
+    str, bytes                  4-byte length, then the UTF-8 encoded or raw bytes
+    dict                        The keys are stored once for each distinct set of keys in the file, as a "shape". The
+                                first dict with a given shape has a 4-byte count and the keys, each a 4-byte length and
+                                UTF-8 bytes. Every later dict with the same shape just has the shape's 4-byte number.
+                                Either way, the values follow in order.
+    list                        4-byte count, then one of:
+        any values              the values, each with its own tag
+        ints, floats or bools   the values packed as 4-byte or 8-byte ints, doubles or single bytes
+        strs or bytes           a packed 4-byte length for each value, then all the values one after another
+        dicts with one shape    the shape, as for a single dict, then a list for each key holding that key's values
+                                from every dict
+        lists of one length     a 4-byte length, then a list for each position holding the values at that position
+                                from every list. This is how the passes of the objects in a saved game are stored.
+        other lists             a packed 4-byte length for each list, then a single list holding the values from
+                                every list one after another
+        dicts with many shapes  a packed 4-byte group number for each dict, a 4-byte number of groups, then a list for
+                                each group holding the dicts in it. Each group has dicts of only one shape.
+        strs or bytes with      a packed 4-byte number for each value, then a list of the distinct values. Each one is
+        many repeats            only read once, and the same object is used everywhere it appears.
+Tuples are written as lists. All lengths and counts are little-endian unsigned.
+
+The file starts with MAGIC and a version byte. Version 1 didn't have lists of strs or bytes with many repeats, and is
+otherwise the same.
+"""
+
+import functools
+import gc
+import struct
+import sys
+from itertools import accumulate
+
+MAGIC = b"GLBJ"
+VERSION = 2
+
+(NONE, FALSE, TRUE, INT32, INT64, BIGINT, FLOAT, STR, BYTES, NEW_SHAPE, SHAPE, LIST, INT32_LIST, INT64_LIST, FLOAT_LIST,
+ BOOL_LIST, STR_LIST, BYTES_LIST, RECORD_LIST, ROW_LIST, NESTED_LIST, GROUPED_LIST, INDEXED_LIST) = range(23)
+
+_uint = struct.Struct("<I")
+_int32 = struct.Struct("<i")
+_int64 = struct.Struct("<q")
+_double = struct.Struct("<d")
+_tagged_uint = struct.Struct("<BI")
+_tagged_int32 = struct.Struct("<Bi")
+_tagged_int64 = struct.Struct("<Bq")
+_tagged_double = struct.Struct("<Bd")
+
+_INT32_MIN, _INT32_MAX = -1 << 31, (1 << 31) - 1
+_INT64_MIN, _INT64_MAX = -1 << 63, (1 << 63) - 1
+
+# The tag and struct format code for lists where every value has the same type
+_packed_lists = {float: (FLOAT_LIST, "d"), bool: (BOOL_LIST, "?")}
+_packed_codes = {INT32_LIST: ("i", 4), INT64_LIST: ("q", 8), FLOAT_LIST: ("d", 8), BOOL_LIST: ("?", 1)}
+
+
+def dumps(obj, default=None):
+    """
+    :param obj: The data to encode. May contain None, bools, ints, floats, strs, bytes, lists, tuples and dicts with
+    str keys.
+    :param default: Called with any other object, and should return an encodable version of it or raise a TypeError,
+    as with json.dump.
+    :return: bytes
+    """
+    parts = [MAGIC, bytes([VERSION])]
+    append = parts.append
+    shapes = {}
+    pack = struct.pack
+    pack_tagged_uint = _tagged_uint.pack
+    pack_tagged_int32 = _tagged_int32.pack
+    pack_tagged_int64 = _tagged_int64.pack
+    pack_tagged_double = _tagged_double.pack
+    pack_uint = _uint.pack
+    tag_bytes = [bytes([tag]) for tag in range(INDEXED_LIST + 1)]
+    none, false, true = tag_bytes[NONE], tag_bytes[FALSE], tag_bytes[TRUE]
+
+    def encode_shape(keys):
+        shape = shapes.get(keys)
+        if shape is None:
+            shapes[keys] = len(shapes)
+            append(pack_tagged_uint(NEW_SHAPE, len(keys)))
+            for key in keys:
+                encoded_key = key.encode()
+                append(pack_uint(len(encoded_key)))
+                append(encoded_key)
+        else:
+            append(pack_tagged_uint(SHAPE, shape))
+
+    def encode_list(values):
+        count = len(values)
+        if count == 0:
+            append(pack_tagged_uint(LIST, 0))
+            return
+        types = set(map(type, values))
+        if len(types) == 1:
+            type_ = types.pop()
+            if type_ is int:
+                if _INT32_MIN <= min(values) and max(values) <= _INT32_MAX:
+                    append(pack_tagged_uint(INT32_LIST, count))
+                    append(pack(f"<{count}i", *values))
+                    return
+                elif _INT64_MIN <= min(values) and max(values) <= _INT64_MAX:
+                    append(pack_tagged_uint(INT64_LIST, count))
+                    append(pack(f"<{count}q", *values))
+                    return
+            elif type_ in _packed_lists:
+                tag, code = _packed_lists[type_]
+                append(pack_tagged_uint(tag, count))
+                append(pack(f"<{count}{code}", *values))
+                return
+            elif type_ is str or type_ is bytes:
+                distinct = dict.fromkeys(values)
+                if len(distinct) * 2 <= count:
+                    numbers = {value: number for number, value in enumerate(distinct)}
+                    append(pack_tagged_uint(INDEXED_LIST, count))
+                    append(pack(f"<{count}I", *map(numbers.__getitem__, values)))
+                    encode_list(list(distinct))
+                    return
+                if type_ is str:
+                    values = [value.encode() for value in values]
+                append(pack_tagged_uint(STR_LIST if type_ is str else BYTES_LIST, count))
+                append(pack(f"<{count}I", *map(len, values)))
+                append(b"".join(values))
+                return
+            elif type_ is dict:
+                keys = tuple(values[0])
+                if all(tuple(value) == keys for value in values):
+                    append(pack_tagged_uint(RECORD_LIST, count))
+                    encode_shape(keys)
+                    for key in keys:
+                        encode_list([value[key] for value in values])
+                    return
+                groups = {}
+                numbers = [groups.setdefault(tuple(value), len(groups)) for value in values]
+                grouped = [[] for _ in groups]
+                for number, value in zip(numbers, values):
+                    grouped[number].append(value)
+                append(pack_tagged_uint(GROUPED_LIST, count))
+                append(pack(f"<{count}I", *numbers))
+                append(pack_uint(len(grouped)))
+                for group in grouped:
+                    encode_list(group)
+                return
+            elif type_ is list or type_ is tuple:
+                width = len(values[0])
+                if all(len(value) == width for value in values):
+                    append(pack_tagged_uint(ROW_LIST, count))
+                    append(pack_uint(width))
+                    for column in zip(*values):
+                        encode_list(column)
+                    return
+                append(pack_tagged_uint(NESTED_LIST, count))
+                append(pack(f"<{count}I", *map(len, values)))
+                encode_list([item for value in values for item in value])
+                return
+        append(pack_tagged_uint(LIST, count))
+        for item in values:
+            encode(item)
+
+    def encode(value):
+        # Ordered roughly by how common each type is in a saved game
+        type_ = type(value)
+        if type_ is int:
+            if _INT32_MIN <= value <= _INT32_MAX:
+                append(pack_tagged_int32(INT32, value))
+            elif _INT64_MIN <= value <= _INT64_MAX:
+                append(pack_tagged_int64(INT64, value))
+            else:
+                digits = str(value).encode()
+                append(pack_tagged_uint(BIGINT, len(digits)))
+                append(digits)
+        elif type_ is list or type_ is tuple:
+            encode_list(value)
+        elif type_ is dict:
+            encode_shape(tuple(value))
+            for item in value.values():
+                encode(item)
+        elif type_ is float:
+            append(pack_tagged_double(FLOAT, value))
+        elif type_ is str:
+            encoded = value.encode()
+            append(pack_tagged_uint(STR, len(encoded)))
+            append(encoded)
+        elif type_ is bool:
+            append(true if value else false)
+        elif type_ is bytes:
+            append(pack_tagged_uint(BYTES, len(value)))
+            append(value)
+        elif value is None:
+            append(none)
+        elif default is not None:
+            encode(default(value))
+        else:
+            raise TypeError(f"Object of type {type_.__name__} cannot be encoded")
+
+    encode(obj)
+    return b"".join(parts)
+
+
+def _builder(width, expression):
+    """
+    Compiles a function that takes width columns of values, and makes a list holding expression for each row of them,
+    where the values in the row are _0 to _<width - 1>. This is much quicker than building each list or dict in the
+    row from a tuple, as the values go straight into a single BUILD_LIST or BUILD_CONST_KEY_MAP.
+    """
+    names = ", ".join(f"_{i}" for i in range(width))
+    return eval(f"lambda columns: [{expression} for {names}, in zip(*columns)]")
+
+
+@functools.lru_cache(maxsize=1024)
+def _record_builder(keys):
+    """
+    :param keys: A tuple of strs.
+    :return: A function that makes a dict with these keys from each row of its columns.
+    """
+    # repr of a str is always a valid literal for the same str, so nothing in the keys can end up being run
+    return _builder(len(keys), "{" + ", ".join(f"{key!r}: _{i}" for i, key in enumerate(keys)) + "}")
+
+
+@functools.lru_cache(maxsize=1024)
+def _row_builder(width):
+    """
+    :return: A function that makes a list from each row of its columns.
+    """
+    return _builder(width, "[" + ", ".join(f"_{i}" for i in range(width)) + "]")
+
+
+def loads(data):
+    """
+    The reverse of dumps. Lists are always returned as lists, even if they were tuples when they were written.
+    :param data: A bytes-like object.
+    """
+    data = bytes(data)
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a bjson file.")
+    if not 1 <= data[len(MAGIC)] <= VERSION:
+        raise ValueError(f"Unsupported bjson version {data[len(MAGIC)]}.")
+    shapes = []
+    view = memoryview(data)
+    little_endian = sys.byteorder == "little"
+    unpack_from = struct.unpack_from
+    unpack_uint = _uint.unpack_from
+    unpack_int32 = _int32.unpack_from
+    unpack_int64 = _int64.unpack_from
+    unpack_double = _double.unpack_from
+
+    def decode_shape(tag, position):
+        """
+        :return: (keys, position after the shape)
+        """
+        count = unpack_uint(data, position)[0]
+        position += 4
+        if tag == SHAPE:
+            return shapes[count], position
+        keys = []
+        for _ in range(count):
+            length = unpack_uint(data, position)[0]
+            position += 4
+            keys.append(data[position:position + length].decode())
+            position += length
+        shapes.append(keys)
+        return keys, position
+
+    def decode_uints(count, position):
+        """
+        :return: (a sequence of count packed 4-byte unsigned ints, position after them)
+        """
+        end = position + 4 * count
+        if little_endian:
+            return view[position:end].cast("I"), end
+        return unpack_from(f"<{count}I", data, position), end
+
+    def decode_offsets(count, position):
+        """
+        Reads count packed lengths.
+        :return: (the count + 1 offsets where each value starts and the last one ends, position after the lengths)
+        """
+        lengths, position = decode_uints(count, position)
+        return list(accumulate(lengths, initial=0)), position
+
+    def decode_list(tag, position):
+        """
+        :return: (list, position after the list)
+        """
+        count = unpack_uint(data, position)[0]
+        position += 4
+        if tag == RECORD_LIST:
+            keys, position = decode_shape(data[position], position + 1)
+            columns = []
+            for _ in keys:
+                column, position = decode_list(data[position], position + 1)
+                columns.append(column)
+            if not keys:
+                return [{} for _ in range(count)], position
+            return _record_builder(tuple(keys))(columns), position
+        elif tag == ROW_LIST:
+            width = unpack_uint(data, position)[0]
+            position += 4
+            columns = []
+            for _ in range(width):
+                column, position = decode_list(data[position], position + 1)
+                columns.append(column)
+            if width == 0:
+                return [[] for _ in range(count)], position
+            return _row_builder(width)(columns), position
+        elif tag == NESTED_LIST:
+            offsets, position = decode_offsets(count, position)
+            items, position = decode_list(data[position], position + 1)
+            return [items[start:end] for start, end in zip(offsets, offsets[1:])], position
+        elif tag == GROUPED_LIST:
+            numbers, position = decode_uints(count, position)
+            group_count = unpack_uint(data, position)[0]
+            position += 4
+            groups = []
+            for _ in range(group_count):
+                group, position = decode_list(data[position], position + 1)
+                groups.append(iter(group))
+            return list(map(next, map(groups.__getitem__, numbers))), position
+        elif tag == INDEXED_LIST:
+            numbers, position = decode_uints(count, position)
+            distinct, position = decode_list(data[position], position + 1)
+            return list(map(distinct.__getitem__, numbers)), position
+        elif tag in _packed_codes:
+            code, size = _packed_codes[tag]
+            end = position + count * size
+            if little_endian:
+                # Straight from the bytes to a list, without unpacking to a tuple first
+                return view[position:end].cast(code).tolist(), end
+            return list(unpack_from(f"<{count}{code}", data, position)), end
+        elif tag == STR_LIST or tag == BYTES_LIST:
+            offsets, position = decode_offsets(count, position)
+            joined = data[position:position + offsets[-1]]
+            position += len(joined)
+            if tag == STR_LIST and joined.isascii():
+                # Slicing one big str is much quicker than decoding every value, but only works if the byte and
+                # character offsets are the same
+                joined = joined.decode()
+            values = [joined[start:end] for start, end in zip(offsets, offsets[1:])]
+            if tag == STR_LIST and type(joined) is bytes:
+                values = [value.decode() for value in values]
+            return values, position
+        else:
+            values = []
+            for _ in range(count):
+                value, position = decode(position)
+                values.append(value)
+            return values, position
+
+    def decode(position):
+        """
+        :return: (value, position after the value)
+        """
+        tag = data[position]
+        position += 1
+        if tag == INT32:
+            return unpack_int32(data, position)[0], position + 4
+        elif tag >= LIST:
+            return decode_list(tag, position)
+        elif tag == SHAPE or tag == NEW_SHAPE:
+            keys, position = decode_shape(tag, position)
+            values = []
+            for _ in keys:
+                value, position = decode(position)
+                values.append(value)
+            return dict(zip(keys, values)), position
+        elif tag == FLOAT:
+            return unpack_double(data, position)[0], position + 8
+        elif tag == STR or tag == BYTES or tag == BIGINT:
+            length = unpack_uint(data, position)[0]
+            position += 4
+            raw = data[position:position + length]
+            if tag == STR:
+                return raw.decode(), position + length
+            elif tag == BYTES:
+                return raw, position + length
+            else:
+                return int(raw), position + length
+        elif tag == FALSE:
+            return False, position
+        elif tag == TRUE:
+            return True, position
+        elif tag == NONE:
+            return None, position
+        elif tag == INT64:
+            return unpack_int64(data, position)[0], position + 8
+        else:
+            raise ValueError(f"Unknown type tag {tag} at position {position - 1}.")
+
+    # Garbage collection passes are triggered by all the containers being created, but there's no garbage to find
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        value, end = decode(len(MAGIC) + 1)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    if end != len(data):
+        raise ValueError(f"Extra data after position {end}.")
+    return value
+
+
+def dump(obj, file, default=None):
+    """
+    :param file: A file opened in binary mode.
+    """
+    file.write(dumps(obj, default))
+
+
+def load(file):
+    """
+    :param file: A file opened in binary mode.
+    """
+    return loads(file.read())
@@ -0,0 +1,271 @@
+"""
+Deserializes the bulk data of a saved game (the .bin file) into native Python objects, one pass at a time.
+"""
+
+import binarizer as b
+import notification_codecs
+import quest_scanner
+from bulk_reader_tools import *
+
+# Sections that have an entry for each object in every pass, which are zipped together into one list per object.
+zippable = ["actions", "traits", "players", "tiles", "features", "cities", "building_groups", "buildings",
+            "units", "weapons", "magic_items", "notifications"]
+
+# The structure of a single record in each list section, in each pass.
+# Actions and notifications are special cases, handled by read_record.
+record_structures = [
+    dict(climates=first_pass_structure_1["climates"][0],
+         **{key: value[0] for key, value in first_pass_structure_2.items()}),
+    {key: value[0] for key, value in second_pass_structure.items()},
+    {key: value[0] for key, value in third_pass_structure.items()},
+    {key: value[0] for key, value in fourth_pass_structure.items()},
+    {key: value[0] for key, value in fifth_pass_structure.items()},
+]
+
+
+def read_record(binary, pass_number, key, first_pass_record=None):
+    """
+    Reads a single record from a list section.
+    :param binary: A BinReader positioned at the start of the record.
+    :param pass_number: Which pass the record is in, counting from 0.
+    :param key: The name of the section, such as "units".
+    :param first_pass_record: The first-pass record for the same object. Only needed for actions and notifications
+    after the first pass, whose structure depends on it.
+    """
+    if key == "actions":
+        if pass_number == 0:
+            action = binary.fpop_compiled(action_structure)
+            if action["path"].endswith("CycleWeapon"):
+                action["bool1"] = binary.fpop(b.BOOL)
+            return action
+        elif is_weapon(first_pass_record["path"]):
+            return binary.fpop_compiled(action2_weapon_structure)
+        else:
+            return binary.fpop_compiled(action2_normal_structure)
+    elif key == "notifications":
+        return notification_codecs.read_notification(binary, pass_number, first_pass_record)
+    else:
+        return binary.fpop_compiled(record_structures[pass_number][key])
+
+
+def _read_list(binary, pass_number, key, structure, first_pass=None, offsets=None, columnar=False):
+    """
+    Reads a list section.
+    :param structure: The list structure of the section.
+    :param first_pass: The first-pass records of the same section. If given, the section has one record for each of
+    them and no length indicator of its own.
+    :param offsets: If given, the offset of each record is appended to it.
+    """
+    if key == "notifications":
+        return notification_codecs.read_notifications(binary, pass_number, first_pass, offsets)
+
+    if first_pass is not None:
+        count = len(first_pass)
+    elif len(structure) == 1:
+        count = binary.fpop(b.UINT)
+    elif isinstance(structure[1], int):
+        count = structure[1]
+    else:
+        count = binary.fpop(*structure[1])
+
+    if offsets is not None or key == "actions":
+        records = []
+        for n in range(count):
+            if offsets is not None:
+                offsets.append(binary.tell())
+            records.append(read_record(binary, pass_number, key, first_pass[n] if first_pass else None))
+        return records
+
+    if columnar:
+        # Only imported when needed, as it depends on NumPy
+        import columnar as c
+        if c.is_columnar(structure):
+            return c.read_section(binary, [structure[0], count])
+    return binary.fpop_compiled([structure[0], count])
+
+
+# The last pass in which each section appears. A section is complete once this pass has been read.
+final_passes = dict(world_params=1, climates=0, events=0, actions=1, quests=1, notifications=4,
+                    **{key: max(pass_number for pass_number in range(5) if key in record_structures[pass_number])
+                       for key in zippable if key not in ("actions", "notifications")})
+
+
+def _first_pass_stub(key, records):
+    """
+    Keeps only as much of a first-pass section as is needed to read the same section in later passes.
+    """
+    if key == "actions":
+        return [{"path": record["path"]} for record in records]
+    elif key == "notifications":
+        return [{"type": record["type"]} for record in records]
+    else:
+        return [None] * len(records)
+
+
+def iter_bulk(binary, locations=None, record_offsets=None, columnar=False):
+    """
+    Reads the whole of the bulk data one section at a time, without keeping hold of anything once it's been handed
+    over.
+    :param binary: A BinReader positioned at the start of the bulk data.
+    :param locations: See parse_bulk.
+    :param record_offsets: See parse_bulk.
+    :param columnar: See parse_bulk.
+    :return: A generator of (pass_number, key, value), in the order the sections appear in the file.
+    """
+    if locations is None:
+        locations = [{}, {}, {}, {}, {}]
+    # The parts of the first pass needed to read the later passes
+    first_pass = {}
+
+    def read_list(pass_number, key, structure):
+        locations[pass_number][key] = binary.tell()
+        offsets = None
+        if record_offsets is not None:
+            offsets = record_offsets[pass_number][key] = []
+        value = _read_list(binary, pass_number, key, structure, first_pass.get(key) if pass_number else None,
+                           offsets, columnar)
+        if pass_number == 0:
+            first_pass[key] = _first_pass_stub(key, value)
+        return pass_number, key, value
+
+    # ================================ #
+    # ==== First pass starts here ==== #
+    # ================================ #
+
+    # world parameters
+    locations[0]["world_params"] = binary.tell()
+    yield 0, "world_params", binary.fpop_compiled(world_params_structure)
+
+    # climates
+    yield read_list(0, "climates", first_pass_structure_1["climates"])
+
+    # Events - not implemented yet
+    locations[0]["events"] = binary.tell()
+    events = binary.fpop(b.UINT)
+    if events != 0:
+        raise NotImplementedError("Events section parsing is not implemented.")
+    yield 0, "events", events
+
+    # Actions
+    yield read_list(0, "actions", [action_structure])
+
+    # Traits, players, tiles, features, cities, buildingGroups, buildings, units, weapons, items.
+    for key in first_pass_structure_2:
+        if key != "quests":
+            yield read_list(0, key, first_pass_structure_2[key])
+
+    # Quests have no length markers, so they're found by what comes after them. See quest_scanner.py.
+    locations[0]["quests"] = binary.tell()
+    offsets = None
+    if record_offsets is not None:
+        offsets = record_offsets[0]["quests"] = []
+    quests = quest_scanner.read_quests(binary, offsets)
+    first_pass["quests"] = _first_pass_stub("quests", quests)
+    yield 0, "quests", quests
+
+    # Finally, notifications.
+    yield read_list(0, "notifications", [notification_prefix])
+
+    # ================================= #
+    # ==== Second pass starts here ==== #
+    # ================================= #
+
+    # ID of the current active player
+    locations[1]["world_params"] = binary.tell()
+    yield 1, "world_params", {"current_player": binary.fpop(b.UINT)}
+
+    # Actions require special handling because of the weapon-actions issue
+    yield read_list(1, "actions", [action2_normal_structure, None])
+
+    # traits, players, tiles, features, cities, buildingGroups, buildings, units, weapons, items
+    for key in second_pass_structure:
+        yield read_list(1, key, second_pass_structure[key])
+
+    # Quests - not deserialized, just scanned
+    locations[1]["quests"] = binary.tell()
+    notification_types = [notification["type"] for notification in first_pass["notifications"]]
+    yield 1, "quests", quest_scanner.read_quests2(binary, len(first_pass["quests"]), notification_types)
+
+    # Notifications
+    yield read_list(1, "notifications", [notification2_prefix, None])
+
+    # ================================ #
+    # ==== Third pass starts here ==== #
+    # ================================ #
+
+    # traits, then order data for players, cities, and buildingGroups
+    for key in third_pass_structure:
+        yield read_list(2, key, third_pass_structure[key])
+
+    # Notifications again
+    yield read_list(2, "notifications", [notification2_prefix, None])
+
+    # A dummy value because the tiles data skips a pass for some reason.
+    yield 2, "tiles", [{} for tile in first_pass["tiles"]]
+
+    # ================================= #
+    # ==== Fourth pass starts here ==== #
+    # ================================= #
+
+    # Tiles, units
+    for key in fourth_pass_structure:
+        yield read_list(3, key, fourth_pass_structure[key])
+
+    # Notifications *again*
+    yield read_list(3, "notifications", [notification2_prefix, None])
+
+    # ================================ #
+    # ==== Fifth pass starts here ==== #
+    # ================================ #
+
+    # Seems to be just notifications for a fifth and final time
+    yield read_list(4, "notifications", [notification2_prefix, None])
+
+
+def parse_bulk(binary, locations=None, record_offsets=None, columnar=False):
+    """
+    Reads the whole of the bulk data.
+    :param binary: A BinReader positioned at the start of the bulk data.
+    :param locations: Optional list of five dicts, which is filled in with the offset of every section in every pass.
+    :param record_offsets: Optional list of five dicts, which is filled in with a list of the offsets of every record in
+    every list section in every pass.
+    :param columnar: Read sections made up of fixed-width records into NumPy structured arrays. See columnar.py.
+    :return: A list of five dicts, one for each pass, each mapping section names to their contents.
+    """
+    return collect_passes(iter_bulk(binary, locations, record_offsets, columnar))
+
+
+def collect_passes(sections):
+    """
+    Gathers up the sections from iter_bulk into a list of five dicts, one for each pass, as returned by parse_bulk.
+    """
+    passes = [{}, {}, {}, {}, {}]
+    for pass_number, key, value in sections:
+        passes[pass_number][key] = value
+    return passes
+
+
+def zip_passes(passes):
+    """
+    Rearranges the output of parse_bulk so that all the data about each object is kept together.
+    from [{"actions": pass1_actions, "traits": pass1_traits}, {"actions": pass2_actions, "traits": pass2_traits}]
+    to {"actions": [(pass1_action1, pass2_action1), ...], "traits": [(pass1_trait1, pass2_trait1), ...]}
+    Sections that aren't in zippable are just collected into a list of passes.
+    """
+    rearranged = {}
+    for section_title in passes[0].keys():
+        rearranged[section_title] = []
+        for eachPass in passes:
+            try:
+                rearranged[section_title].append(eachPass[section_title])
+            except KeyError:
+                pass
+
+    zipped = {}
+
+    for section_title, section in rearranged.items():
+        if section_title in zippable:
+            zipped[section_title] = list(zip(*section))
+        else:
+            zipped[section_title] = section
+    return zipped
@@ -122,9 +122,14 @@ action2_weapon_structure = dict(
 
 # Actions that are also weapons seem to work differently - they have an extra byte of data at the end.
 # Because of this, we need a mechanism to identify them.
-weapons_directory = r"C:\Program Files (x86)\Steam\steamapps\common\Warhammer 40000 Gladius - Relics of " \
-                    r"War\Data\World\Weapons"
-weapons = [_os.path.splitext(file)[0].lower() for file in _os.listdir(weapons_directory)]
+#
+# The names of the weapons are taken from the game's install directory, which is named in the master config file. It's
+# only looked at the first time it's needed, and what's found there is saved in a cache file, so that saves can still
+# be read on machines without the game (copy the cache file over). set_weapon_catalog can be used instead of either,
+# for made-up saves.
+master_config_name = "Config.ini"
+weapons_subdirectory = _os.path.join("Data", "World", "Weapons")
+weapon_cache_path = _os.path.join(_os.path.dirname(_os.path.abspath(__file__)), "weapon_catalog.txt")
 weapon_like_actions = ["throwGrenade",
                        "useWeapon",
                        "heavyBombClusters",
@@ -148,36 +153,129 @@ weapon_like_actions = ["throwGrenade",
                        "frazzle",
                        "powerStrike",
                        "preciseShot"]
-weapon_like_actions = [s.lower() for s in weapon_like_actions]
+weapon_like_actions = frozenset(s.lower() for s in weapon_like_actions)
+# Set log_weapons to True to have is_weapon explain its decision about each path in weapons_log
+log_weapons = False
 weapons_log = []
 
+_weapons = None  # frozenset of lowercase weapon names, loaded when first needed
+_weapon_paths = {}  # Action path -> True, False, or None if it can't be told, memoized by is_weapon
 
-def is_weapon(path):
-    global weapons_log
+
+def read_weapons_directory(config_path=master_config_name):
+    """
+    :return: A frozenset of the lowercase names of every weapon in the game, from the install directory named in the
+    master config file.
+    :raises OSError: if the game isn't installed there.
+    """
+    import configparser
+    config = configparser.ConfigParser(allow_no_value=True)
+    config.read(config_path)
+    install_directory = config["GLADIUS"]["gladius install directory"]
+    directory = _os.path.join(install_directory, weapons_subdirectory)
+    return frozenset(_os.path.splitext(file)[0].lower() for file in _os.listdir(directory))
+
+
+def write_weapon_cache(weapons, path=weapon_cache_path):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'w') as file:
+        file.write("".join(weapon + "\n" for weapon in sorted(weapons)))
+    _os.replace(temporary_path, path)
+
+
+def read_weapon_cache(path=weapon_cache_path):
+    with open(path, 'r') as file:
+        return frozenset(line.strip() for line in file if line.strip())
+
+
+def load_weapon_catalog(config_path=master_config_name, cache_path=weapon_cache_path):
+    """
+    Reads the weapon names from the install directory, refreshing the cache file, or from the cache file if the game
+    isn't installed.
+    :return: A frozenset of lowercase weapon names.
+    :raises FileNotFoundError: if neither can be found.
+    """
+    try:
+        weapons = read_weapons_directory(config_path)
+    except (OSError, KeyError):
+        try:
+            return read_weapon_cache(cache_path)
+        except OSError:
+            raise FileNotFoundError(f"Can't find the game's weapons, which are needed to read actions. Either set the "
+                                    f"gladius install directory in {config_path}, or copy {cache_path} from a machine "
+                                    f"that has the game installed.") from None
+    try:
+        if not _os.path.isfile(cache_path) or read_weapon_cache(cache_path) != weapons:
+            write_weapon_cache(weapons, cache_path)
+    except OSError:
+        pass  # The cache is only a convenience
+    return weapons
+
+
+def weapon_catalog():
+    """
+    :return: A frozenset of the lowercase names of every weapon in the game, loading it if need be.
+    """
+    global _weapons
+    if _weapons is None:
+        _weapons = load_weapon_catalog()
+    return _weapons
+
+
+def set_weapon_catalog(weapons):
+    """
+    Uses the given weapon names instead of the game's, such as for made-up saves.
+    :param weapons: An iterable of weapon names, or None to go back to loading the game's when next needed.
+    """
+    global _weapons
+    _weapons = None if weapons is None else frozenset(weapon.lower() for weapon in weapons)
+    _weapon_paths.clear()
+
+
+def __getattr__(name):
+    # bulk_reader_tools.weapons used to be a list made when this module was imported
+    if name == "weapons":
+        return weapon_catalog()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _classify_weapon(path):
+    """
+    :return: (True, False, or None if it can't be told, an explanation for weapons_log or None)
+    """
     split_path = path.split('/')
+    last = split_path[-1].lower()
+    penultimate = split_path[-2].lower() if len(split_path) >= 2 else None
     # This is only very approximate
-    if split_path[0] == "Units"\
-            and split_path[-1].lower() in weapons \
-            and len(split_path) >= 5 \
-            and split_path[-2].lower() in weapon_like_actions:
-        weapons_log.append(f"{path} is a weapon - begins with Units, ends in a weapon, length >= 5, penultimate "
-                           f"section {split_path[-2].lower()} found in weapon_like_actions")
-        return True
-    elif split_path[0] == "Units" \
-            and split_path[-1].lower() in weapons \
-            and len(split_path) >= 5:
-        weapons_log.append(f"{path} is probably a weapon - begins with Units, ends in a weapon, length >= 5, but "
-                           f"penultimate section {split_path[-2].lower()} NOT found in weapon_like_actions")
-        raise RuntimeError(f"Unable to determine if {path} is a weapon.")
-    elif split_path[-2].lower() in weapon_like_actions:
-        weapons_log.append(f"{path} MIGHT be a weapon - penultimate "
-                           f"section {split_path[-2].lower()} found in weapon_like_actions")
-        raise RuntimeError(f"Unable to determine if {path} is a weapon.")
-    elif split_path[-1].lower() == "spawnunits":
-        weapons_log.append(f"""{path} isn't a weapon, but it is "spawn units".""")
-        return True
+    if split_path[0] == "Units" and last in weapon_catalog() and len(split_path) >= 5:
+        if penultimate in weapon_like_actions:
+            return True, f"{path} is a weapon - begins with Units, ends in a weapon, length >= 5, penultimate " \
+                         f"section {penultimate} found in weapon_like_actions"
+        return None, f"{path} is probably a weapon - begins with Units, ends in a weapon, length >= 5, but " \
+                     f"penultimate section {penultimate} NOT found in weapon_like_actions"
+    elif penultimate in weapon_like_actions:
+        return None, f"{path} MIGHT be a weapon - penultimate section {penultimate} found in weapon_like_actions"
+    elif last == "spawnunits":
+        return True, f"""{path} isn't a weapon, but it is "spawn units"."""
     else:
-        return False
+        return False, None
+
+
+def is_weapon(path):
+    """
+    Whether an action has the extra weapon_id in its second pass. Each distinct path is only worked out once.
+    :raises RuntimeError: if it can't be told.
+    """
+    try:
+        result = _weapon_paths[path]
+    except KeyError:
+        result, explanation = _classify_weapon(path)
+        _weapon_paths[path] = result
+        if log_weapons and explanation is not None:
+            weapons_log.append(explanation)
+    if result is None:
+        raise RuntimeError(f"Unable to determine if {path} is a weapon.")
+    return result
 
 
 # Done, but would appreciate testing
@@ -434,9 +532,8 @@ magic_item2_structure = dict(
 # Either the string "Factions/" (start of the next quest)
 # OR four characters (the length marker INT) followed by 4+ letters followed by a null byte (start of the
 # notifications section)
-# This might fail if the Lord of Skulls quest is active
-# ideally I would find a better way to get the right amount of data
-# However, I don't need to worry too much - no quests are active at game start.
+# This might fail if the Lord of Skulls quest is active, so the quests are now read with quest_scanner.py instead,
+# which checks what follows each quest properly. This is still used to write them.
 quest_re = rb'(Factions/|....[a-z,A-Z]{4,}\x00)'
 quest_binary = b.DataFormat(_re.compile(quest_re), bytes, inclusive=False)
 
@@ -586,8 +683,8 @@ notification_structures = {key: dict(**notification_prefix, **value) for key, va
 
 notification2_structures = {key: dict(**notification2_prefix, **value) for key, value in notification_suffixes.items()}
 
-# Only relevant for parsing files with quest data in them - this is used as part of the regexp that skips over
-# trying to skip over the quest data and its lack of length indicators
+# The number of bytes at the start of each type of notification in the second pass before the first string, if it has
+# any. No longer used: quest_scanner.py decodes the notifications after the quests instead.
 notification2_prefix_lengths = dict(
     CityGrown=7,
     FactionDefeated=None,
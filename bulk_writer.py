@@ -0,0 +1,248 @@
+"""
+Serializes native Python objects back into the bulk data of a saved game (the .bin file), one pass at a time. This is
+the reverse of bulk_parser.py.
+"""
+
+import shutil
+import tempfile
+import binarizer as b
+import notification_codecs
+from bulk_parser import zippable, record_structures
+from bulk_reader_tools import *
+
+
+def _is_numpy(records):
+    return type(records).__module__ == "numpy" or (len(records) != 0 and type(records[0]).__module__ == "numpy")
+
+
+def write_record(binary, pass_number, key, record, first_pass_record=None):
+    """
+    Writes a single record from a list section.
+    :param binary: A BinWriter.
+    :param pass_number: Which pass the record is in, counting from 0.
+    :param key: The name of the section, such as "units".
+    :param record: The data to write.
+    :param first_pass_record: The first-pass record for the same object. Only needed for actions after the first pass,
+    whose structure depends on it.
+    """
+    if key == "actions":
+        if pass_number == 0:
+            if record["path"].endswith("CycleWeapon"):
+                binary.write_compiled(record, action_cycle_weapon_structure)
+            else:
+                binary.write_compiled(record, action_structure)
+        elif is_weapon(first_pass_record["path"]):
+            binary.write_compiled(record, action2_weapon_structure)
+        else:
+            binary.write_compiled(record, action2_normal_structure)
+    elif key == "notifications":
+        notification_codecs.write_notification(binary, pass_number, record, first_pass_record)
+    else:
+        binary.write_compiled(record, record_structures[pass_number][key])
+
+
+def _write_list(binary, pass_number, key, records, structure, first_pass=None):
+    """
+    Writes a list section.
+    :param structure: The list structure of the section.
+    :param first_pass: The first-pass records of the same section, if this is a later pass.
+    """
+    if key == "notifications":
+        notification_codecs.write_notifications(binary, pass_number, records, first_pass)
+    elif key == "actions":
+        if first_pass is None:
+            binary.translate(len(records), b.UINT)
+            for record in records:
+                write_record(binary, pass_number, key, record)
+        else:
+            for record, first_pass_record in zip(records, first_pass):
+                write_record(binary, pass_number, key, record, first_pass_record)
+    elif _is_numpy(records):
+        # Only imported when needed, as it depends on NumPy
+        import columnar as c
+        c.write_section(binary, records, structure)
+    else:
+        binary.write_compiled(records, structure)
+
+
+# The sections in each pass, in the order they're written. The dummy third-pass tile data isn't written at all.
+pass_order = [
+    ["world_params", "climates", "events", "actions", *first_pass_structure_2, "notifications"],
+    ["world_params", "actions", *second_pass_structure, "quests", "notifications"],
+    [*third_pass_structure, "notifications"],
+    [*fourth_pass_structure, "notifications"],
+    ["notifications"],
+]
+
+# The list structure of each list section in each pass, or None for the sections with one record for each first-pass
+# record and no length indicator of their own.
+_list_structures = [
+    dict(climates=first_pass_structure_1["climates"], actions=[action_structure],
+         notifications=[notification_prefix], **first_pass_structure_2),
+    dict(actions=None, notifications=None, **second_pass_structure),
+    dict(notifications=None, **third_pass_structure),
+    dict(notifications=None, **fourth_pass_structure),
+    dict(notifications=None),
+]
+
+
+def write_section(binary, pass_number, key, value, first_pass=None):
+    """
+    Writes one section of one pass.
+    :param binary: A BinWriter.
+    :param pass_number: Which pass the section is in, counting from 0.
+    :param key: The name of the section, such as "units".
+    :param value: The contents of the section in this pass.
+    :param first_pass: The contents of the same section in the first pass. Only needed for actions and notifications
+    after the first pass.
+    """
+    if key == "world_params":
+        if pass_number == 0:
+            binary.write_compiled(value, world_params_structure)
+        else:
+            # ID of the current active player
+            binary.translate(value["current_player"], b.UINT)
+    elif key == "events":
+        # Always blank
+        binary.translate(0, b.UINT)
+    elif key == "quests" and pass_number == 1:
+        # Not deserialized, just scanned
+        binary.write_structure(value, b.DataFormat(None, bytes))
+    else:
+        _write_list(binary, pass_number, key, value, _list_structures[pass_number][key],
+                    first_pass if pass_number != 0 else None)
+
+
+def write_bulk(binary, passes, locations=None):
+    """
+    Writes the whole of the bulk data.
+    :param binary: A BinWriter.
+    :param passes: A list of five dicts, one for each pass, as returned by bulk_parser.parse_bulk.
+    :param locations: Optional list of five dicts, which is filled in with the offset of every section in every pass.
+    """
+    if locations is None:
+        locations = [{}, {}, {}, {}, {}]
+
+    for pass_number, keys in enumerate(pass_order):
+        for key in keys:
+            locations[pass_number][key] = binary.tell()
+            write_section(binary, pass_number, key, passes[pass_number][key], passes[0].get(key))
+
+
+def write_bulk_sections(binary, sections, locations=None, spool_size=1 << 20, instrument=None):
+    """
+    Writes the whole of the bulk data from one section at a time, so that only one section needs to be in memory at
+    once. Each section is split into its passes, and each pass is written to a temporary file of its own, which are
+    then all copied into binary in the right order.
+    :param binary: A BinWriter.
+    :param sections: An iterable of (key, value) pairs, in any order, where each value is as in the json files. See
+    json_stream.iter_sections.
+    :param locations: See write_bulk.
+    :param spool_size: How big each temporary file can get before it's moved out of memory and onto the disk.
+    :param instrument: An instrumentation.Instrument to measure writing each section to its temporary file.
+    """
+    if locations is None:
+        locations = [{}, {}, {}, {}, {}]
+    spools = {}
+
+    for key, value in sections:
+        if key in zippable:
+            value = list(zip(*value))
+            # Pad list to length 5
+            value += [[]] * (5 - len(value))
+        for pass_number, pass_value in enumerate(value):
+            if key not in pass_order[pass_number]:
+                continue
+            spool = tempfile.SpooledTemporaryFile(spool_size)
+            # noinspection PyTypeChecker
+            writer = b.BinWriter(spool)
+            if instrument is None:
+                write_section(writer, pass_number, key, pass_value, value[0])
+            else:
+                with instrument.section(pass_number, key, writer, pass_value):
+                    write_section(writer, pass_number, key, pass_value, value[0])
+            writer.flush()
+            # Otherwise the spool is closed along with the writer
+            spools[pass_number, key] = writer.detach()
+        del value  # Save memory
+
+    for pass_number, keys in enumerate(pass_order):
+        for key in keys:
+            locations[pass_number][key] = binary.tell()
+            spool = spools.pop((pass_number, key))
+            spool.seek(0)
+            shutil.copyfileobj(spool, binary)
+            spool.close()
+
+
+def section_spans(locations, size):
+    """
+    Works out where every section ends, from where they all start.
+    :param locations: Where every section starts, as filled in by bulk_parser.parse_bulk or write_bulk.
+    :param size: The size of the whole of the bulk data.
+    :return: A dict mapping (pass_number, key) to (start, end).
+    """
+    starts = sorted((start, pass_number, key) for pass_number, sections in enumerate(locations)
+                    for key, start in sections.items())
+    ends = [start for start, _, _ in starts[1:]] + [size]
+    return {(pass_number, key): (start, end) for (start, pass_number, key), end in zip(starts, ends)}
+
+
+def splice_bulk(binary, passes, original, original_locations, dirty, locations=None):
+    """
+    Writes the whole of the bulk data like write_bulk, but only the sections that have changed are written again.
+    Everything else is copied straight from the bulk data the passes were read from, with runs of unchanged sections
+    copied all at once.
+    :param binary: A BinWriter.
+    :param passes: A list of five dicts, as for write_bulk.
+    :param original: The bulk data the passes were first read from, such as a BinReader or bytes.
+    :param original_locations: Where every section starts in original, as filled in by bulk_parser.parse_bulk.
+    :param dirty: A set of (pass_number, key) for every section that has changed since it was read. Actions and
+    notifications after the first pass are written again if their first pass has changed, as their structure depends
+    on it.
+    :param locations: See write_bulk.
+    """
+    if locations is None:
+        locations = [{}, {}, {}, {}, {}]
+    spans = section_spans(original_locations, len(original))
+    # The run of unchanged sections waiting to be copied
+    copy_start = copy_end = None
+
+    with memoryview(original) as view:
+        for pass_number, keys in enumerate(pass_order):
+            for key in keys:
+                span = spans.get((pass_number, key))
+                if span is None or (pass_number, key) in dirty \
+                        or (key in ("actions", "notifications") and (0, key) in dirty):
+                    if copy_start is not None:
+                        binary.write_view(view[copy_start:copy_end])
+                        copy_start = None
+                    locations[pass_number][key] = binary.tell()
+                    write_section(binary, pass_number, key, passes[pass_number][key], passes[0].get(key))
+                elif copy_start is not None and span[0] == copy_end:
+                    locations[pass_number][key] = binary.tell() + copy_end - copy_start
+                    copy_end = span[1]
+                else:
+                    if copy_start is not None:
+                        binary.write_view(view[copy_start:copy_end])
+                    locations[pass_number][key] = binary.tell()
+                    copy_start, copy_end = span
+        if copy_start is not None:
+            binary.write_view(view[copy_start:copy_end])
+
+
+def unzip_passes(zipped):
+    """
+    The reverse of bulk_parser.zip_passes: splits the data back up into passes, ready for write_bulk.
+    """
+    unzipped_data = {}
+
+    for key, value in zipped.items():
+        if key in zippable:
+            unzipped_data[key] = list(zip(*value))
+            # Pad list to length 5
+            unzipped_data[key] += [[]] * (5 - len(unzipped_data[key]))
+        else:
+            unzipped_data[key] = value
+
+    return [{key: value[n] for key, value in unzipped_data.items() if len(value) > n} for n in range(5)]
@@ -0,0 +1,126 @@
+"""
+Columnar decoding of sections that are made up entirely of fixed-width records, such as climates or the fourth-pass
+tile and unit data. Rather than building a dict for every record, the whole section is read with a single
+numpy.frombuffer call into a structured array, with one named field per value in the record.
+
+This is opt-in, and needs NumPy.
+"""
+
+import numpy as np
+import binarizer as b
+
+# numpy equivalents of the struct format codes used by fixed-width DataFormats. Single characters are read as raw
+# bytes so that null bytes are not stripped.
+_numpy_codes = {"c": "V1", "b": "i1", "B": "u1", "?": "?", "h": "=i2", "H": "=u2", "i": "=i4", "I": "=u4", "l": "=i4",
+                "L": "=u4", "q": "=i8", "Q": "=u8", "f": "=f4", "d": "=f8"}
+
+
+def structure_dtype(structure):
+    """
+    Builds a numpy structured dtype matching a fixed-width record structure. Dict structures keep their field names;
+    the fields of tuple structures are named f0, f1 and so on.
+    :param structure: A DataFormat, dict or tuple in which every value is fixed-width.
+    :return: numpy.dtype
+    """
+    fields = b.fixed_width_fields(structure)
+    if fields is None:
+        raise ValueError(f"Structure is not made up entirely of fixed-width values: {structure}")
+    if isinstance(structure, dict):
+        names = list(structure)
+    elif isinstance(structure, b.DataFormat):
+        names = ["value"]
+    else:
+        names = [f"f{n}" for n in range(len(fields))]
+
+    formats = []
+    for code, converter in fields:
+        if converter not in (None, bytes):
+            raise ValueError(f"Cannot convert values with {converter} in a structured array.")
+        if code in _numpy_codes:
+            formats.append(_numpy_codes[code])
+        else:
+            # Raw bytes, like "25s"
+            formats.append("V" + code[:-1])
+    return np.dtype(dict(names=names, formats=formats))
+
+
+def is_columnar(structure):
+    """
+    Whether a list structure can be read as a structured array.
+    """
+    return isinstance(structure, list) \
+        and isinstance(structure[0], dict) \
+        and b.fixed_width_fields(structure[0]) is not None \
+        and structure_dtype(structure[0]).itemsize > 0
+
+
+def read_section(reader, structure):
+    """
+    Reads a list of fixed-width records as a structured array. Accepts the same list structures as
+    BinReader.fpop_structure.
+    :return: A read-only numpy structured array.
+    """
+    dtype = structure_dtype(structure[0])
+    if len(structure) == 1:
+        count = reader.fpop(b.UINT)
+    elif isinstance(structure[1], int):
+        count = structure[1]
+    elif isinstance(structure[1], b.DataFormat):
+        count = reader.fpop(*structure[1])
+    else:
+        raise TypeError(f"Second element in list must by int or DataFormat, not {type(structure[1])}")
+    return np.frombuffer(reader.read(count * dtype.itemsize), dtype)
+
+
+def write_section(writer, records, structure):
+    """
+    Writes a list of fixed-width records, which can be a structured array, a list of records taken from one, or a list
+    of dicts. Accepts the same list structures as BinWriter.write_structure.
+    """
+    if not isinstance(records, np.ndarray):
+        if len(records) != 0 and isinstance(records[0], np.void):
+            # Records taken out of a structured array, e.g. by bulk_parser.zip_passes
+            records = np.array(list(records), dtype=records[0].dtype)
+        else:
+            writer.write_compiled(records, structure)
+            return
+    if len(structure) == 1:
+        writer.translate(len(records), b.UINT)
+    elif isinstance(structure[1], b.DataFormat):
+        writer.translate(len(records), structure[1])
+    writer.write(records.astype(structure_dtype(structure[0]), copy=False).tobytes())
+
+
+def to_records(array):
+    """
+    Converts a structured array back into a list of dicts, exactly as BinReader.fpop_structure would have returned
+    them.
+    """
+    names = array.dtype.names
+    return [dict(zip(names, values)) for values in array.tolist()]
+
+
+def to_native(o):
+    """
+    Converts a structured array, or a record taken from one, into a list of dicts or a dict. Also turns BytesViews into
+    bytes, so it can be used as the default of bjson.dump.
+    """
+    if isinstance(o, np.ndarray):
+        return to_records(o)
+    elif isinstance(o, np.void):
+        return dict(zip(o.dtype.names, o.item()))
+    elif isinstance(o, b.BytesView):
+        return bytes(o)
+    else:
+        raise TypeError(f"Object of type {type(o).__name__} is not a structured array or record")
+
+
+class ColumnarJSONEncoder(b.BytesJSONEncoder):
+    """
+    A BytesJSONEncoder that also writes structured arrays, and records taken from them, as ordinary JSON objects.
+    """
+    def default(self, o):
+        if isinstance(o, (np.ndarray, np.void)):
+            return to_native(o)
+        else:
+            return super().default(o)
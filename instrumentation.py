@@ -0,0 +1,403 @@
+"""
+Measures how long each section of each pass takes to read or write, how many bytes and records it has, and how much
+memory it allocates, for serial_to_json.py and json_to_serial.py's --report option.
+
+Sections are timed from the moment their offset is put in locations, which is the first thing bulk_parser.iter_bulk
+and bulk_writer.write_bulk do for every section, so a list from Instrument.locations is passed in place of the usual
+one. Reading a section ends when iter_bulk hands it over (see Instrument.iter_sections), and writing one when the next
+one starts. bulk_writer.write_bulk_sections records the locations while copying finished sections into place rather
+than while writing them, so it's given the Instrument itself instead.
+
+The compiled decoders and encoders in binarizer.py read and write whole records at once, rather than calling fpop and
+translate for every value, so the number of values of each DataFormat is counted afterwards from the structures and
+the data. Fixed-shape structures are only counted once, and multiplied up.
+
+Allocations are traced with tracemalloc, which makes everything a few times slower, so the times are only comparable
+with other runs with or without it. The garbage collector is turned off while they're traced, as otherwise whichever
+section it happened to run in would be charged with freeing what earlier ones left behind. A cProfile profile can be
+made of a single section.
+"""
+
+import collections
+import contextlib
+import cProfile
+import gc
+import platform
+import sys
+import time
+import tracemalloc
+import binarizer as b
+import bulk_reader_tools
+from bulk_parser import record_structures
+from bulk_reader_tools import *
+
+REPORT_VERSION = 1
+
+# Names of the DataFormats defined once and shared between structures
+_format_names = {id(value): name for module in (b, bulk_reader_tools) for name, value in vars(module).items()
+                 if isinstance(value, b.DataFormat)}
+
+
+def format_name(structure):
+    """
+    :return: The name a DataFormat is given in reports: its name in binarizer.py or bulk_reader_tools.py, or a
+    description of it.
+    """
+    try:
+        return _format_names[id(structure)]
+    except KeyError:
+        until = structure.until
+        if isinstance(until, int) and structure.from_bytes is None:
+            return f"bytes[{until}]"
+        elif until is None:
+            return "bytes"
+        elif isinstance(until, (int, bytes)):
+            return f"DataFormat({until!r}, {getattr(structure.from_bytes, '__name__', structure.from_bytes)})"
+        return "DataFormat(pattern)"
+
+
+def _static_counts(structure):
+    """
+    :return: A Counter of the formats of every value in a structure, or None if that depends on the data, because it
+    has lists without a fixed length.
+    """
+    counts = collections.Counter()
+    if isinstance(structure, b.DataFormat):
+        counts[format_name(structure)] += 1
+    elif isinstance(structure, (dict, tuple)):
+        for substructure in structure.values() if isinstance(structure, dict) else structure:
+            substructure_counts = _static_counts(substructure)
+            if substructure_counts is None:
+                return None
+            counts += substructure_counts
+    elif len(structure) == 2 and isinstance(structure[1], int):
+        item_counts = _static_counts(structure[0])
+        if item_counts is None:
+            return None
+        for name, count in item_counts.items():
+            counts[name] += count * structure[1]
+    else:
+        return None
+    return counts
+
+
+_static_counts_cache = {}
+
+
+def count_formats(structure, value, counts):
+    """
+    Adds the number of values of each DataFormat in value, read or written with structure, to counts.
+    :param counts: A Counter.
+    """
+    try:
+        static = _static_counts_cache[id(structure)]
+    except KeyError:
+        static = _static_counts_cache[id(structure)] = _static_counts(structure)
+    if static is not None:
+        counts.update(static)
+    elif isinstance(structure, dict):
+        # As in BinWriter.write_structure, the values are matched up with the structure by their order
+        for substructure, item in zip(structure.values(), value.values()):
+            count_formats(substructure, item, counts)
+    elif isinstance(structure, tuple):
+        for substructure, item in zip(structure, value):
+            count_formats(substructure, item, counts)
+    else:
+        if len(structure) == 1 or isinstance(structure[1], b.DataFormat):
+            counts[format_name(structure[1] if len(structure) == 2 else b.UINT)] += 1
+        count_records(structure[0], value, counts)
+
+
+def count_records(structure, records, counts):
+    """
+    Adds the formats of a list of records that all have the same structure to counts.
+    """
+    try:
+        static = _static_counts_cache[id(structure)]
+    except KeyError:
+        static = _static_counts_cache[id(structure)] = _static_counts(structure)
+    if static is not None:
+        for name, count in static.items():
+            counts[name] += count * len(records)
+    else:
+        for record in records:
+            count_formats(structure, record, counts)
+
+
+def _list_count_format(pass_number, key):
+    # The format of the length at the start of a list section, or None if it has the same number as the first pass
+    if pass_number != 0:
+        return None
+    elif key in ("actions", "notifications"):
+        return b.UINT
+    structure = bulk_reader_tools.first_pass_structure_2.get(key) or first_pass_structure_1.get(key)
+    if len(structure) == 1:
+        return b.UINT
+    return structure[1] if isinstance(structure[1], b.DataFormat) else None
+
+
+def section_formats(pass_number, key, value, first_pass=None):
+    """
+    Counts the values of each DataFormat in one section of one pass.
+    :param first_pass: The first-pass records of the same section, or at least their "path" or "type", for actions
+    and notifications after the first pass.
+    :return: A Counter.
+    """
+    counts = collections.Counter()
+    if key == "world_params":
+        count_formats(world_params_structure if pass_number == 0 else dict(current_player=b.UINT), value, counts)
+    elif key == "events":
+        counts[format_name(b.UINT)] += 1
+    elif key == "quests" and pass_number == 1:
+        counts["bytes"] += 1
+    elif key == "tiles" and pass_number == 2:
+        # The dummy pass, which isn't in the file at all
+        pass
+    else:
+        count_format = _list_count_format(pass_number, key)
+        if count_format is not None:
+            counts[format_name(count_format)] += 1
+        if key == "quests":
+            count_records(quest_structure, value, counts)
+        elif key in ("actions", "notifications"):
+            # The structure of each record depends on the first pass, so records are grouped by structure
+            groups = {}
+            for record, first_pass_record in zip(value, value if pass_number == 0 else first_pass):
+                structure = _record_structure(pass_number, key, record, first_pass_record)
+                groups.setdefault(id(structure), (structure, []))[1].append(record)
+            for structure, records in groups.values():
+                count_records(structure, records, counts)
+        else:
+            count_records(record_structures[pass_number][key], value, counts)
+    return counts
+
+
+def _record_structure(pass_number, key, record, first_pass_record):
+    if key == "actions":
+        if pass_number == 0:
+            return action_cycle_weapon_structure if record["path"].endswith("CycleWeapon") else action_structure
+        elif is_weapon(first_pass_record["path"]):
+            return action2_weapon_structure
+        return action2_normal_structure
+    elif pass_number == 0:
+        return notification_structures[record["type"]]
+    return notification2_structures[first_pass_record["type"]]
+
+
+class _Locations(dict):
+    """
+    One pass of a locations list, which tells an Instrument whenever a section starts.
+    """
+    def __init__(self, instrument, pass_number):
+        super().__init__()
+        self.instrument = instrument
+        self.pass_number = pass_number
+
+    def __setitem__(self, key, offset):
+        super().__setitem__(key, offset)
+        self.instrument.start(self.pass_number, key, offset)
+
+
+class Instrument(object):
+    """
+    Collects measurements of every section. Call begin before reading or writing anything, and finish afterwards.
+    """
+    def __init__(self, allocations=True, profile_section=None):
+        """
+        :param allocations: Trace allocations with tracemalloc.
+        :param profile_section: Profile only this section with cProfile: either a key such as "units", for every pass,
+        or a (pass number, key) tuple.
+        """
+        self.allocations = allocations
+        if isinstance(profile_section, str):
+            profile_section = (None, profile_section)
+        self.profile_section = profile_section
+        self.profiler = cProfile.Profile() if profile_section is not None else None
+        self.sections = []
+        self._current = None
+        self._first_pass = {}
+        self._started = None
+        self.seconds = None
+        self.peak_bytes = None
+        self._gc_was_enabled = False
+
+    def locations(self):
+        """
+        :return: A list to pass as locations to bulk_parser.iter_bulk or bulk_writer.write_bulk, which can be used in
+        the same way as the usual list of five dicts.
+        """
+        return [_Locations(self, pass_number) for pass_number in range(5)]
+
+    def begin(self):
+        if self.allocations:
+            self._gc_was_enabled = gc.isenabled()
+            gc.disable()
+            tracemalloc.start()
+        self._started = time.perf_counter()
+
+    def _profiling(self, pass_number, key):
+        if self.profile_section is None:
+            return False
+        profile_pass, profile_key = self.profile_section
+        return key == profile_key and profile_pass in (None, pass_number)
+
+    def start(self, pass_number, key, offset=None):
+        """
+        Starts timing a section, and stops timing the last one if it's still going.
+        """
+        current = self._current
+        if current is not None and current["section"] is None:
+            # Started by iter_sections before it knew which section was coming
+            current.update(pass_number=pass_number, section=key, offset=offset)
+            if self._profiling(pass_number, key):
+                self.profiler.enable()
+            return
+        if current is not None:
+            self.stop(end=offset)
+        entry = dict(pass_number=pass_number, section=key, offset=offset)
+        if self.allocations:
+            entry["allocated_bytes"] = -tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        if self._profiling(pass_number, key):
+            self.profiler.enable()
+        self._current = entry
+        entry["seconds"] = -time.perf_counter()
+
+    def stop(self, value=None, end=None):
+        """
+        Stops timing the current section.
+        :param value: The contents of the section, to count its records and values. If not given, they're not counted.
+        :param end: Where the section ends, to work out its size. If not given, it's taken from where the next section
+        starts.
+        """
+        entry = self._current
+        entry["seconds"] += time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            # Relative to what was allocated when the section started
+            entry["peak_bytes"] = peak + entry["allocated_bytes"]
+            entry["allocated_bytes"] += current
+        entry["bytes"] = end - entry["offset"] if end is not None and entry["offset"] is not None else None
+        self._current = None
+        if value is not None:
+            self.count(entry, value)
+        self.sections.append(entry)
+
+    def count(self, entry, value):
+        pass_number, key = entry["pass_number"], entry["section"]
+        # Columnar sections are NumPy structured arrays, as in bulk_writer._is_numpy
+        numpy = type(value).__module__ == "numpy" or (isinstance(value, list) and len(value) != 0
+                                                       and type(value[0]).__module__ == "numpy")
+        entry["records"] = len(value) if numpy or isinstance(value, (list, tuple)) else None
+        counts = section_formats(pass_number, key, value, self._first_pass.get(key))
+        entry["formats"] = dict(counts)
+        if pass_number == 0 and key in ("actions", "notifications"):
+            field = "path" if key == "actions" else "type"
+            self._first_pass[key] = [{field: record[field]} for record in value]
+
+    @contextlib.contextmanager
+    def section(self, pass_number, key, binary, value):
+        """
+        Measures writing one section to binary, a BinWriter, in a with block.
+        """
+        # binary is usually a temporary file, so the offset is left for finish to fill in from locations
+        start = binary.tell()
+        self.start(pass_number, key)
+        yield
+        self.stop(value)
+        self.sections[-1]["bytes"] = binary.tell() - start
+
+    def iter_sections(self, sections, tell=None):
+        """
+        Times each section from bulk_parser.iter_bulk up to when it's handed over, leaving out whatever's done with it
+        afterwards.
+        :param sections: The generator from iter_bulk, reading into a list from locations.
+        :param tell: A function that returns the current position in the bulk data, to find where the last section
+        ends. Without it, the size of the last section is unknown.
+        """
+        sections = iter(sections)
+        while True:
+            # Anything that isn't in locations, such as the dummy third-pass tiles, is timed from here
+            self.start(None, None)
+            try:
+                pass_number, key, value = next(sections)
+            except StopIteration:
+                self._current = None
+                if self.profiler is not None:
+                    self.profiler.disable()
+                return
+            if self._current["section"] is None:
+                self._current.update(pass_number=pass_number, section=key)
+                self.stop(value)
+                self.sections[-1]["bytes"] = 0
+            else:
+                self.stop(value, tell() if tell is not None else None)
+            yield pass_number, key, value
+            # Otherwise the section would only be freed by the next call to next(sections), and the next section would
+            # be charged with it
+            del key, value
+
+    def finish(self, end=None, passes=None, locations=None):
+        """
+        Stops timing everything.
+        :param end: Where the last section ends, if it's still being timed.
+        :param passes: The five passes that were written, as given to bulk_writer.write_bulk, to count the records and
+        values of sections that were timed without seeing their contents.
+        :param locations: Where every section starts, for the sections whose offsets weren't known when they were
+        written.
+        """
+        if self._current is not None:
+            self.stop(end=end)
+        self.seconds = time.perf_counter() - self._started
+        if self.allocations:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if self._gc_was_enabled:
+                gc.enable()
+        # The sections are in the order they are in the file, so any size that isn't known yet is up to where the
+        # next one starts
+        located = [entry for entry in self.sections if entry["offset"] is not None]
+        for entry, following in zip(located, located[1:]):
+            if entry["bytes"] is None:
+                entry["bytes"] = following["offset"] - entry["offset"]
+        if locations is not None:
+            for entry in self.sections:
+                if entry["offset"] is None and entry["pass_number"] is not None:
+                    entry["offset"] = locations[entry["pass_number"]].get(entry["section"])
+        if passes is not None:
+            for entry in self.sections:
+                if "formats" not in entry:
+                    self.count(entry, passes[entry["pass_number"]][entry["section"]])
+
+    def report(self, **details):
+        """
+        :param details: Anything else to put in the report, such as the input and output paths.
+        :return: A dict of everything measured, ready for json.dump.
+        """
+        totals = collections.Counter()
+        for entry in self.sections:
+            totals.update(entry.get("formats", {}))
+        return dict(version=REPORT_VERSION,
+                    python=sys.version.split()[0],
+                    platform=platform.platform(),
+                    allocations=self.allocations,
+                    seconds=self.seconds,
+                    peak_bytes=self.peak_bytes,
+                    **details,
+                    formats=dict(totals),
+                    sections=self.sections)
+
+    def dump_profile(self, path):
+        self.profiler.dump_stats(path)
+
+
+def parse_section(text):
+    """
+    Reads a section to profile from the command line, either "key" or "pass:key".
+    """
+    if ":" in text:
+        pass_number, key = text.split(":", 1)
+        return int(pass_number), key
+    return text
@@ -1,4 +1,12 @@
+import os
+import tempfile
 from bulk_reader_tools import *
+import binarizer as b
+import bulk_parser
+import bulk_writer
+import references
+import savegame_tools
+import spatial_index
 
 testing = True
 
@@ -10,103 +18,420 @@ output_path = r"C:\Users\rosa\Documents\Proxy Studios\Gladius\SavedGames\SingleP
 
 
 class GladiusSave(object):
+    """
+    An editable saved game, in the same form as the json files.
+
+    Every section whose objects have ids is indexed by id, so looking up and deleting objects takes the same time no
+    matter how big the save is. Deleted objects are replaced with None in their section ("tombstones") rather than
+    being taken out of the list straight away, and the sections are only tidied up when the data is next handed out
+    through the data attribute.
+
+    The indexes can't see changes made directly to the data, so they're thrown away and rebuilt whenever the data is
+    handed out. Within this class, self._data is used instead.
+
+    A save loaded from a .bin file keeps hold of it, and remembers which passes of which sections have been changed
+    ("dirty" sections) since, so that saving it as a .bin file only has to write those again. Everything else is
+    copied from the original; see bulk_writer.splice_bulk. The methods of this class mark what they change, but
+    changes made to the entries from get or entries have to be marked with mark_dirty, and handing out the data marks
+    everything.
+    """
 
     def __init__(self, data):
-        self.data = data
+        self._data = data
+        # Section name -> {id: entry} and {id: position in the section}, built when first needed
+        self._entries = {}
+        self._positions = {}
+        # Section name -> number of tombstones in the section
+        self._tombstones = {}
+        # Built when first needed, see spatial_index
+        self._spatial_index = None
+        # The .bin file the data was read from, as a BinReader, and where every section starts in it
+        self._original = None
+        self._original_locations = None
+        # (pass_number, section name) of every section changed since it was read, or None if that isn't known
+        self._dirty = None
+
+    @property
+    def data(self):
+        self._compact()
+        # Whoever we give the data to might change it behind our back
+        self._entries.clear()
+        self._positions.clear()
+        self._spatial_index = None
+        self._dirty = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self.close()
+        self.__init__(data)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a .json or .bjson file, as written by serial_to_json.py, or a .bin file.
+        """
+        if os.path.splitext(path)[1].lower() != ".bin":
+            return cls(savegame_tools.read_data(path))
+        locations = [{}, {}, {}, {}, {}]
+        with open(path, 'rb') as file:
+            binary = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+        save = cls(bulk_parser.zip_passes(bulk_parser.parse_bulk(binary, locations)))
+        save._set_original(binary, locations)
+        return save
+
+    def _set_original(self, binary, locations):
+        self.close()
+        self._original = binary
+        self._original_locations = locations
+        self._dirty = set()
+
+    def close(self):
+        """
+        Lets go of the .bin file the save was read from, if there is one. Saving as a .bin file will then write
+        everything again.
+        """
+        if self._original is not None:
+            self._original.close()
+        self._original = None
+        self._original_locations = None
+        self._dirty = None
 
-    def get(self, type_, id_):
-        if self.data[type_][id_][0]["id"] == id_:
-            return self.data[type_][id_]
-        else:
-            gen = (x for x in self.data[type_] if x[0]["id"] == id_)
-            return next(gen)
+    def save(self, path):
+        """
+        Writes a .json or .bjson file, depending on the extension, ready for json_to_serial.py, or a .bin file. A
+        .bin file is written by copying every section that hasn't been changed from the .bin file the save was read
+        from, if there was one, and then takes its place, so that the next save only writes what's changed since.
+        """
+        self._compact()
+        if os.path.splitext(path)[1].lower() != ".bin":
+            savegame_tools.write_data(self._data, path)
+            return
 
-    def delete_action(self, action_id):
+        locations = [{}, {}, {}, {}, {}]
+        if self._dirty is None:
+            passes = bulk_writer.unzip_passes(self._data)
+        else:
+            # Only the sections that are written again are needed
+            passes = bulk_writer.unzip_passes({key: self._data[key] for key in {key for _, key in self._dirty}})
+        # Written next to the destination and moved into place, as it might be the original
+        handle, temporary_path = tempfile.mkstemp(".bin", dir=os.path.dirname(os.path.abspath(path)))
         try:
-            action = self.get("actions", action_id)
-        except StopIteration:
+            with open(handle, 'wb', buffering=0) as raw:
+                # noinspection PyTypeChecker
+                binary = b.BinWriter(raw)
+                if self._dirty is None:
+                    bulk_writer.write_bulk(binary, passes, locations)
+                else:
+                    bulk_writer.splice_bulk(binary, passes, self._original, self._original_locations, self._dirty,
+                                            locations)
+                binary.close()
+            self.close()
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        with open(path, 'rb') as file:
+            self._set_original(b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ), locations)
+
+    @property
+    def dirty(self):
+        """
+        A set of (pass_number, section name) for every section that has changed since the save was read from or last
+        saved to a .bin file, or None if that isn't known.
+        """
+        return self._dirty
+
+    def mark_dirty(self, type_, pass_number=None):
+        """
+        Records that a section has been changed, so that it's written again when the save is next saved as a .bin
+        file.
+        :param type_: The section, such as "units".
+        :param pass_number: The pass that's changed, or None for every pass.
+        """
+        if self._dirty is None:
             return
-        except IndexError:
+        if pass_number is None:
+            self._dirty.update((n, type_) for n in range(5))
+        else:
+            self._dirty.add((pass_number, type_))
+
+    def references(self):
+        """
+        :return: A references.ReferenceGraph of the data as it is now, for finding what refers to an object.
+        """
+        return references.ReferenceGraph(self._data)
+
+    def check_integrity(self):
+        """
+        :return: A list of every references.Problem with the data as it is now.
+        """
+        return references.check_integrity(self._data)
+
+    def spatial_index(self):
+        """
+        :return: A spatial_index.SpatialIndex for finding the units, features and buildings near a place on the map.
+        It's kept up to date by the methods of this class, but not by changes made directly to the data.
+        """
+        if self._spatial_index is None:
+            self._spatial_index = spatial_index.SpatialIndex(self._data)
+        return self._spatial_index
+
+    def _update_spatial_index(self, type_, entry=None, id_=None):
+        """
+        Tells the spatial index, if there is one, that an object has been added (entry is given) or deleted (id_ is
+        given).
+        """
+        if self._spatial_index is None:
             return
-        linked_traits = action[1]["linked_traits"].copy()
-        self.data["actions"].remove(action)
-        for trait_id in linked_traits:
-            self.delete_trait(trait_id)
+        if type_ == "tiles":
+            # Moving tiles around is rare enough that starting again is simplest
+            self._spatial_index = None
+        elif type_ in ("units", "features"):
+            if entry is not None:
+                self._spatial_index.place(type_, entry[0]["id"], spatial_index.tile_of(type_, entry))
+            else:
+                self._spatial_index.remove(type_, id_)
+        elif type_ == "buildings" and id_ is not None:
+            self._spatial_index.remove(type_, id_)
+
+    def _compact(self):
+        """
+        Takes the tombstones out of every section.
+        """
+        for type_ in [type_ for type_, count in self._tombstones.items() if count]:
+            self._data[type_] = [entry for entry in self._data[type_] if entry is not None]
+            self._tombstones[type_] = 0
+            if type_ in self._positions:
+                self._positions[type_] = {entry[0]["id"]: position
+                                          for position, entry in enumerate(self._data[type_])}
+
+    def _index(self, type_):
+        """
+        :return: The id -> entry index of a section, building it if need be.
+        """
+        try:
+            return self._entries[type_]
+        except KeyError:
+            pass
+        entries = {}
+        positions = {}
+        for position, entry in enumerate(self._data[type_]):
+            if entry is not None:
+                entries[entry[0]["id"]] = entry
+                positions[entry[0]["id"]] = position
+        self._entries[type_] = entries
+        self._positions[type_] = positions
+        return entries
+
+    def entries(self, type_):
+        """
+        Iterates over every object in a section, skipping deleted ones. The section mustn't be changed while
+        iterating.
+        """
+        return (entry for entry in self._data[type_] if entry is not None)
+
+    def get(self, type_, id_):
+        """
+        :param type_: The section, such as "units".
+        :param id_: The id of the object.
+        :return: The object's entry: a list with one dict for each pass.
+        :raises KeyError: if there's no such object.
+        """
+        return self._index(type_)[id_]
+
+    def position(self, type_, id_):
+        """
+        :return: Where the object with the given id is in its section, counting deleted objects that haven't been
+        tidied away yet.
+        """
+        self._index(type_)
+        return self._positions[type_][id_]
+
+    def __contains__(self, item):
+        """
+        (type_, id_) in save: Whether there's an object with the given id in the given section.
+        """
+        type_, id_ = item
+        return id_ in self._index(type_)
+
+    def add(self, type_, entry):
+        """
+        Adds an object to the end of a section.
+        :param entry: A list with one dict for each pass. The first one must have an id that isn't already used.
+        """
+        index = self._index(type_)
+        id_ = entry[0]["id"]
+        if id_ in index:
+            raise ValueError(f"There is already an object with id {id_} in {type_}.")
+        self._positions[type_][id_] = len(self._data[type_])
+        self._data[type_].append(entry)
+        index[id_] = entry
+        self.mark_dirty(type_)
+        self._update_spatial_index(type_, entry=entry)
+
+    def remove(self, type_, id_):
+        """
+        Takes an object out of its section, without touching anything that refers to it.
+        :return: The object's entry.
+        :raises KeyError: if there's no such object.
+        """
+        entry = self._index(type_).pop(id_)
+        self._data[type_][self._positions[type_].pop(id_)] = None
+        self._tombstones[type_] = self._tombstones.get(type_, 0) + 1
+        self.mark_dirty(type_)
+        self._update_spatial_index(type_, id_=id_)
+        return entry
+
+    def set_section(self, type_, entries):
+        """
+        Replaces the whole of a section.
+        """
+        self._data[type_] = entries
+        self._entries.pop(type_, None)
+        self._positions.pop(type_, None)
+        self._tombstones[type_] = 0
+        self.mark_dirty(type_)
+        if self._spatial_index is not None:
+            if type_ == "tiles":
+                self._spatial_index = None
+            elif type_ in spatial_index.indexed_types:
+                self._spatial_index.reindex(type_, self._data)
+
+    def _dependents(self, type_, entry):
+        """
+        :return: A generator of (type_, id_) for the objects that have to be deleted along with the given one. Some of
+        them might not exist.
+        """
+        if type_ == "actions":
+            for trait_id in entry[1]["linked_traits"]:
+                yield "traits", trait_id
+        elif type_ == "traits":
+            if len(entry) > 2:
+                yield "actions", entry[2]["linked_action"]
+        elif type_ == "features":
+            for name, trait_id in entry[1]["traits"]:
+                yield "traits", trait_id
+        elif type_ == "units":
+            for action_id in entry[1]["actions"]:
+                yield "actions", action_id
+            for trait in entry[1]["traits"]:
+                yield "traits", trait["id"]
+            for weapon_id in entry[1]["weapons"]:
+                yield "weapons", weapon_id
+            # Delete everything this unit is transporting
+            for subunit_id in entry[1]["transported_units"]:
+                yield "units", subunit_id
+        elif type_ == "weapons":
+            for trait in entry[1]["traits"]:
+                yield "traits", trait["id"]
+        elif type_ == "magic_items":
+            for action_id in entry[1]["actions"]:
+                yield "actions", action_id
+
+    def delete_many(self, objects, compact=True):
+        """
+        Deletes any number of objects at once, along with everything that depends on them: the actions, traits and
+        weapons of units, the units in transports, and so on. Objects that don't exist are skipped.
+        :param objects: An iterable of (type_, id_), such as [("units", 12), ("units", 15), ("features", 3)].
+        :param compact: Whether to take the tombstones out of the sections straight away, which means rebuilding each
+        section that was touched. Otherwise it's done the next time the data is handed out.
+        :return: A dict mapping each section to the set of ids deleted from it.
+        """
+        worklist = list(objects)
+        deleted = {}
+        deleted_units = []
+        # Does the same as self.remove, but only looks up each section's indexes once
+        sections = {}
+        while worklist:
+            type_, id_ = worklist.pop()
+            try:
+                entries, positions, section, ids = sections[type_]
+            except KeyError:
+                if type_ not in self._data:
+                    continue
+                sections[type_] = (self._index(type_), self._positions[type_], self._data[type_],
+                                   deleted.setdefault(type_, set()))
+                entries, positions, section, ids = sections[type_]
+            entry = entries.pop(id_, None)
+            if entry is None:
+                continue
+            section[positions.pop(id_)] = None
+            ids.add(id_)
+            if type_ == "units":
+                deleted_units.append(entry)
+            worklist.extend(self._dependents(type_, entry))
+
+        deleted = {type_: ids for type_, ids in deleted.items() if ids}
+        for type_, ids in deleted.items():
+            self._tombstones[type_] = self._tombstones.get(type_, 0) + len(ids)
+            self.mark_dirty(type_)
+            for id_ in ids:
+                self._update_spatial_index(type_, id_=id_)
+
+        for unit in deleted_units:
+            unit_id = unit[0]["id"]
+            # If this unit was in a transport that's still there, remove it from the transport.
+            transport_id = unit[1]["transport"]
+            if transport_id != -1 and ("units", transport_id) in self:
+                self.get("units", transport_id)[1]["transported_units"].remove(unit_id)
+                self.mark_dirty("units", 1)
+            # Leave the tile it was on empty, as move_unit does
+            tile_id = spatial_index.tile_of("units", unit)
+            if tile_id != -1 and ("tiles", tile_id) in self:
+                tile = self.get("tiles", tile_id)
+                if tile[3]["unit"] == unit_id:
+                    tile[3]["unit"] = -1
+                    self.mark_dirty("tiles", 3)
+
+        if compact:
+            self._compact()
+        return deleted
+
+    def delete_action(self, action_id):
+        self.delete_many([("actions", action_id)], compact=False)
 
     def delete_trait(self, trait_id):
-        try:
-            trait = self.get("traits", trait_id)
-        except StopIteration:
-            return
-        except IndexError:
-            return
-        linked_action_id = trait[1]["linked_action"]
-        self.data["traits"].remove(trait)
-        self.delete_trait(linked_action_id)
+        self.delete_many([("traits", trait_id)], compact=False)
 
     def delete_player(self, player_id):
         player = self.get("players", player_id)
 
     def delete_feature(self, feature_id):
-        try:
-            feature = self.get("features", feature_id)
-        except StopIteration:
-            return
-        except IndexError:
-            return
-        for trait_id in feature[1]["traits"]:
-            self.delete_trait(trait_id)
-        self.data["features"].remove(feature)
+        self.delete_many([("features", feature_id)], compact=False)
 
     def delete_unit(self, unit_id, via_transport=False):
-        # via_transport: This unit deletion is occuring as a result of the parent transport being deleted,
-        # so there is no need to also delete the unit from the parent transport's list.
-        try:
-            unit = self.get("units", unit_id)
-        except StopIteration:
-            return
-        except IndexError:
-            return
-        for action_id in unit[1]["actions"]:
-            self.delete_action(action_id)
-        for trait_id in (dict_["id"] for dict_ in unit[1]["traits"]):
-            self.delete_trait(trait_id)
-        for weapon_id in unit[1]["weapons"]:
-            self.delete_weapon(weapon_id)
-
-        if unit[1]["transport"] != -1 and not via_transport:
-            # If this unit is in a transport, remove it from the transport.
-            # The via_transport parameter skips this bit to avoid altering a list while iterating over it
-            transport = self.get("units", unit[1]["transport"])
-            transport[1]["transported_units"].remove(unit_id)
-
-        for subunit_id in unit[1]["transported_units"]:
-            # Delete everything this unit is transporting
-            self.delete_unit(subunit_id, via_transport=True)
-
-
+        # via_transport is no longer needed, as delete_many only takes units out of transports that are still there
+        self.delete_many([("units", unit_id)], compact=False)
 
     def delete_weapon(self, weapon_id):
-        try:
-            weapon = self.get("weapons", weapon_id)
-        except StopIteration:
-            return
-        except IndexError:
-            return
-        for trait_id in (dict_["id"] for dict_ in weapon[1]["traits"]):
-            self.delete_trait(trait_id)
-        self.data["weapons"].remove(weapon)
+        self.delete_many([("weapons", weapon_id)], compact=False)
 
     def delete_magic_item(self, magic_item_id):
-        try:
-            magic_item = self.get("magic_items", magic_item_id)
-        except StopIteration:
-            return
-        except IndexError:
-            return
-        for action_id in magic_item[1]["actions"]:
-            self.delete_action(action_id)
-        self.data["magic_items"].remove(magic_item)
+        self.delete_many([("magic_items", magic_item_id)], compact=False)
+
+    def move_unit(self, unit_id, tile_id):
+        """
+        Moves a unit to another tile, leaving the tile it was on empty. Nothing else is checked, such as whether the
+        new tile already has a unit on it.
+        """
+        unit = self.get("units", unit_id)
+        old_tile_id = unit[3]["tile_id"]
+        if old_tile_id != -1 and ("tiles", old_tile_id) in self:
+            old_tile = self.get("tiles", old_tile_id)
+            if old_tile[3]["unit"] == unit_id:
+                old_tile[3]["unit"] = -1
+        unit[3]["tile_id"] = tile_id
+        self.get("tiles", tile_id)[3]["unit"] = unit_id
+        self.mark_dirty("units", 3)
+        self.mark_dirty("tiles", 3)
+        self._update_spatial_index("units", entry=unit)
+
+    def delete_player_units(self, player_id):
+        """
+        Deletes every unit owned by a player.
+        """
+        self.delete_many([("units", unit[0]["id"]) for unit in self.entries("units") if unit[1]["owner"] == player_id])
 
     def change_player_faction(self, player_id, new_faction):
         pass
@@ -123,9 +448,9 @@ class GladiusSave(object):
         """
 
         if new_terrain_type is not None:
-            [self.delete_feature(feature[0]["id"]) for feature in self.data["features"]]
+            self.delete_many([("features", feature[0]["id"]) for feature in self.entries("features")], compact=False)
 
-            self.data["features"] = [
+            self.set_section("features", [
                 [
                     {
                         "id": tile[0]["id"],
@@ -142,11 +467,12 @@ class GladiusSave(object):
                         "tile_id": tile[0]["id"]
                     }
                 ]
-                for tile in self.data["tiles"]]
+                for tile in self.entries("tiles")])
 
         if new_terrain_height is not None:
-            for tile in self.data["tiles"]:
+            for tile in self.entries("tiles"):
                 tile[0]["height"] = new_terrain_height
+            self.mark_dirty("tiles", 0)
 
     def reset_to_start(self):
         # Set turn number to 0
@@ -165,28 +491,28 @@ class GladiusSave(object):
         pass
 
     def clear_notifications(self):
-        self.data["notifications"] = [[], [], [], [], []]
+        # Notifications are zipped, like units, so no notifications is an empty list rather than five empty passes
+        self.set_section("notifications", [])
 
     def clear_quests(self):
-        self.data["quests"] = [[], []]
+        self.set_section("quests", [[], []])
 
     def clear_climates(self):
-        self.data["climates"] = [[]]
+        self.set_section("climates", [[]])
 
     def reveal_map(self, player_id):
         player = self.get("players", player_id)
-        player[1]["tiles_revealed"] = [tile[0]["id"] for tile in self.data["tiles"]]
+        player[1]["tiles_revealed"] = [tile[0]["id"] for tile in self.entries("tiles")]
+        self.mark_dirty("players", 1)
 
     def hide_map(self, player_id):
         player = self.get("players", player_id)
         player[1]["tiles_revealed"] = player[1]["tiles_watched"]
+        self.mark_dirty("players", 1)
 
 
-if testing:
-    import json
-    with open(input_path, "r") as file:
-        gs = GladiusSave(json.load(file, object_hook=b.bytes_object_hook))
+if __name__ == "__main__" and testing:
+    gs = GladiusSave.load(input_path)
 
     def save(gs):
-        with open(output_path, "w") as file:
-            json.dump(gs.data, file, cls=b.BytesJSONEncoder, indent="    ")
+        gs.save(output_path)
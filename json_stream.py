@@ -0,0 +1,163 @@
+"""
+Reads and writes the json files one top-level section at a time, so that the whole saved game never has to be in
+memory at once.
+
+dump_bulk writes each section as soon as it has been read from every pass of the bulk data, and iter_sections reads
+the sections back one by one, ready for bulk_writer.write_bulk_sections. The files are exactly the same as those
+written with json.dump.
+"""
+
+import json
+import tempfile
+from array import array
+import binarizer as b
+from bulk_parser import zippable, final_passes
+
+
+def _spool_records(encoder, records, prefix, spool_size):
+    """
+    Encodes every record in a section, and puts them in a temporary file to wait for the section's other passes.
+    :param prefix: Put at the start of every line after the first in each record, so that it's indented correctly.
+    :return: (temporary file, array of the length of each encoded record)
+    """
+    spool = tempfile.SpooledTemporaryFile(spool_size)
+    lengths = array("Q")
+    for record in records:
+        encoded = encoder.encode(record).replace("\n", "\n" + prefix).encode()
+        spool.write(encoded)
+        lengths.append(len(encoded))
+    spool.seek(0)
+    return spool, lengths
+
+
+def dump_bulk(sections, file, cls=b.BytesJSONEncoder, indent="    ", spool_size=1 << 20):
+    """
+    Writes a json file from the bulk data, exactly as
+    json.dump(bulk_parser.zip_passes(bulk_parser.parse_bulk(binary)), file, cls=cls, indent=indent)
+    would, but holding on to as little as possible. Each pass of each section is encoded as soon as it's read, and is
+    kept in a temporary file until the section is complete.
+    :param sections: The (pass_number, key, value) tuples from bulk_parser.iter_bulk.
+    :param file: A file opened in text mode.
+    :param cls: The JSON encoder to use.
+    :param indent: As in json.dump, but must be given.
+    :param spool_size: How big each temporary file can get before it's moved out of memory and onto the disk.
+    """
+    if isinstance(indent, int):
+        indent = " " * indent
+    encoder = cls(indent=indent)
+    order = []  # Sections in the order they appear in the first pass, which is how they're arranged in the json file
+    pending = {}  # The passes read so far of every section that hasn't been written yet
+    complete = set()
+    written = 0
+
+    def write(key):
+        file.write(",\n" if written else "\n")
+        file.write(indent + encoder.encode(key) + ": ")
+        passes = pending.pop(key)
+        if key not in zippable:
+            file.write(encoder.encode(passes).replace("\n", "\n" + indent))
+            return
+        if len(passes[0][1]) == 0:
+            file.write("[]")
+        else:
+            file.write("[\n" + indent * 2)
+            for n in range(len(passes[0][1])):
+                if n != 0:
+                    file.write(",\n" + indent * 2)
+                file.write("[\n" + indent * 3)
+                file.write((",\n" + indent * 3).join(spool.read(lengths[n]).decode() for spool, lengths in passes))
+                file.write("\n" + indent * 2 + "]")
+            file.write("\n" + indent + "]")
+        for spool, lengths in passes:
+            spool.close()
+
+    file.write("{")
+    for pass_number, key, value in sections:
+        if pass_number == 0:
+            order.append(key)
+            pending[key] = []
+        if key in zippable:
+            pending[key].append(_spool_records(encoder, value, indent * 3, spool_size))
+        else:
+            pending[key].append(value)
+        del value  # Save memory
+        if pass_number == final_passes[key]:
+            complete.add(key)
+        while written < len(order) and order[written] in complete:
+            write(order[written])
+            written += 1
+
+    # Anything left over, which only happens if a section turned up in fewer passes than expected
+    while written < len(order):
+        write(order[written])
+        written += 1
+    file.write("\n}" if order else "}")
+
+
+def iter_sections(file, object_hook=b.bytes_object_hook, chunk_size=1 << 20):
+    """
+    Reads a json file one top-level section at a time.
+    :param file: A file opened in text mode, holding a single JSON object.
+    :param object_hook: As in json.load.
+    :param chunk_size: How much of the file to read at once.
+    :return: A generator of (key, value), in the order they appear in the file.
+    """
+    decoder = json.JSONDecoder(object_hook=object_hook)
+    whitespace = " \t\n\r"
+    buffer = ""
+    position = 0
+    end_of_file = False
+
+    def read_more():
+        nonlocal buffer, position, end_of_file
+        # Read at least as much again as is already buffered, so that a big section is only rescanned a few times
+        data = file.read(max(chunk_size, len(buffer) - position))
+        end_of_file = data == ""
+        buffer = buffer[position:] + data
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in whitespace:
+                position += 1
+            if position < len(buffer) or end_of_file:
+                return
+            read_more()
+
+    def expect(characters):
+        skip_whitespace()
+        if position >= len(buffer) or buffer[position] not in characters:
+            found = buffer[position] if position < len(buffer) else "end of file"
+            raise json.JSONDecodeError(f"Expecting one of {characters!r}, found {found!r}", buffer, position)
+        return buffer[position]
+
+    def decode():
+        nonlocal position
+        skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+                read_more()
+                continue
+            # A number that runs up to the end of the buffer might carry on in the rest of the file
+            if end < len(buffer) or end_of_file:
+                position = end
+                return value
+            read_more()
+
+    expect("{")
+    position += 1
+    if expect('}"') == "}":
+        return
+    while True:
+        key = decode()
+        expect(":")
+        position += 1
+        yield key, decode()
+        if expect(",}") == "}":
+            return
+        position += 1
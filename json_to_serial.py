@@ -1,8 +1,12 @@
 import argparse
-import os
 import json
-import configparser
-from bulk_reader_tools import *
+import os
+import sys
+import binarizer as b
+import bulk_writer
+import json_stream
+import references
+import savegame_tools
 
 testing = False
 master_config_name = "Config.ini"
@@ -11,13 +15,8 @@ master_config_name = "Config.ini"
 test_file_name = r"C:\Users\rosa\Documents\Proxy Studios\Gladius\SavedGames\SinglePlayer\unpacked saves" \
                  r"\Enslavers.json"
 
-config = configparser.ConfigParser(allow_no_value=True)
-# Default behaviour is to make all config option names lowercase
-# We don't want to do that so we override optionxform
-config.optionxform = lambda option: option
-config.read(master_config_name)
+config = savegame_tools.read_config(master_config_name)
 
-passes = [{}, {}, {}, {}, {}]
 locations = [{}, {}, {}, {}, {}]  # Location within the bulk file of each interesting section
 
 # ==================================================================== #
@@ -26,189 +25,112 @@ locations = [{}, {}, {}, {}, {}]  # Location within the bulk file of each intere
 
 if testing:
     input_path = test_file_name
+    check = True
+    strict = False
+    report_path = None
 else:
-    parser = argparse.ArgumentParser(description="Serializes json files into the binary component of a Gladius saved "
-                                                 "game.")
+    parser = argparse.ArgumentParser(description="Serializes json or bjson files into the binary component of a "
+                                                 "Gladius saved game.")
     parser.add_argument("filename")
+    parser.add_argument("--no-check", action="store_true",
+                        help="Don't check for references to objects that don't exist before writing.")
+    parser.add_argument("--strict", action="store_true",
+                        help="Don't write anything if there are problems with references. Otherwise they're only "
+                             "printed, as some of the references listed in references.py are educated guesses.")
+    parser.add_argument("--report", metavar="PATH",
+                        help="Measure the time, size, records, allocations and values of every section and pass, and "
+                             "save them to this .json file. See instrumentation.py.")
+    parser.add_argument("--no-allocations", action="store_true",
+                        help="Don't trace allocations for --report, which slows everything down.")
+    parser.add_argument("--profile", metavar="SECTION",
+                        help="With --report, profile writing this section with cProfile, given as KEY or PASS:KEY, "
+                             "such as units or 1:units.")
+    parser.add_argument("--profile-output", metavar="PATH",
+                        help="Where to save the profile. Defaults to the output file with the extension .prof.")
     args = parser.parse_args()
     input_path = os.path.abspath(args.filename)
+    check = not args.no_check
+    strict = args.strict
+    report_path = args.report and os.path.abspath(args.report)
 
 serial_output_path = os.path.splitext(input_path)[0] + "_2.bin"
 config_output_path = os.path.splitext(input_path)[0] + "_2.ini"
 
 print(f"Serializing {os.path.basename(input_path)}")
 
-with open(input_path, "r") as file:
-    consolidated_data = json.load(file, object_hook=b.bytes_object_hook)
+instrument = None
+if report_path:
+    import instrumentation
+    instrument = instrumentation.Instrument(not args.no_allocations,
+                                            args.profile and instrumentation.parse_section(args.profile))
+    instrument.begin()
 
-raw = open(serial_output_path, 'wb', buffering=0)
-# noinspection PyTypeChecker
-binary = b.BinWriter(raw)
+# The .bin file is written under a temporary name and only moved into place once it's complete, so that a failure
+# partway, such as malformed json halfway through the file, doesn't leave half of it behind
+with savegame_tools.replacing(serial_output_path) as temporary_path, open(temporary_path, 'wb', buffering=0) as raw:
+    # noinspection PyTypeChecker
+    binary = b.BinWriter(raw)
+
+    # ============================================= #
+    # ==== Separate into passes and write them ==== #
+    # ============================================= #
+
+    # References are checked before anything is written. See references.py. Unless strict is set, any problems are
+    # only printed once the save has been written.
+    warnings = []
+    try:
+        if os.path.splitext(input_path)[1].lower() == ".json":
+            # json files are read and written one section at a time, to save memory. See json_stream.py.
+            header_data = {}
+            checker = references.IntegrityChecker()
+
+            def sections():
+                with open(input_path, "r") as file:
+                    for key, value in json_stream.iter_sections(file):
+                        if key in ("world_params", "players"):
+                            # Kept for the header
+                            header_data[key] = value
+                        if check:
+                            checker.add_section(key, value)
+                        yield key, value
+                # write_bulk_sections doesn't write anything until every section has been read
+                if check:
+                    warnings.extend(checker.raise_problems() if strict else checker.problems())
+
+            bulk_writer.write_bulk_sections(binary, sections(), locations, instrument=instrument)
+            if instrument is not None:
+                instrument.finish(locations=locations)
+        else:
+            header_data = savegame_tools.read_data(input_path)
+            if check:
+                problems = references.check_integrity(header_data)
+                warnings.extend(references.raise_problems(problems) if strict else problems)
+            passes = bulk_writer.unzip_passes(header_data)
+            if instrument is not None:
+                # Tells the instrument when each section starts
+                locations = instrument.locations()
+            bulk_writer.write_bulk(binary, passes, locations)
+            if instrument is not None:
+                instrument.finish(binary.tell(), passes)
+    except references.IntegrityError as error:
+        sys.exit(f"{error}\nNothing was written. Fix the references, or leave out --strict to write it anyway.")
+    binary.close()
+
+if warnings:
+    print(f"WARNING: {len(warnings)} problems with references, written anyway. See references.py.\n"
+          f"{references.describe_all(warnings)}")
+
+if report_path:
+    with open(report_path, 'w') as file:
+        json.dump(instrument.report(tool="json_to_serial", input=input_path, output=serial_output_path), file,
+                  indent="    ")
+    if args.profile:
+        instrument.dump_profile(args.profile_output or os.path.splitext(serial_output_path)[0] + ".prof")
 
 # ====================================================== #
 # ==== Save some data to the ini file for use later ==== #
 # ====================================================== #
 
-config_out = configparser.ConfigParser(allow_no_value=True)
-
-# Default behaviour is to make all config option names lowercase
-# We don't want to do that so we override optionxform
-config_out.optionxform = lambda option: option
-config_out.add_section("HEADER")
-config_out.add_section("MODS")
-
-# These values are stored in the master config file
-for value in ["version", "branch", "revision", "build"]:
-    config_out["HEADER"][value] = config["GLADIUS"][value]
-
-# These values are taken from the json data
-current_player_id = consolidated_data["world_params"][1]["current_player"]
-
-config_out["HEADER"]["steamuser"] = consolidated_data["players"][current_player_id][0]["name"]
-config_out["HEADER"]["turn"] = str(consolidated_data["world_params"][0]["turn_number"])
-config_out["HEADER"]["checksum"] = "0"
-config_out["HEADER"]["mod_count"] = str(len(consolidated_data["world_params"][0]["mods"]))
-
-for mod in consolidated_data["world_params"][0]["mods"]:
-    # noinspection PyTypeChecker
-    config_out["MODS"][mod] = None
-
-with open(config_output_path, 'w') as file:
-    config_out.write(file)
-
-# ============================== #
-# ==== Separate into passes ==== #
-# ============================== #
-
-zipped_keys = ["actions", "traits", "players", "tiles", "features", "cities", "building_groups", "buildings",
-               "units", "weapons", "magic_items", "notifications"]
-
-# Removed due to being hard to read
-# unzipped_data = {key: (list(zip(*value))
-#                        if (key in zipped_keys)
-#                        else value)
-#                  for key, value in consolidated_data.items()}
-
-unzipped_data = {}
-
-for key, value in consolidated_data.items():
-    if key in zipped_keys:
-        unzipped_data[key] = list(zip(*value))
-        # Pad list to length 5
-        unzipped_data[key] += [[]] * (5 - len(unzipped_data[key]))
-    else:
-        unzipped_data[key] = value
-
-for n in range(len(passes)):
-    passes[n] = {key: value[n] for key, value in unzipped_data.items() if len(value) > n}
-
-if not testing:
-    del unzipped_data
-    del consolidated_data  # Save memory
-
-# ================================ #
-# ==== First pass starts here ==== #
-# ================================ #
-
-# world parameters, climates
-for key in first_pass_structure_1:
-    locations[0][key] = binary.tell()
-    binary.write_structure(passes[0][key], first_pass_structure_1[key])
-
-# Events (always blank)
-locations[0]["events"] = binary.tell()
-binary.translate(0, b.UINT)
-
-# Actions
-locations[0]["actions"] = binary.tell()
-binary.translate(len(passes[0]["actions"]), b.UINT)
-for action in passes[0]["actions"]:
-    if action["path"].endswith("CycleWeapon"):
-        binary.write_structure(action, action_cycle_weapon_structure)
-    else:
-        binary.write_structure(action, action_structure)
-
-# Traits, players, tiles, features, cities, buildingGroups, buildings, units, weapons, items, quests.
-for key in first_pass_structure_2:
-    locations[0][key] = binary.tell()
-    binary.write_structure(passes[0][key], first_pass_structure_2[key])
-
-# Finally, notifications.
-locations[0]["notifications"] = binary.tell()
-binary.translate(len(passes[0]["notifications"]), b.UINT)
-[binary.write_structure(notification, notification_structures[notification["type"]])
- for notification in passes[0]["notifications"]]
-
-# ================================= #
-# ==== Second pass starts here ==== #
-# ================================= #
-
-# ID of the current active player
-binary.translate(passes[1]["world_params"]["current_player"], b.UINT)
-
-# Actions require special handling because of the weapon-actions issue
-locations[1]["actions"] = binary.tell()
-
-for n in range(len(passes[0]["actions"])):
-    if is_weapon(passes[0]["actions"][n]["path"]):
-        binary.write_structure(passes[1]["actions"][n], action2_weapon_structure)
-    else:
-        binary.write_structure(passes[1]["actions"][n], action2_normal_structure)
-
-# traits, players, tiles, features, cities, buildingGroups, buildings, units, weapons, items
-for key in second_pass_structure:
-    locations[1][key] = binary.tell()
-    binary.write_structure(passes[1][key], second_pass_structure[key])
-
-# Quests - not deserialized, just scanned
-locations[1]["quests"] = binary.tell()
-binary.write_structure(passes[1]["quests"], b.DataFormat(None, bytes))
-
-# Notifications
-locations[1]["notifications"] = binary.tell()
-[binary.write_structure(data, notification2_structures[structure_hint["type"]])
- for data, structure_hint
- in zip(passes[1]["notifications"], passes[0]["notifications"])]
-
-# ================================ #
-# ==== Third pass starts here ==== #
-# ================================ #
-
-# traits, then order data for players, cities, and buildingGroups
-for key in third_pass_structure:
-    locations[2][key] = binary.tell()
-    passes[2][key] = binary.write_structure(passes[2][key], third_pass_structure[key])
-
-# Notifications again
-locations[2]["notifications"] = binary.tell()
-[binary.write_structure(data, notification2_structures[structure_hint["type"]])
- for data, structure_hint
- in zip(passes[2]["notifications"], passes[0]["notifications"])]
-
-# ================================= #
-# ==== Fourth pass starts here ==== #
-# ================================= #
-
-# Tiles, units
-for key in fourth_pass_structure:
-    locations[3][key] = binary.tell()
-    passes[3][key] = binary.write_structure(passes[3][key], fourth_pass_structure[key])
-
-# Notifications *again*
-locations[3]["notifications"] = binary.tell()
-[binary.write_structure(data, notification2_structures[structure_hint["type"]])
- for data, structure_hint
- in zip(passes[3]["notifications"], passes[0]["notifications"])]
-
-# ================================ #
-# ==== Fifth pass starts here ==== #
-# ================================ #
-
-# Seems to be just notifications for a fifth and final time
-locations[4]["notifications"] = binary.tell()
-[binary.write_structure(data, notification2_structures[structure_hint["type"]])
- for data, structure_hint
- in zip(passes[4]["notifications"], passes[0]["notifications"])]
-
-binary.close()
-raw.close()
+# The version values are stored in the master config file, everything else is taken from the json data
+header = savegame_tools.header_from_data(header_data, config["GLADIUS"])
+savegame_tools.write_header_config(header, header_data["world_params"][0]["mods"], config_output_path)
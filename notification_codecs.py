@@ -0,0 +1,118 @@
+"""
+Compiled decoders and encoders for every type of notification, built once when this module is imported.
+
+Notifications appear in all five passes. The first pass has the type, then fields that depend on it; the later passes
+have the same fields without the type, in the order set by the first pass. Each type's functions are looked up once
+per record, and whole sections are read and written in one loop.
+"""
+
+import collections
+import binarizer as b
+from bulk_reader_tools import notification_structures, notification2_structures
+
+NotificationCodec = collections.namedtuple("NotificationCodec", "decode_first decode_later encode_first encode_later")
+
+
+def _make_codec(type_, views=0):
+    # The type is read separately to find out which codec to use, so the first-pass decoder starts after it
+    rest_structure = {key: value for key, value in notification_structures[type_].items() if key != "type"}
+    decode_rest = b.compile_decoder(rest_structure, views)
+
+    def decode_first(reader):
+        record = {"type": type_}
+        record.update(decode_rest(reader))
+        return record
+
+    return NotificationCodec(decode_first,
+                             b.compile_decoder(notification2_structures[type_], views),
+                             b.compile_encoder(notification_structures[type_]),
+                             b.compile_encoder(notification2_structures[type_]))
+
+
+codecs = {type_: _make_codec(type_) for type_ in notification_structures}
+# The codecs for each setting of BinReader.views, made when first needed
+_codecs_by_views = {0: codecs}
+
+
+def _codecs_for(binary):
+    try:
+        return _codecs_by_views[binary.views]
+    except KeyError:
+        table = _codecs_by_views[binary.views] = {type_: _make_codec(type_, binary.views)
+                                                   for type_ in notification_structures}
+        return table
+
+
+def _read_type(binary):
+    type_ = binary.read_until(b"\x00").decode()
+    if type_ not in codecs:
+        raise NotImplementedError(f"Unknown notification type {type_}.")
+    return type_
+
+
+def read_notification(binary, pass_number, first_pass_record=None):
+    """
+    Reads a single notification.
+    :param first_pass_record: The first-pass record of the same notification, if this is a later pass.
+    """
+    table = _codecs_for(binary)
+    if pass_number == 0:
+        return table[_read_type(binary)].decode_first(binary)
+    return table[first_pass_record["type"]].decode_later(binary)
+
+
+def read_notifications(binary, pass_number, first_pass=None, offsets=None):
+    """
+    Reads the notifications section of one pass.
+    :param first_pass: The first-pass records, or at least their types, if this is a later pass. The later passes
+    have one record for each of them and no count of their own.
+    :param offsets: If given, the offset of each record is appended to it.
+    """
+    table = _codecs_for(binary)
+    if pass_number == 0:
+        count = binary.fpop(b.UINT)
+        if offsets is None:
+            return [table[_read_type(binary)].decode_first(binary) for _ in range(count)]
+        records = []
+        for _ in range(count):
+            offsets.append(binary.tell())
+            records.append(table[_read_type(binary)].decode_first(binary))
+        return records
+
+    decoders = [table[record["type"]].decode_later for record in first_pass]
+    if offsets is None:
+        return [decode(binary) for decode in decoders]
+    records = []
+    for decode in decoders:
+        offsets.append(binary.tell())
+        records.append(decode(binary))
+    return records
+
+
+def write_notification(binary, pass_number, record, first_pass_record=None):
+    if pass_number == 0:
+        codecs[record["type"]].encode_first(binary.assembler, record)
+    else:
+        codecs[first_pass_record["type"]].encode_later(binary.assembler, record)
+    if binary.assembler.pos >= binary.chunk_size:
+        binary.drain()
+
+
+def write_notifications(binary, pass_number, records, first_pass=None):
+    """
+    Writes the notifications section of one pass.
+    :param binary: A BinWriter.
+    :param first_pass: The first-pass records, or at least their types, if this is a later pass.
+    """
+    assembler = binary.assembler
+    if pass_number == 0:
+        binary.translate(len(records), b.UINT)
+        for record in records:
+            codecs[record["type"]].encode_first(assembler, record)
+            if assembler.pos >= binary.chunk_size:
+                binary.drain()
+    else:
+        for record, first_pass_record in zip(records, first_pass):
+            codecs[first_pass_record["type"]].encode_later(assembler, record)
+            if assembler.pos >= binary.chunk_size:
+                binary.drain()
@@ -0,0 +1,134 @@
+"""
+Compresses the bulk data of a saved game on several threads at once, in the same way as pigz.
+
+The data is read a block at a time and each block is deflated on its own thread, which works because zlib lets go of
+the GIL while it compresses. Every block but the last ends with a sync flush, so that it finishes on a byte boundary
+without ending the stream, and the blocks are simply written one after another. Each block is given the last 32 KiB
+before it as a preset dictionary, so matches can still reach back into the previous block and the result is nearly as
+small as compressing everything in one go.
+
+The blocks are wrapped in a zlib header for the chosen level and a trailer with the Adler-32 of all the data, which is
+put together from the checksums of the blocks with adler32_combine. The result is a single ordinary zlib stream that
+zlib.decompress, and the game, can read.
+"""
+
+import collections
+import io
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# How far back deflate can refer to, and so how much of the previous block each block is given as a dictionary
+WINDOW_SIZE = 1 << 15
+# The same as pigz
+DEFAULT_BLOCK_SIZE = 1 << 17
+
+_ADLER_BASE = 65521
+
+
+def adler32_combine(adler1, adler2, length2):
+    """
+    Works out the Adler-32 of two pieces of data joined together, as zlib's adler32_combine does.
+    :param adler1: The Adler-32 of the first piece.
+    :param adler2: The Adler-32 of the second piece.
+    :param length2: The length of the second piece.
+    """
+    # The low half is one plus the sum of the bytes, and the high half is the sum of the low half after every byte
+    sum1 = (adler1 & 0xffff) + (adler2 & 0xffff) - 1
+    sum2 = (adler1 >> 16) + (adler2 >> 16) + length2 * ((adler1 & 0xffff) - 1)
+    return (sum1 % _ADLER_BASE) | ((sum2 % _ADLER_BASE) << 16)
+
+
+def zlib_header(level=-1):
+    """
+    :return: The two bytes that zlib starts a stream with for a compression level, with a 32 KiB window.
+    """
+    if level < 0:
+        level = 6
+    # The level is only recorded roughly, in the same four steps as zlib's deflate.c
+    if level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    elif level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+    header = (0x78 << 8) | (flevel << 6)
+    # The check bits make the header a multiple of 31
+    header += 31 - header % 31
+    return struct.pack(">H", header)
+
+
+def _compress_block(data, dictionary, level, last):
+    """
+    :return: (data deflated without a zlib header or trailer, its Adler-32)
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                      zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return compressed, zlib.adler32(data)
+
+
+def compress_stream(source, destination, level=-1, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Compresses everything from a file into a zlib stream, without reading it all into memory at once.
+    :param source: A binary file to read from.
+    :param destination: A binary file to write the zlib stream to.
+    :param level: The compression level, from 0 to 9, or -1 for zlib's default.
+    :param block_size: How much to compress on each thread at once.
+    :param workers: How many threads to use. Defaults to the number of cores.
+    :return: (the number of bytes read, the number of bytes written)
+    """
+    workers = workers or os.cpu_count()
+    destination.write(zlib_header(level))
+    read = 0
+    written = 2
+    checksum = zlib.adler32(b"")
+    # The blocks being compressed, in order, with their lengths. Only a few are kept going at once, so that a large
+    # file isn't read into memory faster than it can be compressed.
+    pending = collections.deque()
+
+    def write_oldest():
+        nonlocal checksum, written
+        future, length = pending.popleft()
+        compressed, block_checksum = future.result()
+        destination.write(compressed)
+        written += len(compressed)
+        checksum = adler32_combine(checksum, block_checksum, length)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        dictionary = b""
+        block = source.read(block_size)
+        while True:
+            # Reading one block ahead finds out whether this one is the last
+            following = source.read(block_size)
+            last = not following
+            pending.append((executor.submit(_compress_block, block, dictionary, level, last), len(block)))
+            read += len(block)
+            if len(pending) > 2 * workers:
+                write_oldest()
+            if last:
+                break
+            dictionary = (dictionary + block)[-WINDOW_SIZE:] if len(block) < WINDOW_SIZE else block[-WINDOW_SIZE:]
+            block = following
+        while pending:
+            write_oldest()
+
+    destination.write(struct.pack(">I", checksum))
+    return read, written + 4
+
+
+def compress(data, level=-1, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Does the same as zlib.compress, on several threads.
+    :param data: A bytes-like object.
+    :return: bytes
+    """
+    output = io.BytesIO()
+    compress_stream(io.BytesIO(data), output, level, block_size, workers)
+    return output.getvalue()
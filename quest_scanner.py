@@ -0,0 +1,273 @@
+"""
+Reads the quests sections of the bulk data.
+
+Each quest in the first pass starts with its name, number and stage, followed by a block of data that hasn't been
+worked out yet and has no length marker. The quests section of the second pass is a single such block. The only way
+to find where a block ends is to recognise what comes after it:
+    - the next quest, whose name starts with "Factions/", followed by its number and stage;
+    - after the last quest of the first pass, the notifications section: a count followed by notifications of the
+      types listed in bulk_reader_tools.notification_suffixes;
+    - after the second pass's block, the second pass of the notifications, whose types are known from the first pass
+      and which start with seven bytes that are each 0 or 1.
+Each possible end is checked by decoding as much of what comes after it as can be decoded, including the first few
+notifications. If a later quest can't be read, the scanner backs up and tries the next possible end of an earlier one,
+so a block that happens to contain something that looks like the start of a quest doesn't throw the rest off unless
+there's more than one way to split them that fits the count at the start of the section. In that case the first one
+found is used, and a warning is printed. If there's no way to split them at all, QuestScanError is raised.
+
+No block is searched for more than max_payload bytes, so reading the quests takes time in proportion to their size
+rather than to the size of the rest of the file.
+"""
+
+import re
+import struct
+import binarizer as b
+from bulk_reader_tools import notification_structures, notification2_structures
+
+quest_name_prefix = b"Factions/"
+# The most data a quest's block is expected to hold. Raise it if a save fails to read because of a very big quest.
+max_payload = 1 << 16
+max_string = 1 << 12
+max_notifications = 1 << 20
+# How many notifications are decoded to check the end of a block
+checked_notifications = 8
+# How many possible ends can be tried altogether before giving up
+max_attempts = 1 << 16
+
+_uint = struct.Struct("<I")
+_quest_header = struct.Struct("<II")  # number, stage
+_control_character = re.compile(rb"[\x00-\x1f]")
+_notification_type = re.compile(b"(?:" + b"|".join(re.escape(type_.encode())
+                                                    for type_ in sorted(notification_structures, key=len, reverse=True))
+                                 + b")\x00")
+_notification2_prefix = re.compile(rb"[\x00\x01]{7}")
+
+
+class QuestScanError(RuntimeError):
+    pass
+
+
+class _Window(object):
+    """
+    The data ahead of a reader's current position, read without advancing it. More is read as it's needed.
+    """
+
+    def __init__(self, binary, size=1 << 16):
+        self.binary = binary
+        self.data = binary.peek(size)
+        self.complete = len(self.data) < size
+
+    def ensure(self, end):
+        """
+        Makes sure self.data holds everything up to end, if there's that much.
+        """
+        if end > len(self.data) and not self.complete:
+            size = max(end, 2 * len(self.data))
+            self.data = self.binary.peek(size)
+            self.complete = len(self.data) < size
+
+    def string_end(self, position):
+        """
+        :return: The position after a null-terminated string without control characters, or None if there isn't one.
+        """
+        self.ensure(position + max_string)
+        end = self.data.find(b"\x00", position, position + max_string)
+        if end == -1 or _control_character.search(self.data, position, end):
+            return None
+        return end + 1
+
+    def skip(self, position, structure):
+        """
+        :param structure: A dict of fixed-length DataFormats and STRINGs.
+        :return: The position after a record with the given structure, or None if there can't be one there.
+        """
+        for data_format in structure.values():
+            if isinstance(data_format.until, int):
+                position += data_format.until
+            elif data_format.until == b"\x00":
+                position = self.string_end(position)
+                if position is None:
+                    return None
+            else:
+                raise TypeError(f"Can't skip over {data_format}.")
+        self.ensure(position)
+        return position if position <= len(self.data) else None
+
+
+def _quest_payload_start(window, position):
+    """
+    :return: Where a quest's block starts, if a quest starts at position, otherwise None.
+    """
+    window.ensure(position + len(quest_name_prefix))
+    if not window.data.startswith(quest_name_prefix, position):
+        return None
+    position = window.string_end(position)
+    if position is None or position + _quest_header.size > len(window.data):
+        return None
+    return position + _quest_header.size
+
+
+def _notifications_start(window, position):
+    """
+    Whether the first pass of the notifications section starts at position.
+    """
+    window.ensure(position + _uint.size)
+    if position + _uint.size > len(window.data):
+        return False
+    count = _uint.unpack_from(window.data, position)[0]
+    if not 0 < count <= max_notifications:
+        return False
+    position += _uint.size
+    for _ in range(min(count, checked_notifications)):
+        type_end = window.string_end(position)
+        if type_end is None:
+            return False
+        structure = notification_structures.get(window.data[position:type_end - 1].decode(errors="replace"))
+        if structure is None:
+            return False
+        position = window.skip(position, structure)
+        if position is None:
+            return False
+    return True
+
+
+def _notifications2_start(window, position, types):
+    """
+    Whether the second pass of the notifications section starts at position.
+    :param types: The type of each notification, from the first pass.
+    """
+    for type_ in types[:checked_notifications]:
+        window.ensure(position + 7)
+        if not _notification2_prefix.match(window.data, position):
+            return False
+        position = window.skip(position, notification2_structures[type_])
+        if position is None:
+            return False
+    return True
+
+
+def _contains_quest(window, start, end):
+    """
+    Whether anything that looks like the start of a quest starts between start and end.
+    """
+    position = window.data.find(quest_name_prefix, start, end)
+    while position != -1:
+        if _quest_payload_start(window, position) is not None:
+            return True
+        position = window.data.find(quest_name_prefix, position + 1, end)
+    return False
+
+
+def _possible_ends(window, payload_start, last):
+    """
+    :param last: Whether this is the last quest, so that the notifications come after it rather than another quest.
+    :return: A generator of every position within max_payload of payload_start where the block might end.
+    """
+    limit = payload_start + max_payload
+    window.ensure(limit + max_string)
+    if not last:
+        position = window.data.find(quest_name_prefix, payload_start, limit + len(quest_name_prefix))
+        while position != -1:
+            if _quest_payload_start(window, position) is not None:
+                yield position
+            position = window.data.find(quest_name_prefix, position + 1, limit + len(quest_name_prefix))
+    else:
+        # The notifications' count comes before the first type
+        for match in _notification_type.finditer(window.data, payload_start + _uint.size, limit + max_string):
+            position = match.start() - _uint.size
+            if position > limit:
+                return
+            if _notifications_start(window, position):
+                yield position
+
+
+def read_quests(binary, offsets=None):
+    """
+    Reads the first pass of the quests section, including its count.
+    :param binary: A BinReader or StreamReader positioned at the start of the section.
+    :param offsets: If given, the offset of each quest is appended to it.
+    :return: A list of quests, as would be read with the structure bulk_reader_tools.quest_structure.
+    """
+    count = binary.fpop(b.UINT)
+    if count == 0:
+        return []
+    base = binary.tell()
+    window = _Window(binary)
+    # For each quest whose end hasn't been settled: [start, block start, possible ends, end]
+    quests = []
+    start = 0
+    attempts = 0
+    while True:
+        if len(quests) < count:
+            payload_start = _quest_payload_start(window, start)
+            if payload_start is not None:
+                quests.append([start, payload_start, _possible_ends(window, payload_start, len(quests) == count - 1),
+                               None])
+        # Find the next possible end of the latest quest, backing up to earlier quests if there aren't any
+        while quests:
+            attempts += 1
+            if attempts > max_attempts:
+                raise QuestScanError(f"Gave up splitting {count} quests after {max_attempts} attempts.")
+            end = next(quests[-1][2], None)
+            if end is not None:
+                quests[-1][3] = end
+                break
+            quests.pop()
+        else:
+            raise QuestScanError(f"Couldn't split the data at {base} into {count} quests followed by notifications. "
+                                 f"A quest might have more than {max_payload} bytes of data.")
+        if len(quests) == count:
+            break
+        start = end
+
+    data = window.data
+    records = []
+    for start, payload_start, _, end in quests:
+        if _contains_quest(window, payload_start, end):
+            print(f"WARNING: the data of the quest at {base + start} has something that looks like the start of "
+                  f"another quest in it, so the quests might have been split wrongly.")
+        if offsets is not None:
+            offsets.append(base + start)
+        number, stage = _quest_header.unpack_from(data, payload_start - _quest_header.size)
+        if binary.views and end - payload_start >= binary.views:
+            payload = binary.view(base + payload_start, base + end)
+        else:
+            payload = data[payload_start:end]
+        records.append(dict(name=data[start:payload_start - _quest_header.size - 1].decode(),
+                            number=number,
+                            stage=stage,
+                            bin1=payload))
+    binary.read(quests[-1][3])
+    return records
+
+
+def read_quests2(binary, quest_count, notification_types):
+    """
+    Reads the second pass of the quests section, which is kept as a single block of bytes.
+    :param binary: A BinReader or StreamReader positioned at the start of the section.
+    :param quest_count: How many quests there were in the first pass. If there were none, the section is empty.
+    :param notification_types: The type of each notification, from the first pass.
+    :return: bytes, or a BytesView if the reader has views enabled. See BinReader.enable_views.
+    """
+    if quest_count == 0:
+        return b''
+    if not notification_types:
+        raise QuestScanError("Can't find the end of the second pass of the quests without any notifications after it.")
+    window = _Window(binary)
+    limit = max_payload * quest_count
+    # The data is searched a chunk at a time, reading only as far ahead as the chunk and the seven bytes a match can
+    # run over the end of it, so that no more is read than it takes to find the end
+    start = 0
+    while start <= limit:
+        end = min(start + max_payload, limit + 1)
+        window.ensure(end + 6)
+        # Every position has to be tried, so the matches have to be allowed to overlap
+        match = _notification2_prefix.search(window.data, start, end + 6)
+        while match is not None:
+            if _notifications2_start(window, match.start(), notification_types):
+                return binary.read_opaque(match.start())
+            match = _notification2_prefix.search(window.data, match.start() + 1, end + 6)
+        if window.complete and end + 6 >= len(window.data):
+            break
+        start = end
+    raise QuestScanError(f"Couldn't find the end of the second pass of the quests within {limit} bytes.")
@@ -0,0 +1,174 @@
+"""
+A sidecar index recording where every record in a bulk (.bin) file starts, so that individual units, players, tiles
+and so on can be read straight out of the file without parsing the rest of it.
+
+The index is a JSON file next to the .bin file, with the extension .idx. It can be written by serial_to_json.py with
+the --index option, or by running this script on a .bin file.
+"""
+
+import argparse
+import json
+import os
+import struct
+import binarizer as b
+import bulk_parser as bp
+
+INDEX_VERSION = 1
+
+
+def index_path_for(bin_path):
+    return os.path.splitext(bin_path)[0] + ".idx"
+
+
+def _record_size(pass_number, key):
+    """
+    :return: The size in bytes of every record in a section, if the records are fixed-width, otherwise None.
+    """
+    structure = bp.record_structures[pass_number].get(key)
+    fields = b.fixed_width_fields(structure)
+    if fields is None:
+        return None
+    return struct.calcsize("=" + "".join(code for code, _ in fields))
+
+
+def make_index(passes, locations, record_offsets, bin_path):
+    """
+    Builds an index from the output of bulk_parser.parse_bulk.
+    :param passes: The passes returned by parse_bulk.
+    :param locations: The locations filled in by parse_bulk.
+    :param record_offsets: The record_offsets filled in by parse_bulk.
+    :param bin_path: The path to the .bin file that was parsed. Its size and modification time are recorded so that
+    out-of-date indexes can be spotted.
+    :return: dict, ready to be saved with write_index.
+    """
+    stat = os.stat(bin_path)
+    sections = {}
+    for key in bp.zippable:
+        first_pass = passes[0][key]
+        if len(first_pass) != 0 and "id" in first_pass[0]:
+            ids = [record["id"] for record in first_pass]
+        else:
+            ids = None
+
+        section_passes = []
+        for pass_number in range(len(passes)):
+            if key not in passes[pass_number]:
+                section_passes.append(None)
+            elif key not in record_offsets[pass_number]:
+                # The dummy tile data in the third pass
+                section_passes.append(dict(empty=True))
+            elif _record_size(pass_number, key) is not None:
+                # Fixed-size records can be found by arithmetic alone
+                offsets = record_offsets[pass_number][key]
+                section_passes.append(dict(start=offsets[0] if offsets else locations[pass_number][key],
+                                           stride=_record_size(pass_number, key)))
+            else:
+                section_passes.append(dict(offsets=record_offsets[pass_number][key]))
+        sections[key] = dict(ids=ids, passes=section_passes)
+
+    return dict(version=INDEX_VERSION,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                locations=locations,
+                sections=sections)
+
+
+def build_index(bin_path):
+    """
+    Scans a .bin file and builds its index.
+    """
+    locations = [{}, {}, {}, {}, {}]
+    record_offsets = [{}, {}, {}, {}, {}]
+    with open(bin_path, 'rb') as file:
+        binary = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+    passes = bp.parse_bulk(binary, locations, record_offsets)
+    binary.close()
+    return make_index(passes, locations, record_offsets, bin_path)
+
+
+def write_index(index, path):
+    with open(path, 'w') as file:
+        json.dump(index, file)
+
+
+def read_index(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def is_current(index, bin_path):
+    """
+    Whether an index still matches its .bin file.
+    """
+    stat = os.stat(bin_path)
+    return index.get("version") == INDEX_VERSION \
+        and index["size"] == stat.st_size \
+        and index["mtime_ns"] == stat.st_mtime_ns
+
+
+class IndexedSave(object):
+    """
+    Random access to the records in a .bin file. If the file has no index, or the index is out of date, the file is
+    scanned and a new index is written next to it.
+
+    Records are returned in the same form as in the json files: a list with one entry for each pass.
+    """
+
+    def __init__(self, bin_path, index_path=None):
+        if index_path is None:
+            index_path = index_path_for(bin_path)
+        index = read_index(index_path) if os.path.isfile(index_path) else None
+        if index is None or not is_current(index, bin_path):
+            index = build_index(bin_path)
+            write_index(index, index_path)
+        self.index = index
+        self.positions = {key: {id_: position for position, id_ in enumerate(section["ids"])}
+                          for key, section in index["sections"].items()
+                          if section["ids"] is not None}
+        with open(bin_path, 'rb') as file:
+            self.binary = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.binary.close()
+
+    def get(self, type_, id_):
+        """
+        Reads the object with the given id.
+        :param type_: The section, such as "units".
+        :param id_: The id of the object.
+        """
+        return self.get_position(type_, self.positions[type_][id_])
+
+    def get_position(self, type_, position):
+        """
+        Reads the object at the given position in its section. Used for sections without ids, such as notifications.
+        """
+        entry = []
+        for pass_number, spec in enumerate(self.index["sections"][type_]["passes"]):
+            if spec is None:
+                continue
+            elif "empty" in spec:
+                entry.append({})
+                continue
+            elif "offsets" in spec:
+                offset = spec["offsets"][position]
+            else:
+                offset = spec["start"] + position * spec["stride"]
+            self.binary.seek(offset)
+            entry.append(bp.read_record(self.binary, pass_number, type_, entry[0] if entry else None))
+        return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes an index of every record in a .bin file.")
+    parser.add_argument("filename")
+    args = parser.parse_args()
+    input_path = os.path.abspath(args.filename)
+    write_index(build_index(input_path), index_path_for(input_path))
+    print(f"Index written to {os.path.basename(index_path_for(input_path))}")
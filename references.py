@@ -0,0 +1,259 @@
+"""
+The ids that objects in a saved game use to refer to each other: units to their actions, traits and weapons, tiles to
+their features and city, and so on.
+
+ReferenceGraph answers "what refers to this object?", and check_integrity finds references to objects that don't
+exist, ids used by more than one object, and objects listed more than once in the same place. Both take time in
+proportion to the number of references, so check_integrity is cheap enough to run every time a save is written.
+
+Most of reference_fields was worked out from the names of the values rather than confirmed against what the game does,
+so a problem found here might not be a problem for the game. json_to_serial.py only prints them unless it's given
+--strict.
+"""
+
+import collections
+import itertools
+
+# (section, pass, field, target section, kind) for every reference. The kinds are:
+#     "one": a single id, or -1 for none
+#     "list": a list of ids
+#     "named": a list of {"name": ..., "id": ...} dicts
+#     "pairs": a list of (name, id) pairs
+reference_fields = [
+    ("actions", 1, "linked_traits", "traits", "list"),
+    ("traits", 2, "linked_action", "actions", "one"),
+    ("players", 1, "tiles_revealed", "tiles", "list"),
+    ("tiles", 1, "features", "features", "list"),
+    ("tiles", 1, "city_id", "cities", "one"),
+    ("tiles", 1, "building_ids", "buildings", "list"),
+    ("tiles", 3, "unit", "units", "one"),
+    ("features", 1, "traits", "traits", "pairs"),
+    ("features", 1, "tile_id", "tiles", "one"),
+    ("cities", 1, "buildings", "buildings", "list"),
+    ("cities", 1, "building_groups", "building_groups", "list"),
+    ("cities", 1, "tiles_occupied", "tiles", "list"),
+    ("building_groups", 1, "buildings", "buildings", "list"),
+    ("units", 1, "actions", "actions", "list"),
+    ("units", 1, "traits", "traits", "named"),
+    ("units", 1, "weapons", "weapons", "list"),
+    ("units", 1, "transport", "units", "one"),
+    ("units", 1, "transported_units", "units", "list"),
+    ("units", 1, "parent_tile", "tiles", "one"),
+    ("weapons", 1, "traits", "traits", "named"),
+    ("weapons", 1, "unit_id", "units", "one"),
+    ("magic_items", 1, "actions", "actions", "list"),
+]
+
+# (section, field) of references that the game clears itself when what they refer to is gone, such as a tile that
+# still holds a unit that's been deleted. Dangling references in them are only warnings, and don't stop a save from
+# being written even by json_to_serial.py --strict.
+cleared_by_game = {("tiles", "unit")}
+
+_fields_by_section = collections.defaultdict(list)
+for _section, _pass_number, _field, _target, _kind in reference_fields:
+    _fields_by_section[_section].append((_pass_number, _field, _target, _kind))
+_checked_sections = set(_fields_by_section) | {target for _, _, _, target, _ in reference_fields}
+
+NONE = -1
+
+# A problem found by check_integrity. kind is one of:
+#     "duplicate id": more than one object in section has the id id_. field, target and target_id are None.
+#     "dangling": the object refers to target_id in the target section, which doesn't exist.
+#     "repeated": the object lists target_id more than once in the one field.
+Problem = collections.namedtuple("Problem", "kind section id_ field target target_id")
+
+
+class IntegrityError(ValueError):
+    """
+    Raised when a saved game has problems with its references. The Problems are in the problems attribute.
+    """
+
+    def __init__(self, problems, shown=20):
+        self.problems = problems
+        super().__init__(f"{len(problems)} problems with references:\n" + describe_all(problems, shown))
+
+
+def describe(problem):
+    """
+    :return: A description of a Problem for printing.
+    """
+    if problem.kind == "duplicate id":
+        return f"More than one object in {problem.section} has id {problem.id_}"
+    elif problem.kind == "dangling":
+        return f"{problem.section} {problem.id_} refers to {problem.target} {problem.target_id} in {problem.field}, " \
+               f"which doesn't exist"
+    else:
+        return f"{problem.section} {problem.id_} lists {problem.target} {problem.target_id} more than once in " \
+               f"{problem.field}"
+
+
+def describe_all(problems, shown=20):
+    """
+    :return: A description of the first few of a list of Problems for printing, one to a line.
+    """
+    lines = [describe(problem) for problem in problems[:shown]]
+    if len(problems) > shown:
+        lines.append(f"...and {len(problems) - shown} more")
+    return "\n".join(lines)
+
+
+def is_warning(problem):
+    """
+    Whether a Problem is one the game fixes by itself. See cleared_by_game.
+    """
+    return problem.kind == "dangling" and (problem.section, problem.field) in cleared_by_game
+
+
+def raise_problems(problems):
+    """
+    Raises an IntegrityError if any of the problems aren't just warnings.
+    :return: The problems that are warnings.
+    """
+    errors = [problem for problem in problems if not is_warning(problem)]
+    if errors:
+        raise IntegrityError(errors)
+    return [problem for problem in problems if is_warning(problem)]
+
+
+def field_values(entries, pass_number, field, kind):
+    """
+    :param entries: The objects in one section, leaving out any deleted ones.
+    :return: A list of what each object refers to in one field: an id (which may be NONE) for "one" fields, otherwise
+    a list of ids.
+    """
+    if not entries or len(entries[0]) <= pass_number:
+        return [NONE if kind == "one" else [] for _ in entries]
+    values = [entry[pass_number].get(field) for entry in entries]
+    if kind == "one":
+        return [NONE if value is None else value for value in values]
+    elif kind == "list":
+        return [value or [] for value in values]
+    elif kind == "named":
+        return [[item["id"] for item in value] if value else [] for value in values]
+    else:
+        return [[id_ for name, id_ in value] if value else [] for value in values]
+
+
+def _live_entries(section):
+    return [entry for entry in section if entry is not None]
+
+
+class ReferenceGraph(object):
+    """
+    Every reference in a saved game, indexed by what they refer to. It isn't updated when the data changes; make a new
+    one instead.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: The contents of a saved game, as in the json files. Deleted objects may be left as None, as in
+        json_editor_tools.GladiusSave.
+        """
+        self._referrers = collections.defaultdict(list)
+        for section, fields in _fields_by_section.items():
+            entries = _live_entries(data.get(section, ()))
+            ids = [entry[0]["id"] for entry in entries]
+            for pass_number, field, target, kind in fields:
+                values = field_values(entries, pass_number, field, kind)
+                if kind == "one":
+                    for id_, target_id in zip(ids, values):
+                        if target_id != NONE:
+                            self._referrers[target, target_id].append((section, id_, field))
+                    continue
+                for id_, target_ids in zip(ids, values):
+                    for target_id in target_ids:
+                        if target_id != NONE:
+                            self._referrers[target, target_id].append((section, id_, field))
+
+    def referrers(self, type_, id_):
+        """
+        :return: A list of (section, id, field) for every reference to the given object. An object that lists it more
+        than once in the same field appears more than once.
+        """
+        return self._referrers.get((type_, id_), [])
+
+    def is_referenced(self, type_, id_):
+        return (type_, id_) in self._referrers
+
+
+class IntegrityChecker(object):
+    """
+    Checks the references in a saved game that's handed over one section at a time, for when the whole save isn't in
+    memory at once. Only the ids and references are kept. References to sections that were never added aren't checked.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._duplicates = []
+        self._references = []  # (section, field, target section, kind, ids, field_values)
+
+    def add_section(self, key, value):
+        """
+        :param key: The name of the section, such as "units".
+        :param value: The section, as in the json files.
+        """
+        if key not in _checked_sections:
+            return
+        entries = _live_entries(value)
+        id_list = [entry[0]["id"] for entry in entries]
+        ids = set(id_list)
+        if len(ids) != len(id_list):
+            for id_, count in collections.Counter(id_list).items():
+                if count > 1:
+                    self._duplicates.append(Problem("duplicate id", key, id_, None, None, None))
+        self._ids[key] = ids
+        for pass_number, field, target, kind in _fields_by_section.get(key, ()):
+            self._references.append((key, field, target, kind, id_list,
+                                     field_values(entries, pass_number, field, kind)))
+
+    def problems(self):
+        """
+        :return: A list of every Problem found.
+        """
+        problems = list(self._duplicates)
+        for section, field, target, kind, ids, values in self._references:
+            if target not in self._ids:
+                # Only part of a save was given
+                continue
+            existing = self._ids[target]
+            if kind == "one":
+                # Most fields have nothing wrong with them, so they're checked all at once before looking for culprits
+                if set(values).difference(existing, [NONE]):
+                    problems.extend(Problem("dangling", section, id_, field, target, target_id)
+                                    for id_, target_id in zip(ids, values)
+                                    if target_id != NONE and target_id not in existing)
+                continue
+            # The same goes for lists, with as much as possible done without a loop in Python
+            dangling = set(itertools.chain.from_iterable(values)).difference(existing, [NONE])
+            if dangling:
+                for id_, target_ids in zip(ids, values):
+                    if not dangling.isdisjoint(target_ids):
+                        problems.extend(Problem("dangling", section, id_, field, target, target_id)
+                                        for target_id in dangling.intersection(target_ids))
+            lengths = list(map(len, values))
+            unique_lengths = list(map(len, map(set, values)))
+            if lengths != unique_lengths:
+                for id_, target_ids, length, unique_length in zip(ids, values, lengths, unique_lengths):
+                    if length != unique_length:
+                        problems.extend(Problem("repeated", section, id_, field, target, target_id)
+                                        for target_id, count in collections.Counter(target_ids).items()
+                                        if count > 1 and target_id != NONE)
+        return problems
+
+    def raise_problems(self):
+        """
+        Raises an IntegrityError if there are any problems that aren't just warnings.
+        :return: The problems that are warnings.
+        """
+        return raise_problems(self.problems())
+
+
+def check_integrity(data):
+    """
+    :param data: The contents of a saved game, as in the json files.
+    :return: A list of every Problem found.
+    """
+    checker = IntegrityChecker()
+    for key, value in data.items():
+        checker.add_section(key, value)
+    return checker.problems()
@@ -0,0 +1,161 @@
+"""
+Lists the saved games under a directory with what's in their headers (the game version, Steam user, turn and mods)
+without decompressing anything, and filters them by it.
+
+Only the uncompressed header at the front of each .GladiusSave file is read, and what's found is kept in a catalog, a
+JSON file in the top directory. Each file is only read again if its size or modification time has changed, so listing
+a directory of thousands of saves a second time only takes as long as looking at the files' sizes and times.
+"""
+
+import argparse
+import json
+import os
+import time
+import savegame_tools
+from batch_convert import find_inputs
+
+master_config_name = "Config.ini"
+catalog_name = "save_catalog.json"
+CATALOG_VERSION = 1
+
+
+def read_catalog(path):
+    if not os.path.isfile(path):
+        return dict(version=CATALOG_VERSION, files={})
+    with open(path, 'r') as file:
+        catalog = json.load(file)
+    if catalog.get("version") != CATALOG_VERSION:
+        return dict(version=CATALOG_VERSION, files={})
+    return catalog
+
+
+def write_catalog(catalog, path):
+    # Written to a temporary file first, so an interruption can't leave a half-written catalog behind
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(catalog, file, indent="    ")
+    os.replace(temporary_path, path)
+
+
+def scan_save(path, stat=None):
+    """
+    Reads the header of a single saved game.
+    :param stat: The file's os.stat result, if it's already known.
+    :return: A catalog entry for the file, with its size, modification time, header and mods, or an error if the header
+    couldn't be read.
+    """
+    if stat is None:
+        stat = os.stat(path)
+    entry = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    try:
+        header, mods, offset = savegame_tools.read_savegame_header(path)
+    except Exception as error:
+        entry["error"] = f"{type(error).__name__}: {error}"
+        return entry
+    entry.update(header=header, mods=mods, data_offset=offset)
+    return entry
+
+
+def is_current(entry, stat):
+    """
+    Whether a catalog entry still matches its file.
+    """
+    return entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+
+def scan(root, catalog_path=None, skip_directory=None):
+    """
+    Finds every saved game under a directory and reads its header, unless the catalog already has it.
+    :param root: The directory to search.
+    :param catalog_path: Where to keep the catalog. Defaults to save_catalog.json in root.
+    :param skip_directory: The name of directories not to search, such as the unpacked directory.
+    :return: A dict mapping the path of every saved game found to its catalog entry.
+    """
+    if catalog_path is None:
+        catalog_path = os.path.join(root, catalog_name)
+    catalog = read_catalog(catalog_path)
+    entries = catalog["files"]
+
+    found = {}
+    changed = False
+    for path in find_inputs(root, [".GladiusSave"], skip_directory):
+        stat = os.stat(path)
+        entry = entries.get(path)
+        if not is_current(entry, stat):
+            entry = scan_save(path, stat)
+            changed = True
+        found[path] = entry
+
+    # Saves under root that have gone are forgotten, but saves in other directories sharing the catalog are kept
+    prefix = os.path.join(root, "")
+    elsewhere = {path: entry for path, entry in entries.items() if not path.startswith(prefix)}
+    if changed or len(elsewhere) + len(found) != len(entries):
+        catalog["files"] = dict(elsewhere, **found)
+        write_catalog(catalog, catalog_path)
+    return found
+
+
+def filter_saves(entries, min_turn=None, max_turn=None, steamuser=None, version=None, mods=()):
+    """
+    :param entries: A dict mapping paths to catalog entries, as returned by scan.
+    :param min_turn: Only saves from this turn onwards.
+    :param max_turn: Only saves up to this turn.
+    :param steamuser: Only saves by this Steam user.
+    :param version: Only saves from this version of the game.
+    :param mods: Only saves using every one of these mods.
+    :return: A dict of the entries that match, leaving out any whose header couldn't be read.
+    """
+    matches = {}
+    for path, entry in entries.items():
+        if "error" in entry:
+            continue
+        header = entry["header"]
+        if min_turn is not None and header["turn"] < min_turn:
+            continue
+        if max_turn is not None and header["turn"] > max_turn:
+            continue
+        if steamuser is not None and header["steamuser"] != steamuser:
+            continue
+        if version is not None and header["version"] != version:
+            continue
+        if not set(mods).issubset(entry["mods"]):
+            continue
+        matches[path] = entry
+    return matches
+
+
+if __name__ == "__main__":
+    master_config = savegame_tools.read_config(master_config_name)
+    parser = argparse.ArgumentParser(description="Lists saved games by what's in their headers, without "
+                                                 "decompressing them.")
+    parser.add_argument("directory", nargs="?", default=master_config["GLADIUS"]["saved games directory"],
+                        help="Defaults to the saved games directory in the master config file.")
+    parser.add_argument("--catalog", default=None, help=f"Defaults to {catalog_name} in the directory.")
+    parser.add_argument("--min-turn", type=int, default=None)
+    parser.add_argument("--max-turn", type=int, default=None)
+    parser.add_argument("--steamuser", default=None)
+    parser.add_argument("--version", default=None, help="The version of the game.")
+    parser.add_argument("--mod", action="append", default=[], help="Only saves using this mod. Can be given more than "
+                                                                   "once.")
+    parser.add_argument("--json", action="store_true", help="Print the matching entries as JSON.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    root = os.path.abspath(args.directory)
+    all_saves = scan(root, args.catalog and os.path.abspath(args.catalog),
+                     master_config["GLADIUS"]["unpacked directory"])
+    saves = filter_saves(all_saves, args.min_turn, args.max_turn, args.steamuser, args.version, args.mod)
+    seconds = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(saves, indent="    "))
+    else:
+        print(f"{'turn':>6}  {'version':<12}{'steamuser':<20}{'mods':>5}  path")
+        for path, entry in sorted(saves.items(), key=lambda item: (item[1]["header"]["turn"], item[0])):
+            header = entry["header"]
+            print(f"{header['turn']:>6}  {header['version']:<12}{header['steamuser']:<20}{len(entry['mods']):>5}  "
+                  f"{os.path.relpath(path, root)}")
+        for path, entry in sorted(all_saves.items()):
+            if "error" in entry:
+                print(f"ERROR: {os.path.relpath(path, root)}: {entry['error']}")
+        print(f"{len(saves)} of {len(all_saves)} saves in {seconds * 1000:.0f}ms")
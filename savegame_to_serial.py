@@ -2,10 +2,7 @@ import argparse
 import os
 import sys
 import configparser
-import zlib
-from mmap import ACCESS_READ
-from bulk_reader_tools import header_structure
-import binarizer as b
+from savegame_tools import read_savegame_header, write_header_config, decompressed_chunks, replacing
 
 testing = False
 master_config_name = "Config.ini"
@@ -46,38 +43,15 @@ else:
 config_output_path = os.path.join(directory, name + ".ini")
 binary_output_path = os.path.join(directory, name + ".bin")
 
-config_out = configparser.ConfigParser(allow_no_value=True)
-
-# Default behaviour is to make all config option names lowercase
-# We don't want to do that so we override optionxform
-config_out.optionxform = lambda option: option
-config_out.add_section("HEADER")
-config_out.add_section("MODS")
-header = config_out["HEADER"]
-
-with open(file_in_name, 'r+b') as file:
-    data = b.BinReader(file.fileno(), 0, access=ACCESS_READ)
-
-for name in header_structure:
-    value = data.fpop(*header_structure[name])
-    header[name] = str(value)
-
-# Mod names are separated by null bytes
-for n in range(int(header["mod_count"])):
-    mod = data.fpop(*b.STRING)
-    # noinspection PyTypeChecker
-    config_out["MODS"][mod] = None
-
-with open(config_output_path, 'w') as file:
-    config_out.write(file)
-
-# Remainder of file is compressed with zlib
-remainder = len(data) - data.tell()
-decompressed_data = zlib.decompress(data.get(remainder))
-
-with open(binary_output_path, 'wb') as file:
-    file.write(decompressed_data)
-    print(f"Decompressed savegame data written to {unpack_dir_name}.")
-
-if not testing:
-    data.close()
+header, mods, offset = read_savegame_header(file_in_name)
+
+# Remainder of file is compressed with zlib. It's decompressed a piece at a time and written out as it goes, so the
+# whole of the bulk data is never in memory at once.
+with open(file_in_name, 'rb') as file, replacing(binary_output_path) as temporary_path, \
+        open(temporary_path, 'wb') as output:
+    file.seek(offset)
+    for chunk in decompressed_chunks(file):
+        output.write(chunk)
+# Only written once the bulk data is, so that a save that can't be decompressed leaves nothing behind
+write_header_config(header, mods, config_output_path)
+print(f"Decompressed savegame data written to {unpack_dir_name}.")
@@ -0,0 +1,289 @@
+"""
+Tools for reading and writing the .GladiusSave files themselves: the uncompressed header at the front, and the
+zlib-compressed bulk data that follows it.
+
+load_save and dump_save do the whole job of savegame_to_serial.py, serial_to_json.py, json_to_serial.py and
+serial_to_savegame.py in memory, without any intermediate files.
+"""
+
+import configparser
+import contextlib
+import io
+import json
+import os
+import struct
+import zlib
+from mmap import ACCESS_READ
+import binarizer as b
+import bjson
+import bulk_parser
+import bulk_writer
+import parallel_compress
+from bulk_reader_tools import header_structure
+
+master_config_name = "Config.ini"
+
+
+def read_config(path=master_config_name):
+    config = configparser.ConfigParser(allow_no_value=True)
+    # Default behaviour is to make all config option names lowercase
+    # We don't want to do that so we override optionxform
+    config.optionxform = lambda option: option
+    config.read(path)
+    return config
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """
+    Gives a temporary path to write a file to instead of path, and moves it into place only once the with block
+    finishes without an error, so that a failure partway through doesn't leave half a file behind under the real name.
+    """
+    temporary_path = path + ".tmp"
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def read_header(binary):
+    """
+    Reads the header and the list of mods from the start of a saved game.
+    :param binary: A BinReader or StreamReader positioned at the start of the file.
+    :return: (header, mods), where header is a dict with the values in header_structure and mods is a list of strings.
+    """
+    header = {name: binary.fpop(*header_structure[name]) for name in header_structure}
+    # Mod names are separated by null bytes
+    mods = [binary.fpop(*b.STRING) for _ in range(header["mod_count"])]
+    return header, mods
+
+
+def write_header_config(header, mods, path):
+    """
+    Saves a header and list of mods to an ini file, as read by serial_to_savegame.py.
+    """
+    config_out = configparser.ConfigParser(allow_no_value=True)
+
+    # Default behaviour is to make all config option names lowercase
+    # We don't want to do that so we override optionxform
+    config_out.optionxform = lambda option: option
+    config_out.add_section("HEADER")
+    config_out.add_section("MODS")
+
+    for name, value in header.items():
+        config_out["HEADER"][name] = str(value)
+    for mod in mods:
+        # noinspection PyTypeChecker
+        config_out["MODS"][mod] = None
+
+    with open(path, 'w') as file:
+        config_out.write(file)
+
+
+def read_header_config(path):
+    """
+    Reads a header and list of mods from an ini file written by write_header_config.
+    :return: (header, mods). All the values in header are strings.
+    """
+    config_in = read_config(path)
+    return dict(config_in["HEADER"]), list(config_in["MODS"])
+
+
+def header_from_data(data, versions):
+    """
+    Makes up a header for a saved game from its contents.
+    :param data: The zipped data, as in the json files.
+    :param versions: Mapping with the version, branch, revision and build to record, such as the GLADIUS section of
+    the master config file.
+    """
+    header = {value: versions[value] for value in ["version", "branch", "revision", "build"]}
+    current_player_id = data["world_params"][1]["current_player"]
+    header["steamuser"] = data["players"][current_player_id][0]["name"]
+    header["turn"] = data["world_params"][0]["turn_number"]
+    header["checksum"] = 0
+    header["mod_count"] = len(data["world_params"][0]["mods"])
+    return header
+
+
+def pack_header(header, mods):
+    """
+    The reverse of read_header.
+    :return: bytes
+    """
+    # Null byte used as a separator
+    nul = b"\x00"
+
+    return b''.join([
+        bytes(header["version"], encoding="utf-8"),
+        nul,
+        bytes(header["branch"], encoding="utf-8"),
+        nul,
+        bytes(header["revision"], encoding="utf-8"),
+        nul,
+        bytes(header["build"], encoding="utf-8"),
+        nul,
+        bytes(header["steamuser"], encoding="utf-8"),
+        nul,
+        struct.pack('<iii',
+                    int(header["turn"]),
+                    int(header["checksum"]),  # Not actually used so don't sweat it
+                    len(mods)),  # Note: Use the *actual* number of mods, not whatever the header says
+        b''.join([bytes(s, encoding="utf-8") + nul for s in mods])])
+
+
+def write_savegame(path, header, mods, bulk_data):
+    """
+    Writes a .GladiusSave file.
+    :param bulk_data: The uncompressed bulk data, as in the .bin files.
+    """
+    with open(path, 'wb') as file:
+        file.write(pack_header(header, mods))
+        file.write(zlib.compress(bulk_data))
+
+
+def write_savegame_from_bin(path, header, mods, bin_path, level=-1, workers=None):
+    """
+    Writes a .GladiusSave file from a .bin file, reading and compressing the bulk data a block at a time on several
+    threads. See parallel_compress.py.
+    :param level: The compression level, from 0 to 9, or -1 for zlib's default.
+    :param workers: How many threads to compress on. Defaults to the number of cores.
+    """
+    with open(bin_path, 'rb') as source, open(path, 'wb') as file:
+        file.write(pack_header(header, mods))
+        parallel_compress.compress_stream(source, file, level, workers=workers)
+
+
+def decompressed_chunks(file, chunk_size=1 << 16, max_output=1 << 20):
+    """
+    Decompresses zlib data from a file a piece at a time.
+    :param file: A binary file positioned at the start of the compressed data.
+    :param chunk_size: How much compressed data to read at once.
+    :param max_output: The most decompressed data to produce at once, so that highly compressible data doesn't turn into
+    one huge chunk.
+    :return: A generator of bytes objects.
+    :raises zlib.error: if the file ends before the compressed data does.
+    """
+    decompressor = zlib.decompressobj()
+    while not decompressor.eof:
+        data = decompressor.unconsumed_tail or file.read(chunk_size)
+        if not data:
+            raise zlib.error("The compressed data is incomplete or truncated.")
+        yield decompressor.decompress(data, max_output)
+    yield decompressor.flush()
+
+
+def read_savegame_header(path):
+    """
+    Reads the header and the list of mods from a .GladiusSave file.
+    :return: (header, mods, offset), where header and mods are as returned by read_header, and offset is where the
+    compressed bulk data starts.
+    """
+    with open(path, 'rb') as file:
+        # Only the first few pages of the file are actually read through the memory map
+        data = b.BinReader(file.fileno(), 0, access=ACCESS_READ)
+        header, mods = read_header(data)
+        offset = data.tell()
+        data.close()
+    return header, mods, offset
+
+
+def iter_savegame(path, offset, locations=None, columnar=False):
+    """
+    Reads the bulk data of a saved game one section at a time, decompressing it as it's parsed.
+    :param path: Path to the .GladiusSave file.
+    :param offset: Where the compressed data starts, as returned by read_savegame_header.
+    :param locations: See bulk_parser.parse_bulk. Offsets are within the decompressed data.
+    :param columnar: See bulk_parser.parse_bulk.
+    :return: A generator of (pass_number, key, value), as from bulk_parser.iter_bulk.
+    """
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        binary = b.StreamReader(decompressed_chunks(file))
+        yield from bulk_parser.iter_bulk(binary, locations, columnar=columnar)
+
+
+def stream_savegame(path, locations=None, columnar=False):
+    """
+    Reads a saved game straight into native Python objects, decompressing the bulk data as it's parsed rather than
+    all at once, and without writing a .bin file.
+    :param path: Path to the .GladiusSave file.
+    :param locations: See bulk_parser.parse_bulk. Offsets are within the decompressed data.
+    :param columnar: See bulk_parser.parse_bulk.
+    :return: (header, mods, passes). See read_header and bulk_parser.parse_bulk.
+    """
+    header, mods, offset = read_savegame_header(path)
+    passes = bulk_parser.collect_passes(iter_savegame(path, offset, locations, columnar))
+    return header, mods, passes
+
+
+def load_save(path, columnar=False):
+    """
+    Reads a saved game into memory.
+    :param path: Path to the .GladiusSave file.
+    :param columnar: See bulk_parser.parse_bulk.
+    :return: A dict with keys "header" and "mods", as returned by read_header, and "data", which holds the contents of
+    the save arranged exactly as in the json files written by serial_to_json.py.
+    """
+    header, mods, passes = stream_savegame(path, columnar=columnar)
+    return dict(header=header, mods=mods, data=bulk_parser.zip_passes(passes))
+
+
+def read_data(path):
+    """
+    Reads the contents of a saved game from a .json file, as written by serial_to_json.py, or a .bjson file.
+    """
+    if os.path.splitext(path)[1].lower() == ".bjson":
+        with open(path, 'rb') as file:
+            return bjson.load(file)
+    with open(path, 'r') as file:
+        return json.load(file, object_hook=b.bytes_object_hook)
+
+
+def write_data(data, path, columnar=False):
+    """
+    Writes the contents of a saved game to a .json file, or a .bjson file if the path has that extension.
+    :param columnar: Whether the data may contain NumPy structured arrays, as read with columnar=True.
+    """
+    if columnar:
+        # Only imported when needed, as it depends on NumPy
+        import columnar as c
+    if os.path.splitext(path)[1].lower() == ".bjson":
+        with replacing(path) as temporary_path, open(temporary_path, 'wb') as file:
+            bjson.dump(data, file, default=c.to_native if columnar else b.materialize)
+    else:
+        with replacing(path) as temporary_path, open(temporary_path, 'w') as file:
+            json.dump(data, file, cls=c.ColumnarJSONEncoder if columnar else b.BytesJSONEncoder, indent="    ")
+
+
+def serialize(data):
+    """
+    Turns the contents of a saved game, arranged as in the json files, into the uncompressed bulk data.
+    :return: bytes
+    """
+    output = io.BytesIO()
+    # noinspection PyTypeChecker
+    binary = b.BinWriter(output)
+    bulk_writer.write_bulk(binary, bulk_writer.unzip_passes(data))
+    binary.flush()
+    return output.getvalue()
+
+
+def dump_save(model, path):
+    """
+    Writes a saved game from memory.
+    :param model: A dict with key "data", and optionally "header" and "mods", as returned by load_save. If there's no
+    header, one is made up from the data and the master config file, as json_to_serial.py does. If there are no
+    mods, the list of mods in the world parameters is used.
+    :param path: Path to the .GladiusSave file.
+    """
+    data = model["data"]
+    header = model.get("header")
+    if header is None:
+        header = header_from_data(data, read_config()["GLADIUS"])
+    mods = model.get("mods")
+    if mods is None:
+        mods = data["world_params"][0]["mods"]
+    write_savegame(path, header, mods, serialize(data))
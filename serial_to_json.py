@@ -1,8 +1,10 @@
-import json
 import argparse
+import json
 import os
-import re
-# import configparser
+import bulk_parser
+import json_stream
+import record_index
+import savegame_tools
 from bulk_reader_tools import *
 
 testing = False
@@ -12,14 +14,9 @@ master_config_name = "Config.ini"
 test_file_name = r"C:\Users\rosa\Documents\Proxy Studios\Gladius\SavedGames\SinglePlayer\unpacked saves" \
              r"\all factions.bin"
 
-# Configuration file currently not used
-# config = configparser.ConfigParser(allow_no_value=True)
-# Default behaviour is to make all config option names lowercase
-# We don't want to do that so we override optionxform
-# config.optionxform = lambda option: option
-# config.read(master_config_name)
+# Only used when reading straight from a .GladiusSave file
+config = savegame_tools.read_config(master_config_name)
 
-passes = [{}, {}, {}, {}, {}]  # The main data structure
 locations = [{}, {}, {}, {}, {}]  # Location within the bulk file of each interesting section
 
 # ====================================================================== #
@@ -28,202 +25,112 @@ locations = [{}, {}, {}, {}, {}]  # Location within the bulk file of each intere
 
 if testing:
     input_path = test_file_name
+    columnar = False
+    make_index = False
+    views = 0
+    output_extension = ".json"
+    report_path = None
 else:
-    parser = argparse.ArgumentParser(description="Deserializes the bulk files into native Python objects.")
+    parser = argparse.ArgumentParser(description="Deserializes the bulk files into native Python objects. Can also "
+                                                 "read a .GladiusSave file directly, decompressing it on the fly.")
     parser.add_argument("filename")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Read sections made up of fixed-width records into NumPy structured arrays.")
+    parser.add_argument("--index", action="store_true",
+                        help="Also write an index of where every record starts, for use with record_index.py.")
+    parser.add_argument("--bjson", action="store_true",
+                        help="Write the compact binary format described in bjson.py rather than json.")
+    parser.add_argument("--views", type=int, nargs="?", const=64, default=0, metavar="MIN_SIZE",
+                        help="Hold opaque fields of at least MIN_SIZE bytes (64 if not given) as views of the .bin "
+                             "file rather than copying them. See BinReader.enable_views. Only for .bin files.")
+    parser.add_argument("--report", metavar="PATH",
+                        help="Measure the time, size, records, allocations and values of every section and pass, and "
+                             "save them to this .json file. See instrumentation.py.")
+    parser.add_argument("--no-allocations", action="store_true",
+                        help="Don't trace allocations for --report, which slows everything down.")
+    parser.add_argument("--profile", metavar="SECTION",
+                        help="With --report, profile reading this section with cProfile, given as KEY or PASS:KEY, "
+                             "such as units or 1:units.")
+    parser.add_argument("--profile-output", metavar="PATH",
+                        help="Where to save the profile. Defaults to the output file with the extension .prof.")
     args = parser.parse_args()
     input_path = os.path.abspath(args.filename)
-
-json_output_path = os.path.splitext(input_path)[0] + ".json"
+    columnar = args.columnar
+    make_index = args.index
+    views = args.views
+    output_extension = ".bjson" if args.bjson else ".json"
+    report_path = args.report and os.path.abspath(args.report)
+
+if columnar:
+    import columnar as c
+
+# Offsets of every record, only collected if we're writing an index
+record_offsets = [{}, {}, {}, {}, {}] if make_index else None
+
+# Unless we need all the data at the end, each section is written to the json file as soon as it's been read, and
+# then thrown away. See json_stream.py.
+streaming = output_extension == ".json" and not make_index and not testing
+
+# Saved games are streamed straight into the parser, with no .bin file. Their header goes in an .ini file as with
+# savegame_to_serial.py, and everything is written to the unpacked directory.
+from_savegame = input_path.lower().endswith(".gladiussave")
+
+if from_savegame:
+    directory, name = os.path.split(input_path)
+    directory = os.path.join(directory, config["GLADIUS"]["unpacked directory"])
+    os.makedirs(directory, exist_ok=True)
+    json_output_path = os.path.join(directory, os.path.splitext(name)[0] + output_extension)
+    config_output_path = os.path.join(directory, os.path.splitext(name)[0] + ".ini")
+else:
+    json_output_path = os.path.splitext(input_path)[0] + output_extension
 
 print(f"Deserializing {os.path.basename(input_path)}")
 
-# If you try to open(file_in_name, 'rb') without setting access=b.mmap.ACCESS_READ, you get an error.
-with open(input_path, 'rb') as input_path:
-    binary = b.BinReader(input_path.fileno(), 0, access=b.mmap.ACCESS_READ)
-
-# ================================ #
-# ==== First pass starts here ==== #
-# ================================ #
-
-# world parameters, climates
-for key in first_pass_structure_1:
-    locations[0][key] = binary.tell()
-    passes[0][key] = binary.fpop_structure(first_pass_structure_1[key])
-
-# Events - not implemented yet
-locations[0]["events"] = binary.tell()
-passes[0]["events"] = binary.fpop(b.UINT)
-if passes[0]["events"] != 0:
-    raise NotImplementedError("Events section parsing is not implemented.")
-
-# Actions
-locations[0]["actions"] = binary.tell()
-action_count = binary.fpop(b.UINT)
-passes[0]["actions"] = []
-for n in range(action_count):
-    action = binary.fpop_structure(action_structure)
-    if action["path"].endswith("CycleWeapon"):
-        action["bool1"] = binary.fpop(b.BOOL)
-    passes[0]["actions"].append(action)
-
-# Traits, players, tiles, features, cities, buildingGroups, buildings, units, weapons, items, quests.
-for key in first_pass_structure_2:
-    locations[0][key] = binary.tell()
-    passes[0][key] = binary.fpop_structure(first_pass_structure_2[key])
-
-# Finally, notifications.
-
-locations[0]["notifications"] = binary.tell()
-notification_count = binary.fpop(b.UINT)
-passes[0]["notifications"] = []
-for n in range(notification_count):
-    notif = binary.fpop_structure(notification_prefix)
-    extra = binary.fpop_structure(notification_suffixes[notif["type"]])
-    notif.update(extra)
-    passes[0]["notifications"].append(notif)
-
-# ======================================================= #
-# ==== Allocating length fields to subsequent passes ==== #
-# ======================================================= #
-
-for structure in [second_pass_structure, third_pass_structure, fourth_pass_structure, fifth_pass_structure]:
-    for key in structure:
-        length = len(passes[0][key])
-        try:
-            structure[key][1] = length
-        except TypeError:
-            pass
-
-# ================================= #
-# ==== Second pass starts here ==== #
-# ================================= #
-
-# ID of the current active player
-passes[1]["world_params"] = {"current_player": binary.fpop(b.UINT)}
-
-# Actions require special handling because of the weapon-actions issue
-locations[1]["actions"] = binary.tell()
-passes[1]["actions"] = []
-for action in passes[0]["actions"]:
-    if is_weapon(action["path"]):
-        my_data = binary.fpop_structure(action2_weapon_structure)
-        passes[1]["actions"].append(my_data)
-    else:
-        my_data = binary.fpop_structure(action2_normal_structure)
-        passes[1]["actions"].append(my_data)
-
-# traits, players, tiles, features, cities, buildingGroups, buildings, units, weapons, items
-for key in second_pass_structure:
-    locations[1][key] = binary.tell()
-    passes[1][key] = binary.fpop_structure(second_pass_structure[key])
-
-# Quests - not deserialized, just scanned
-locations[1]["quests"] = binary.tell()
-if len(passes[0]["quests"]) != 0:
-    first_notif_type = passes[0]["notifications"][0]["type"]
-    first_notif_prefix = bytes(str(notification2_prefix_lengths[first_notif_type]), "UTF-8")
-    first_notif_re = b'[\x00-\x01]{' + first_notif_prefix + rb'}\w{5}'
-    quest2_binary = b.DataFormat(re.compile(first_notif_re), bytes, inclusive=False)
-    passes[1]["quests"] = binary.fpop_structure(quest2_binary)
+if report_path:
+    import instrumentation
+    instrument = instrumentation.Instrument(not args.no_allocations,
+                                            args.profile and instrumentation.parse_section(args.profile))
+    # Tells the instrument when each section starts
+    locations = instrument.locations()
+    instrument.begin()
+
+# ====================================================== #
+# ==== Parse every pass, zip them together and save ==== #
+# ====================================================== #
+
+if from_savegame:
+    if make_index:
+        raise ValueError("Indexes can only be made for .bin files.")
+    header, mods, data_offset = savegame_tools.read_savegame_header(input_path)
+    savegame_tools.write_header_config(header, mods, config_output_path)
+    sections = savegame_tools.iter_savegame(input_path, data_offset, locations, columnar)
+    binary = None
+else:
+    # If you try to open(file_in_name, 'rb') without setting access=b.mmap.ACCESS_READ, you get an error.
+    with open(input_path, 'rb') as input_file:
+        binary = b.BinReader(input_file.fileno(), 0, access=b.mmap.ACCESS_READ)
+    if views:
+        binary.enable_views(views)
+    sections = bulk_parser.iter_bulk(binary, locations, record_offsets, columnar)
+
+if report_path:
+    sections = instrument.iter_sections(sections, binary.tell if binary is not None else None)
+
+if streaming:
+    # Only moved into place once every section has been read, so a save that can't be parsed leaves nothing behind
+    with savegame_tools.replacing(json_output_path) as temporary_path, open(temporary_path, 'w') as file:
+        json_stream.dump_bulk(sections, file, cls=c.ColumnarJSONEncoder if columnar else b.BytesJSONEncoder)
 else:
-    passes[1]["quests"] = b''
-
-# Notifications
-locations[1]["notifications"] = binary.tell()
-passes[1]["notifications"] = [binary.fpop_structure(notification2_structures[notif["type"]])
-                              for notif in passes[0]["notifications"]]
-# passes[1]["notifications"] = []
-#
-# for notif in passes[0]["notifications"]:
-#     notif2 = dict(bin1=binary.fpop(7, bytes))
-#     extra = binary.fpop_structure(notification_suffixes[notif["type"]])
-#     notif2.update(extra)
-#     passes[1]["notifications"].append(notif2)
-
-# ================================ #
-# ==== Third pass starts here ==== #
-# ================================ #
-
-# traits, then order data for players, cities, and buildingGroups
-for key in third_pass_structure:
-    locations[2][key] = binary.tell()
-    passes[2][key] = binary.fpop_structure(third_pass_structure[key])
-
-# Notifications again
-locations[2]["notifications"] = binary.tell()
-passes[2]["notifications"] = [binary.fpop_structure(notification2_structures[notif["type"]])
-                              for notif in passes[0]["notifications"]]
-# passes[2]["notifications"] = []
-# for notif in passes[0]["notifications"]:
-#     notif3 = dict(bin1=binary.fpop(7, bytes))
-#     extra = binary.fpop_structure(notification_suffixes[notif["type"]])
-#     notif3.update(extra)
-#     passes[2]["notifications"].append(notif3)
-
-# A dummy value because the tiles data skips a pass for some reason.
-passes[2]["tiles"] = [{} for tile in passes[0]["tiles"]]
-
-# ================================= #
-# ==== Fourth pass starts here ==== #
-# ================================= #
-
-# Tiles, units
-for key in fourth_pass_structure:
-    locations[3][key] = binary.tell()
-    passes[3][key] = binary.fpop_structure(fourth_pass_structure[key])
-
-# Notifications *again*
-locations[3]["notifications"] = binary.tell()
-passes[3]["notifications"] = [binary.fpop_structure(notification2_structures[notif["type"]])
-                              for notif in passes[0]["notifications"]]
-# passes[3]["notifications"] = []
-# for notif in passes[0]["notifications"]:
-#     notif4 = dict(bin1=binary.fpop(7, bytes))
-#     extra = binary.fpop_structure(notification_suffixes[notif["type"]])
-#     notif4.update(extra)
-#     passes[3]["notifications"].append(notif4)
-
-# ================================ #
-# ==== Fifth pass starts here ==== #
-# ================================ #
-
-# Seems to be just notifications for a fifth and final time
-locations[4]["notifications"] = binary.tell()
-passes[4]["notifications"] = [binary.fpop_structure(notification2_structures[notif["type"]])
-                              for notif in passes[0]["notifications"]]
-# passes[4]["notifications"] = []
-# for notif in passes[0]["notifications"]:
-#     notif5 = dict(bin1=binary.fpop(7, bytes))
-#     extra = binary.fpop_structure(notification_suffixes[notif["type"]])
-#     notif5.update(extra)
-#     passes[4]["notifications"].append(notif5)
-
-# ============================= #
-# ==== Rearrange by passes ==== #
-# ============================== #
-
-zippable = ["actions", "traits", "players", "tiles", "features", "cities", "building_groups", "buildings",
-            "units", "weapons", "magic_items", "notifications"]
-
-rearranged = {}
-# from [{"actions": pass1_actions, "traits": pass1_traits}, {"actions": pass2_actions, "traits": pass2_traits}]
-# to {"actions": [pass1_actions, pass2_actions] "traits": [pass1_traits, pass2_traits]}
-for section_title in passes[0].keys():
-    rearranged[section_title] = []
-    for eachPass in passes:
-        try:
-            rearranged[section_title].append(eachPass[section_title])
-        except KeyError:
-            pass
-
-zipped = {}
-
-for section_title, section in rearranged.items():
-    if section_title in zippable:
-        zipped[section_title] = list(zip(*section))
-    else:
-        zipped[section_title] = section
+    passes = bulk_parser.collect_passes(sections)
+    savegame_tools.write_data(bulk_parser.zip_passes(passes), json_output_path, columnar)
+
+if report_path:
+    instrument.finish()
+    with open(report_path, 'w') as file:
+        json.dump(instrument.report(tool="serial_to_json", input=input_path, output=json_output_path,
+                                    columnar=columnar, views=views), file, indent="    ")
+    if args.profile:
+        instrument.dump_profile(args.profile_output or os.path.splitext(json_output_path)[0] + ".prof")
 
 # =================================== #
 # ==== Cleanup and testing tools ==== #
@@ -235,11 +142,13 @@ if testing:
     for key in passes[0]:
         print(f"{lengths[key]} {key}")
 
-print("Position in file as of end of reading:")
-print(binary.tell())
+if binary is not None:
+    print("Position in file as of end of reading:")
+    print(binary.tell())
 
-with open(json_output_path, 'w') as file:
-    json.dump(zipped, file, cls=b.BytesJSONEncoder, indent="    ")
+if make_index:
+    record_index.write_index(record_index.make_index(passes, locations, record_offsets, input_path),
+                             record_index.index_path_for(input_path))
 
-if not testing:
+if not testing and binary is not None:
     binary.close()
@@ -1,8 +1,6 @@
 import argparse
 import os.path
-import configparser
-import struct
-import zlib
+from savegame_tools import read_header_config, write_savegame_from_bin
 
 testing = False
 master_config_name = "Config.ini"
@@ -21,48 +19,26 @@ test_file_name = r"C:\Users\rosa\Documents\Proxy Studios\Gladius\SavedGames\Sing
 
 if testing:
     file_in_name = test_file_name
+    level = -1
+    workers = None
 else:
     parser = argparse.ArgumentParser(description="Compress extracted files back into a playable Gladius saved game.")
     parser.add_argument("filename")
+    parser.add_argument("--level", type=int, default=-1, choices=range(-1, 10), metavar="{0-9}",
+                        help="The zlib compression level. Higher is smaller but slower. Defaults to zlib's default, "
+                             "6. See benchmark_compression.py.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="How many threads to compress on. Defaults to the number of cores.")
     args = parser.parse_args()
     file_in_name = os.path.abspath(args.filename)
+    level = args.level
+    workers = args.workers
 
 config_in_name = os.path.splitext(file_in_name)[0] + ".ini"
 save_out_name = os.path.splitext(file_in_name)[0] + ".GladiusSave"
 
-config_in = configparser.ConfigParser(allow_no_value=True)
+header, mods = read_header_config(config_in_name)
 
-# Default behaviour is to make all config option names lowercase
-# We don't want to do that so we override optionxform
-config_in.optionxform = lambda option: option
-config_in.read(config_in_name)
-header = config_in["HEADER"]
-
-with open(file_in_name, 'rb') as file:
-    binary_data = file.read()
-
-# Null byte used as a separator
-nul = b"\x00"
-
-mods = [bytes(s, encoding="utf-8")+nul for s in config_in["MODS"]]
-
-data = b''.join([
-    bytes(header["version"], encoding="utf-8"),
-    nul,
-    bytes(header["branch"], encoding="utf-8"),
-    nul,
-    bytes(header["revision"], encoding="utf-8"),
-    nul,
-    bytes(header["build"], encoding="utf-8"),
-    nul,
-    bytes(header["steamuser"], encoding="utf-8"),
-    nul,
-    struct.pack('<iii',
-                int(header["turn"]),
-                int(header["checksum"]),  # Not actually used so don't sweat it
-                len(mods)),     # Note: Use the *actual* number of mods, not whatever the config file says
-    b''.join(mods),
-    zlib.compress(binary_data)])
-
-with open(save_out_name, 'wb') as file:
-    file.write(data)
+# The .bin file is compressed a block at a time on several threads, rather than all read in first. See
+# parallel_compress.py.
+write_savegame_from_bin(save_out_name, header, mods, file_in_name, level, workers)
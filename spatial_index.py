@@ -0,0 +1,197 @@
+"""
+Finds the units, features and buildings near a place on the map, or in a region, without looking through every
+object in the save.
+
+Tiles are bucketed into a grid of square cells by their x and y, so a radius or bounding box query only looks at the
+tiles in the cells it overlaps. What's on each tile is found from the objects themselves:
+    units: units[3]["tile_id"] (the fourth pass)
+    features: features[1]["tile_id"]
+    buildings: tiles[1]["building_ids"] of the tile they're on
+Distances are measured in the same units as the tiles' x and y, as a straight line between tile centres.
+
+json_editor_tools.GladiusSave keeps one of these up to date as objects are added, moved and deleted. See
+GladiusSave.spatial_index.
+"""
+
+import collections
+import math
+
+NONE = -1
+indexed_types = ("units", "features", "buildings")
+
+
+class SpatialIndex(object):
+    """
+    A grid of the tiles in a saved game, and what's on each of them.
+    """
+
+    def __init__(self, data, cell_size=4.0):
+        """
+        :param data: The contents of a saved game, as in the json files. Deleted objects may be left as None, as in
+        json_editor_tools.GladiusSave.
+        :param cell_size: The width and height of each grid cell. Queries are quickest when it's about the size of a
+        typical radius.
+        """
+        self.cell_size = cell_size
+        self._tiles = {}  # Tile id -> (x, y, region name)
+        self._grid = collections.defaultdict(list)  # (column, row) -> tile ids
+        self._regions = collections.defaultdict(list)  # Region name -> tile ids
+        for tile in data.get("tiles", ()):
+            if tile is None:
+                continue
+            x, y, region = tile[0]["x"], tile[0]["y"], tile[0]["region_name"]
+            self._tiles[tile[0]["id"]] = (x, y, region)
+            self._grid[self._cell(x, y)].append(tile[0]["id"])
+            self._regions[region].append(tile[0]["id"])
+
+        # Type -> {object id: tile id} and type -> {tile id: set of object ids}
+        self._locations = {type_: {} for type_ in indexed_types}
+        self._contents = {type_: collections.defaultdict(set) for type_ in indexed_types}
+        for type_ in indexed_types:
+            self.reindex(type_, data)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def reindex(self, type_, data):
+        """
+        Finds where every object of one type is from scratch, for when a whole section has been replaced.
+        """
+        self._locations[type_].clear()
+        self._contents[type_].clear()
+        for id_, tile_id in locate(type_, data):
+            self.place(type_, id_, tile_id)
+
+    # ==== Keeping up to date ==== #
+
+    def place(self, type_, id_, tile_id):
+        """
+        Records that an object is on a tile, moving it there if it was somewhere else. A tile_id of NONE takes it off
+        the map, as for units in transports.
+        """
+        self.remove(type_, id_)
+        if tile_id == NONE:
+            return
+        self._locations[type_][id_] = tile_id
+        self._contents[type_][tile_id].add(id_)
+
+    def remove(self, type_, id_):
+        """
+        Forgets about an object. Does nothing if it wasn't on the map.
+        """
+        tile_id = self._locations[type_].pop(id_, NONE)
+        if tile_id != NONE:
+            contents = self._contents[type_][tile_id]
+            contents.discard(id_)
+            if not contents:
+                del self._contents[type_][tile_id]
+
+    # ==== Queries ==== #
+
+    def location(self, type_, id_):
+        """
+        :return: The id of the tile an object is on, or NONE if it isn't on the map.
+        """
+        return self._locations[type_].get(id_, NONE)
+
+    def position(self, tile_id):
+        """
+        :return: (x, y) of a tile.
+        :raises KeyError: if there's no such tile.
+        """
+        x, y, region = self._tiles[tile_id]
+        return x, y
+
+    def region_of(self, tile_id):
+        return self._tiles[tile_id][2]
+
+    def tiles_in_box(self, x_min, y_min, x_max, y_max):
+        """
+        :return: A list of the ids of every tile with x_min <= x <= x_max and y_min <= y <= y_max.
+        """
+        column_min, row_min = self._cell(x_min, y_min)
+        column_max, row_max = self._cell(x_max, y_max)
+        found = []
+        tiles = self._tiles
+        for column in range(column_min, column_max + 1):
+            for row in range(row_min, row_max + 1):
+                for tile_id in self._grid.get((column, row), ()):
+                    x, y, region = tiles[tile_id]
+                    if x_min <= x <= x_max and y_min <= y <= y_max:
+                        found.append(tile_id)
+        return found
+
+    def tiles_in_radius(self, x, y, radius):
+        """
+        :return: A list of the ids of every tile within radius of (x, y).
+        """
+        squared = radius * radius
+        tiles = self._tiles
+        found = []
+        for tile_id in self.tiles_in_box(x - radius, y - radius, x + radius, y + radius):
+            tile_x, tile_y, region = tiles[tile_id]
+            if (tile_x - x) ** 2 + (tile_y - y) ** 2 <= squared:
+                found.append(tile_id)
+        return found
+
+    def tiles_near(self, tile_id, radius):
+        """
+        :return: A list of the ids of every tile within radius of the given tile, including itself.
+        """
+        return self.tiles_in_radius(*self.position(tile_id), radius)
+
+    def tiles_in_region(self, region_name):
+        return list(self._regions.get(region_name, ()))
+
+    def on_tiles(self, tile_ids, types=indexed_types):
+        """
+        :param tile_ids: An iterable of tile ids, as returned by the tiles_ methods.
+        :param types: Which of "units", "features" and "buildings" to look for.
+        :return: A dict mapping each type to a list of the ids of the objects of that type on the tiles.
+        """
+        tile_ids = list(tile_ids)
+        found = {}
+        for type_ in types:
+            contents = self._contents[type_]
+            found[type_] = [id_ for tile_id in tile_ids if tile_id in contents for id_ in contents[tile_id]]
+        return found
+
+    def in_box(self, x_min, y_min, x_max, y_max, types=indexed_types):
+        return self.on_tiles(self.tiles_in_box(x_min, y_min, x_max, y_max), types)
+
+    def in_radius(self, x, y, radius, types=indexed_types):
+        return self.on_tiles(self.tiles_in_radius(x, y, radius), types)
+
+    def near(self, tile_id, radius, types=indexed_types):
+        return self.on_tiles(self.tiles_near(tile_id, radius), types)
+
+    def in_region(self, region_name, types=indexed_types):
+        return self.on_tiles(self._regions.get(region_name, ()), types)
+
+
+def tile_of(type_, entry):
+    """
+    :param type_: "units" or "features".
+    :return: The id of the tile the object is on, or NONE if it isn't on the map.
+    """
+    if type_ == "units":
+        return entry[3].get("tile_id", NONE) if len(entry) > 3 else NONE
+    elif type_ == "features":
+        return entry[1].get("tile_id", NONE)
+    raise ValueError(f"Objects in {type_} don't say where they are. Buildings are listed by their tiles.")
+
+
+def locate(type_, data):
+    """
+    :return: A generator of (object id, tile id) for every object of the given type, including those that aren't on
+    the map, whose tile id is NONE.
+    """
+    if type_ == "buildings":
+        for tile in data.get("tiles", ()):
+            if tile is not None:
+                for building_id in tile[1].get("building_ids", ()):
+                    yield building_id, tile[0]["id"]
+    else:
+        for entry in data.get(type_, ()):
+            if entry is not None:
+                yield entry[0]["id"], tile_of(type_, entry)
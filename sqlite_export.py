@@ -0,0 +1,400 @@
+"""
+Exports saved games into an SQLite database, so that they can be looked into with SQL rather than loops over the json
+data, and many saves can be compared at once.
+
+Every section with a record for each object (players, units, tiles, traits, actions, cities, notifications and so on)
+gets a table with a row for each object, and a column for each value in every pass. Columns from later passes that
+would have the same name as an earlier one are prefixed with the pass number, counting from 0, such as
+"pass1_bin1". Lists, such as a player's tiles_revealed or a unit's transported_units, each get a child table named
+after the section and the list, such as players_tiles_revealed, with a row for each item. Child tables refer to their
+parent by its id if the section has ids, in a parent_id column, or otherwise by its position in the section.
+
+Notifications and actions have different values depending on their type, so their tables have a column for every value
+any type has, which is NULL where it doesn't apply.
+
+The saves table has a row for each save, with what's in its header if it's a .GladiusSave file, and every other table
+has a save_id column referring to it. A save that's already in the database is skipped if it hasn't changed, and
+replaced if it has.
+
+The saves are parsed in parallel, in separate processes, and written to the database one at a time, each in a single
+transaction. Indexes are built once everything has been loaded.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import binarizer as b
+import bulk_parser
+import savegame_tools
+from batch_convert import find_inputs
+from bulk_reader_tools import *
+
+SCHEMA_VERSION = 1
+
+# The header values kept in the saves table
+header_columns = [name for name in header_structure if name != "mod_count"]
+
+
+def _sql_type(structure):
+    if structure.until == b"\x00":
+        return "TEXT"
+    elif isinstance(structure.from_bytes, str) and structure.from_bytes in "fd":
+        return "REAL"
+    elif isinstance(structure.from_bytes, str):
+        return "INTEGER"
+    return "BLOB"
+
+
+def _union(structures):
+    """
+    :return: A dict structure with every value in any of the given dict structures, in the order they first appear.
+    """
+    union = {}
+    for structure in structures:
+        for key, value in structure.items():
+            union.setdefault(key, value)
+    return union
+
+
+def _flatten(structure, path, name, columns, lists):
+    """
+    Sorts the values in a record structure into columns and lists.
+    :param path: The keys and indexes leading to structure from the start of the record.
+    :param name: The column name for structure.
+    :param columns: A list that (name, SQL type, path) is added to for each single value.
+    :param lists: A list that (name, path, item structure) is added to for each list.
+    """
+    if isinstance(structure, b.DataFormat):
+        columns.append((name, _sql_type(structure), path))
+    elif isinstance(structure, dict):
+        for key, substructure in structure.items():
+            _flatten(substructure, path + (key,), f"{name}_{key}" if name else key, columns, lists)
+    elif isinstance(structure, tuple):
+        for index, substructure in enumerate(structure):
+            _flatten(substructure, path + (index,), f"{name}_{index}" if name else f"value_{index}", columns, lists)
+    else:
+        lists.append((name, path, structure[0]))
+
+
+def _get(record, path):
+    for part in path:
+        if record is None:
+            return None
+        # Records of sections with more than one structure might not have every value
+        record = record.get(part) if isinstance(part, str) else record[part]
+    return record
+
+
+class _Table(object):
+    """
+    A table, and how to turn records into rows of it.
+    """
+    def __init__(self, name, key_columns):
+        self.name = name
+        # (name, SQL type) of every column, including the ones that are the same for every row of a record
+        self.columns = list(key_columns)
+        # For each pass, a list of the paths to every value that has a column
+        self.paths = []
+        self.children = []
+        self.indexed = []
+
+    def add_pass(self, pass_number, structure):
+        """
+        Adds the columns for one pass of a record, and makes child tables for its lists.
+        :return: A list of (child table, path to the list) for the lists in the pass.
+        """
+        columns = []
+        lists = []
+        _flatten(structure, (), "", columns, lists)
+        names = {name for name, _ in self.columns}
+        paths = []
+        for name, type_, path in columns:
+            if name in names:
+                name = f"pass{pass_number}_{name}"
+            names.add(name)
+            self.columns.append((name, type_))
+            paths.append(path)
+        self.paths.append(paths)
+        pass_lists = []
+        for name, path, item_structure in lists:
+            if f"{self.name}_{name}" in {child.name for child, _, _ in self.children}:
+                name = f"pass{pass_number}_{name}"
+            child = _Table(f"{self.name}_{name}", self.child_key_columns())
+            if not isinstance(item_structure, (dict, tuple)):
+                item_structure = dict(value=item_structure)
+            child.add_pass(0, item_structure)
+            if child.children:
+                raise NotImplementedError(f"Lists within lists, such as {child.name}, can't be exported.")
+            self.children.append((child, pass_number, path))
+            pass_lists.append((child, path))
+        return pass_lists
+
+    def child_key_columns(self):
+        if any(name == "id" for name, _ in self.columns):
+            return [("save_id", "INTEGER"), ("parent_id", "INTEGER"), ("position", "INTEGER")]
+        return [("save_id", "INTEGER"), ("parent_position", "INTEGER"), ("position", "INTEGER")]
+
+    def create(self):
+        return f'CREATE TABLE IF NOT EXISTS "{self.name}" (' \
+               + ", ".join(f'"{name}" {type_}' for name, type_ in self.columns) + ")"
+
+    def insert(self):
+        return f'INSERT INTO "{self.name}" VALUES (' + ", ".join("?" * len(self.columns)) + ")"
+
+    def indexes(self):
+        """
+        :return: The statements that create this table's indexes.
+        """
+        names = [name for name, _ in self.columns]
+        key = next((column for column in ("id", "parent_id", "parent_position") if column in names), None)
+        columns = "save_id" if key is None else f'save_id, "{key}"'
+        return [f'CREATE INDEX IF NOT EXISTS "{self.name}_index" ON "{self.name}" ({columns})']
+
+
+def _section_structures(key):
+    """
+    :return: The record structure of a section in each pass it's in, with None for any passes it skips.
+    """
+    if key == "world_params":
+        return [world_params_structure, dict(current_player=b.UINT)]
+    elif key == "actions":
+        # The cycle weapon and weapon structures have everything the others have, and a bit more
+        return [action_cycle_weapon_structure, action2_weapon_structure]
+    elif key == "notifications":
+        return [_union(notification_structures.values())] + [_union(notification2_structures.values())] * 4
+    structures = [bulk_parser.record_structures[pass_number].get(key) for pass_number in range(5)]
+    while structures[-1] is None:
+        structures.pop()
+    return structures
+
+
+# Sections with a record per object, but only one pass, which aren't zipped
+_unzipped_sections = ["climates", "quests"]
+# The sections that get a table. Events are always empty, and the second pass of the quests is a single block of
+# bytes, kept in the saves table.
+section_names = ["world_params", *_unzipped_sections, *bulk_parser.zippable]
+
+
+def _make_tables():
+    tables = {}
+    for key in section_names:
+        table = _Table(key, [("save_id", "INTEGER"), ("position", "INTEGER")])
+        for pass_number, structure in enumerate(_section_structures(key)):
+            if structure is None:
+                table.paths.append([])
+            else:
+                table.add_pass(pass_number, structure)
+        tables[key] = table
+    return tables
+
+
+tables = _make_tables()
+
+saves_table = _Table("saves", [("save_id", "INTEGER PRIMARY KEY"), ("path", "TEXT UNIQUE"), ("size", "INTEGER"),
+                               ("mtime_ns", "INTEGER"), *((name, "TEXT") for name in header_columns[:5]),
+                               ("turn", "INTEGER"), ("checksum", "INTEGER"), ("quests_data", "BLOB")])
+
+
+def _all_tables():
+    yield saves_table
+    for table in tables.values():
+        yield table
+        for child, _, _ in table.children:
+            yield child
+
+
+def _entries(data, key):
+    """
+    :return: A list of the records of each object in a section, as a list with one record for each pass.
+    """
+    if key == "world_params":
+        return [data["world_params"]]
+    elif key in _unzipped_sections:
+        return [[record] for record in data[key][0]]
+    return data[key]
+
+
+def make_rows(data):
+    """
+    Turns the data of a save into rows for every table, leaving out the save_id at the start of every row.
+    :param data: The zipped data, as in the json files.
+    :return: A dict mapping table names to lists of rows.
+    """
+    rows = {}
+    for key, table in tables.items():
+        entries = _entries(data, key)
+        section_rows = rows[table.name] = []
+        pass_count = len(table.paths)
+        for position, entry in enumerate(entries):
+            row = [position]
+            for pass_number in range(pass_count):
+                record = entry[pass_number] if pass_number < len(entry) else None
+                row.extend(_get(record, path) for path in table.paths[pass_number])
+            section_rows.append(row)
+
+        has_ids = table.child_key_columns()[1][0] == "parent_id"
+        for child, pass_number, path in table.children:
+            child_rows = rows[child.name] = []
+            item_paths = child.paths[0]
+            scalar = item_paths == [("value",)]
+            for position, entry in enumerate(entries):
+                if pass_number >= len(entry):
+                    continue
+                items = _get(entry[pass_number], path)
+                if not items:
+                    continue
+                parent = entry[0].get("id") if has_ids else position
+                if scalar:
+                    child_rows.extend([parent, index, item] for index, item in enumerate(items))
+                else:
+                    child_rows.extend([parent, index, *(_get(item, item_path) for item_path in item_paths)]
+                                      for index, item in enumerate(items))
+    return rows
+
+
+def read_save(path):
+    """
+    Reads a .GladiusSave, .bin, .json or .bjson file.
+    :return: (header or None, data), where data is the zipped data, as in the json files.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".gladiussave":
+        model = savegame_tools.load_save(path)
+        return model["header"], model["data"]
+    elif extension == ".bin":
+        with open(path, 'rb') as file:
+            binary = b.BinReader(file.fileno(), 0, access=b.mmap.ACCESS_READ)
+        passes = bulk_parser.parse_bulk(binary)
+        binary.close()
+        return None, bulk_parser.zip_passes(passes)
+    return None, savegame_tools.read_data(path)
+
+
+def _convert(path):
+    """
+    Reads a save and turns it into rows, in a worker process. Never raises.
+    :return: (header, rows, error message)
+    """
+    try:
+        header, data = read_save(path)
+        rows = make_rows(data)
+        quests = data.get("quests", [])
+        rows["saves"] = [[bytes(quests[1]) if len(quests) > 1 else None]]
+        return header, rows, None
+    except Exception as error:
+        return None, None, f"{type(error).__name__}: {error}\n{traceback.format_exc()}"
+
+
+def create_schema(connection):
+    """
+    Creates every table, if they aren't there already.
+    """
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        raise ValueError(f"The database was made by a different version of this exporter ({version}).")
+    with connection:
+        for table in _all_tables():
+            connection.execute(table.create())
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def create_indexes(connection):
+    with connection:
+        for table in _all_tables():
+            for statement in table.indexes()[1 if table is saves_table else 0:]:
+                connection.execute(statement)
+
+
+def _insert_save(connection, save_id, path, stat, header, rows):
+    """
+    Writes one save to the database in a single transaction, replacing any earlier version of it.
+    """
+    with connection:
+        old = connection.execute('SELECT save_id FROM saves WHERE path = ?', (path,)).fetchone()
+        if old is not None:
+            for table in _all_tables():
+                connection.execute(f'DELETE FROM "{table.name}" WHERE save_id = ?', old)
+        header = header or {}
+        connection.execute(saves_table.insert(), [save_id, path, stat.st_size, stat.st_mtime_ns,
+                                                  *(header.get(name) for name in header_columns),
+                                                  *rows.pop("saves")[0]])
+        for name, table_rows in rows.items():
+            table = tables.get(name) or next(child for table in tables.values() for child, _, _ in table.children
+                                             if child.name == name)
+            connection.executemany(table.insert(), ([save_id, *row] for row in table_rows))
+
+
+def export_saves(database_path, paths, workers=None):
+    """
+    Exports saves into a database, creating it if need be.
+    :param paths: The .GladiusSave, .bin, .json or .bjson files to export.
+    :param workers: How many processes to parse saves in. Defaults to the number of cores.
+    :return: A dict mapping the path of every save that couldn't be exported to the error.
+    """
+    connection = sqlite3.connect(database_path)
+    failures = {}
+    try:
+        create_schema(connection)
+        known = {path: (size, mtime_ns) for path, size, mtime_ns
+                 in connection.execute("SELECT path, size, mtime_ns FROM saves")}
+        next_id = (connection.execute("SELECT MAX(save_id) FROM saves").fetchone()[0] or 0) + 1
+        # Stats are taken before parsing, so that a file that changes while it's exported is done again next time
+        stats = {path: os.stat(path) for path in paths}
+        pending = [path for path in paths if known.get(path) != (stats[path].st_size, stats[path].st_mtime_ns)]
+        print(f"{len(paths)} saves found, {len(pending)} to export")
+
+        start = time.perf_counter()
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Only a few saves are parsed ahead, as their rows can take up a lot of memory while they wait
+            remaining = iter(pending)
+            running = {}
+            for path in remaining:
+                running[executor.submit(_convert, path)] = path
+                if len(running) >= 2 * workers:
+                    break
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    header, rows, error = future.result()
+                    if error is not None:
+                        failures[path] = error
+                        print(f"failed: {path} ({error.splitlines()[0]})")
+                    else:
+                        _insert_save(connection, next_id, path, stats[path], header, rows)
+                        next_id += 1
+                        print(f"done: {path}")
+                    following = next(remaining, None)
+                    if following is not None:
+                        running[executor.submit(_convert, following)] = following
+
+        create_indexes(connection)
+        print(f"Exported {len(pending) - len(failures)} saves in {time.perf_counter() - start:.1f}s, "
+              f"{len(failures)} failed")
+    finally:
+        connection.close()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports saved games into an SQLite database.")
+    parser.add_argument("database", help="The SQLite database to write to. Created if it doesn't exist.")
+    parser.add_argument("paths", nargs="+",
+                        help="Saves to export: .GladiusSave, .bin, .json or .bjson files, or directories to search "
+                             "for them.")
+    parser.add_argument("--extensions", nargs="+", default=[".GladiusSave"],
+                        help="The kinds of file to look for in directories.")
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to the number of cores.")
+    args = parser.parse_args()
+
+    save_paths = []
+    for given_path in args.paths:
+        if os.path.isdir(given_path):
+            save_paths.extend(find_inputs(os.path.abspath(given_path), args.extensions))
+        else:
+            save_paths.append(os.path.abspath(given_path))
+    export_saves(os.path.abspath(args.database), save_paths, args.workers)
@@ -0,0 +1,402 @@
+"""
+Makes up saved games of any size, for testing how the tools cope with huge maps, tens of thousands of units or years'
+worth of notifications, without needing the game or any real saves.
+
+Every section is filled in following the structures in bulk_reader_tools. Values nobody has worked out are random,
+but everything that refers to something else is consistent, so references.check_integrity finds nothing wrong:
+    - the map is a grid of tiles, split into square regions, with features, cities and units on them
+    - each city has building groups and buildings, on tiles it occupies
+    - each unit has its own actions, traits and weapons, and some are carried by transports
+    - actions and traits are linked to each other, as are magic items and their actions
+    - there's at least one notification of every type in notification_suffixes
+    - quests have blocks of data that quest_scanner.py can find the ends of
+
+Some of the actions are weapons, using the names in weapon_names. Reading or writing the saves needs those to be in
+the weapon catalog: call use_synthetic_weapons first, unless the game's catalog already has them.
+
+Run this script to write a save as .json, .bjson, .bin or .GladiusSave.
+"""
+
+import argparse
+import os
+import random
+import string
+import struct
+import binarizer as b
+import bulk_reader_tools
+import bulk_writer
+import savegame_tools
+from bulk_reader_tools import *
+
+NONE = -1
+weapon_names = ["Bolter", "Lasgun", "Flamer", "Shoota", "GaussFlayer", "Shuriken"]
+factions = ["AstraMilitarum", "SpaceMarines", "Orks", "Necrons", "Eldar", "ChaosSpaceMarines"]
+unit_types = ["Guardsman", "TacticalSpaceMarine", "Boy", "NecronWarrior", "Guardian", "ChaosSpaceMarine"]
+feature_types = ["Forest", "ImperialRuins", "NecronTomb", "OrkoidFungus", "Webway", "WireWeed", "Artefact"]
+building_types = ["Headquarters", "Farm", "Mine", "Barracks", "Laboratory", "Temple"]
+trait_names = ["Traits/Fearless", "Traits/Infantry", "Traits/Armoured", "Traits/Enslaved", "Traits/Veteran"]
+
+# How many of each thing to make, by default
+default_sizes = dict(
+    players=4,
+    width=32,  # Of the map, in tiles
+    height=32,
+    region_size=8,  # The width and height of each region, in tiles
+    features=100,
+    cities=4,
+    building_groups=3,  # Per city
+    buildings=2,  # Per building group
+    units=200,
+    transported=4,  # Units in transports
+    traits=4,  # Per unit, at most
+    actions=3,  # Per unit, at most
+    weapons=2,  # Per unit, at most
+    magic_items=8,
+    quests=4,
+    quest_data=64,  # The average size of each quest's block of data
+    notifications=200,
+    climates=5,
+)
+
+
+def use_synthetic_weapons():
+    """
+    Makes is_weapon recognise the weapons in made-up saves. See bulk_reader_tools.set_weapon_catalog.
+    """
+    bulk_reader_tools.set_weapon_catalog(weapon_names)
+
+
+def sample_value(structure, rng):
+    """
+    Makes up a value that fits the given structure.
+    """
+    if isinstance(structure, b.DataFormat):
+        if isinstance(structure.until, bytes):
+            return "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(0, 20)))
+        elif isinstance(structure.from_bytes, str):
+            code = structure.from_bytes
+            if code == "?":
+                return rng.random() < 0.5
+            elif code == "c":
+                return bytes([rng.randint(0, 255)])
+            elif code in "fd":
+                return struct.unpack(code, struct.pack(code, rng.uniform(-1000, 1000)))[0]
+            else:
+                bits = 8 * structure.until
+                if code.islower():
+                    return rng.randint(-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+                else:
+                    return rng.randint(0, 2 ** bits - 1)
+        else:
+            return bytes(rng.randint(0, 255) for _ in range(structure.until))
+    elif isinstance(structure, list):
+        if len(structure) == 2 and isinstance(structure[1], int):
+            length = structure[1]
+        else:
+            length = rng.randint(0, 5)
+        return [sample_value(structure[0], rng) for _ in range(length)]
+    elif isinstance(structure, dict):
+        return {name: sample_value(substructure, rng) for name, substructure in structure.items()}
+    else:
+        return [sample_value(substructure, rng) for substructure in structure]
+
+
+class _Builder(object):
+    """
+    Keeps track of the sections while they're filled in. Every object's id is its position in its section.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.data = {key: [] for key in ["actions", "traits", "players", "tiles", "features", "cities",
+                                         "building_groups", "buildings", "units", "weapons", "magic_items",
+                                         "notifications"]}
+
+    def sample(self, structure, **values):
+        record = sample_value(structure, self.rng)
+        record.update(values)
+        return record
+
+    def new(self, key, *passes):
+        """
+        Adds an object, setting the id in its first pass.
+        :return: The id.
+        """
+        id_ = len(self.data[key])
+        passes[0]["id"] = id_
+        self.data[key].append(list(passes))
+        return id_
+
+    def trait(self, player, origin_unit=NONE, linked_action=NONE):
+        return self.new("traits",
+                        self.sample(trait_structure, name=self.rng.choice(trait_names), prerequisites=[]),
+                        dict(player=player, origin_unit=origin_unit),
+                        dict(linked_action=linked_action))
+
+    def action(self, path, player, item_id=NONE, weapon_id=None):
+        """
+        Adds an action with a trait of its own, linked both ways.
+        """
+        id_ = len(self.data["actions"])
+        first_pass = self.sample(action_cycle_weapon_structure if path.endswith("CycleWeapon") else action_structure,
+                                 path=path, id2=id_, item_id=item_id)
+        second_pass = dict(linked_traits=[self.trait(player, linked_action=id_)], bin1=bytes(4), item_id_2=item_id)
+        if weapon_id is not None:
+            second_pass["weapon_id"] = weapon_id
+        return self.new("actions", first_pass, second_pass)
+
+    def order(self):
+        return self.sample(order_structure, order_action=NONE)
+
+
+def _quest_data(rng, size):
+    # Bytes that can't be mistaken for the start of a quest or of the notifications after them. See quest_scanner.py.
+    return bytes(rng.randint(2, 9) for _ in range(rng.randint(size // 2, size * 3 // 2)))
+
+
+def make_data(seed=0, **sizes):
+    """
+    Makes up the contents of a saved game.
+    :param seed: Seed for the random numbers, so that the same arguments always give the same save.
+    :param sizes: How many of each thing to make. See default_sizes.
+    :return: A dict arranged exactly as in the json files written by serial_to_json.py.
+    """
+    unknown = set(sizes) - set(default_sizes)
+    if unknown:
+        raise TypeError(f"Unknown sizes: {', '.join(sorted(unknown))}")
+    sizes = dict(default_sizes, **sizes)
+    rng = random.Random(seed)
+    builder = _Builder(rng)
+    data = builder.data
+    tile_count = sizes["width"] * sizes["height"]
+    # Each city takes up to three tiles
+    if sizes["units"] + sizes["features"] + 3 * sizes["cities"] > tile_count:
+        raise ValueError(f"A {sizes['width']}x{sizes['height']} map doesn't have room for "
+                         f"{sizes['units']} units, {sizes['features']} features and {sizes['cities']} cities.")
+    if sizes["quests"] and not sizes["notifications"]:
+        raise ValueError("The end of the quests can only be found if there are notifications after them.")
+
+    world_params = builder.sample(world_params_structure, mods=[], dlcs=[], turn_number=100, multiplayer=False)
+    climates = [builder.sample(climate_structure) for _ in range(sizes["climates"])]
+
+    # ==== Players ==== #
+    players = range(sizes["players"])
+    for player in players:
+        builder.new("players",
+                    builder.sample(player_structure, name=f"Player {player}", faction=factions[player % len(factions)],
+                                   is_AI=player != 0),
+                    builder.sample(player2_structure, actions=[], global_traits=[], player_id_again=player,
+                                   quests_in_progress=[], quests_completed=[], tiles_revealed=[], tiles_watched=[]),
+                    builder.order())
+
+    # ==== The map ==== #
+    region_size = sizes["region_size"]
+    for y in range(sizes["height"]):
+        for x in range(sizes["width"]):
+            builder.new("tiles",
+                        builder.sample(tile_structure, buildings_count=0, x=float(x), y=float(y),
+                                       region_name=f"Region{y // region_size}_{x // region_size}",
+                                       river_in=NONE, river_out=NONE, quest_tag=""),
+                        dict(effects=[], Fs=b"\xff" * 4, features=[], city_feature_id=NONE, city_id=NONE,
+                             building_ids=[]),
+                        {},
+                        dict(unit=NONE))
+    tiles = data["tiles"]
+    free_tiles = list(range(tile_count))
+    rng.shuffle(free_tiles)
+
+    for player in data["players"]:
+        revealed = sorted(rng.sample(range(tile_count), rng.randint(1, tile_count)))
+        player[1]["tiles_revealed"] = revealed
+        player[1]["tiles_watched"] = revealed[:len(revealed) // 2]
+
+    for _ in range(sizes["features"]):
+        tile_id = free_tiles.pop()
+        owner = rng.choice(players)
+        id_ = builder.new("features",
+                          builder.sample(feature_structure, feature=rng.choice(feature_types)),
+                          dict(traits=[], owner=owner, tile_id=tile_id))
+        trait_id = builder.trait(owner)
+        data["features"][id_][1]["traits"] = [[data["traits"][trait_id][0]["name"], trait_id]]
+        tiles[tile_id][1]["features"].append(id_)
+
+    # ==== Cities and their buildings ==== #
+    for _ in range(sizes["cities"]):
+        tile_id = free_tiles.pop()
+        owner = rng.choice(players)
+        faction = factions[owner % len(factions)]
+        city_id = builder.new("cities",
+                              builder.sample(city_structure, faction1=faction, faction2=faction),
+                              builder.sample(city2_structure, buildings=[], building_groups=[], tiles_occupied=[],
+                                             bin4=[bytes(4)] * 4),
+                              builder.order())
+        city = data["cities"][city_id]
+        # The city's own tile and whichever neighbours aren't taken
+        occupied = [tile_id] + [neighbour for neighbour in (tile_id - 1, tile_id + 1) if neighbour in free_tiles]
+        for occupied_tile in occupied[1:]:
+            free_tiles.remove(occupied_tile)
+        city[1]["tiles_occupied"] = occupied
+        for occupied_tile in occupied:
+            tiles[occupied_tile][1]["city_id"] = city_id
+
+        for _ in range(sizes["building_groups"]):
+            group_id = builder.new("building_groups",
+                                   builder.sample(building_group_structure, type=rng.choice(building_types)),
+                                   builder.sample(building_group2_structure, buildings=[]),
+                                   builder.order())
+            city[1]["building_groups"].append(group_id)
+            for _ in range(sizes["buildings"]):
+                building_id = builder.new("buildings",
+                                          builder.sample(building_structure,
+                                                         type=data["building_groups"][group_id][0]["type"]),
+                                          builder.sample(building2_structure))
+                data["building_groups"][group_id][1]["buildings"].append(building_id)
+                city[1]["buildings"].append(building_id)
+                building_tile = tiles[rng.choice(occupied)]
+                building_tile[1]["building_ids"].append(building_id)
+                building_tile[0]["buildings_count"] += 1
+
+    # ==== Units, with their actions, traits and weapons ==== #
+    for unit_number in range(sizes["units"]):
+        unit_id = len(data["units"])
+        owner = rng.choice(players)
+        unit_type = rng.choice(unit_types)
+        traits = [builder.trait(owner, origin_unit=unit_id) for _ in range(rng.randint(0, sizes["traits"]))]
+        weapons = []
+        actions = [builder.action(f"Units/{factions[owner % len(factions)]}/{unit_type}/HoldFire", owner)]
+        for slot in range(rng.randint(0, sizes["weapons"])):
+            weapon_id = builder.new("weapons",
+                                    builder.sample(weapon_structure, slot=slot),
+                                    dict(traits=[], Fs=b"\xff" * 4, unit_id=unit_id))
+            weapons.append(weapon_id)
+            actions.append(builder.action(f"Units/{factions[owner % len(factions)]}/{unit_type}/UseWeapon/"
+                                          f"{rng.choice(weapon_names)}", owner, weapon_id=weapon_id))
+        if len(weapons) > 1:
+            actions.append(builder.action(f"Units/{factions[owner % len(factions)]}/{unit_type}/CycleWeapon", owner))
+        for _ in range(rng.randint(0, sizes["actions"] - 1)):
+            actions.append(builder.action(f"Units/{factions[owner % len(factions)]}/{unit_type}/Ability", owner))
+
+        tile_id = free_tiles.pop()
+        builder.new("units",
+                    builder.sample(unit_structure, type=f"Units/{factions[owner % len(factions)]}/{unit_type}"),
+                    builder.sample(unit2_structure,
+                                   actions=actions,
+                                   traits=[dict(name=data["traits"][trait_id][0]["name"], id=trait_id)
+                                           for trait_id in traits],
+                                   owner=owner,
+                                   controller=owner,
+                                   zeroes1=bytes(4),
+                                   parent_tile=tile_id,
+                                   int1=unit_id,
+                                   previous_move=[tile_id],
+                                   threat_tile=NONE,
+                                   zeroes2=bytes(8),
+                                   transport=NONE,
+                                   weapons=weapons,
+                                   last_weapons_used=[],
+                                   Fs=b"\xff" * 4,
+                                   transported_units=[],
+                                   hero_skills=[]),
+                    builder.order(),
+                    dict(tile_id=tile_id))
+        tiles[tile_id][3]["unit"] = unit_id
+
+    # Put some units in transports, taking them off the map
+    units = data["units"]
+    passengers = rng.sample(units, min(sizes["transported"], len(units) // 2))
+    passenger_ids = {passenger[0]["id"] for passenger in passengers}
+    transports = [unit for unit in units if unit[0]["id"] not in passenger_ids]
+    for passenger in passengers:
+        transport = rng.choice(transports)
+        passenger[1]["transport"] = transport[0]["id"]
+        transport[1]["transported_units"].append(passenger[0]["id"])
+        tiles[passenger[3]["tile_id"]][3]["unit"] = NONE
+        passenger[3]["tile_id"] = NONE
+
+    # ==== Magic items ==== #
+    for _ in range(sizes["magic_items"]):
+        item_id = len(data["magic_items"])
+        name = f"Items/Item{item_id}"
+        builder.new("magic_items",
+                    builder.sample(magic_item_structure, name=name),
+                    dict(actions=[builder.action(f"{name}/Use", rng.choice(players), item_id=item_id)]))
+
+    # ==== Quests ==== #
+    quests = [dict(name=f"Factions/{factions[number % len(factions)]}/Quest{number}", number=number,
+                   stage=rng.randrange(5), bin1=_quest_data(rng, sizes["quest_data"]))
+              for number in range(sizes["quests"])]
+    quest_data2 = _quest_data(rng, sizes["quest_data"] * sizes["quests"]) if quests else b""
+
+    # ==== Notifications ==== #
+    types = list(notification_suffixes)
+    for number in range(sizes["notifications"]):
+        # Every type comes up, in a random order after the first of each
+        type_ = types[number] if number < len(types) else rng.choice(types)
+        first_pass = builder.sample(notification_structures[type_], type=type_, number=number,
+                                    player=rng.choice(players))
+        later_passes = []
+        for _ in range(4):
+            # Each later pass starts with seven bytes that are each 0 or 1, which quest_scanner.py looks for
+            later_passes.append(builder.sample(notification2_structures[type_],
+                                               bin1=bytes(rng.randint(0, 1) for _ in range(7))))
+        data["notifications"].append([first_pass] + later_passes)
+
+    data.update(world_params=[world_params, {"current_player": 0}],
+                climates=[climates],
+                events=[0],
+                quests=[quests, quest_data2])
+    order = ["world_params", "climates", "events", "actions", "traits", "players", "tiles", "features", "cities",
+             "building_groups", "buildings", "units", "weapons", "magic_items", "quests", "notifications"]
+    return {key: data[key] for key in order}
+
+
+def write_bin(data, path):
+    """
+    Writes made-up data as a .bin file, as json_to_serial.py would.
+    """
+    with open(path, 'wb', buffering=0) as raw:
+        # noinspection PyTypeChecker
+        binary = b.BinWriter(raw)
+        bulk_writer.write_bulk(binary, bulk_writer.unzip_passes(data))
+        binary.flush()
+
+
+def write_savegame(data, path, config_path=savegame_tools.master_config_name):
+    """
+    Writes made-up data as a .GladiusSave file, with a header made up from the data and the versions in the master
+    config file.
+    """
+    savegame_tools.dump_save(dict(data=data, header=savegame_tools.header_from_data(
+        data, savegame_tools.read_config(config_path)["GLADIUS"])), path)
+
+
+def write(data, path):
+    """
+    Writes made-up data in whichever format path's extension calls for: .json, .bjson, .bin or .GladiusSave.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".bin":
+        write_bin(data, path)
+    elif extension == ".gladiussave":
+        write_savegame(data, path)
+    elif extension in (".json", ".bjson"):
+        savegame_tools.write_data(data, path)
+    else:
+        raise ValueError(f"Don't know how to write a {extension} file.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Makes up a saved game of any size.")
+    parser.add_argument("filename", help="Where to write it. The extension can be .json, .bjson, .bin or "
+                                         ".GladiusSave.")
+    for name, default in default_sizes.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default, dest=name,
+                            help=f"Defaults to {default}.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    use_synthetic_weapons()
+    made_up = make_data(args.seed, **{name: getattr(args, name) for name in default_sizes})
+    write(made_up, os.path.abspath(args.filename))
+    print(f"Wrote {', '.join(f'{len(made_up[key])} {key}' for key in ['tiles', 'units', 'actions', 'traits'])} "
+          f"and {len(made_up['notifications'])} notifications to {os.path.basename(args.filename)}")
@@ -0,0 +1,53 @@
+"""
+Tests for batch_convert.py, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import json
+import os
+import pytest
+import batch_convert
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+config_path = os.path.abspath(batch_convert.master_config_name)
+unpacked = savegame_tools.read_config(config_path)["GLADIUS"]["unpacked directory"]
+
+
+def test_unpack_and_pack(tmp_path):
+    good = tmp_path / "good.GladiusSave"
+    synthetic_save.write_savegame(synthetic_save.make_data(0), str(good), config_path)
+    # Cut off partway through the compressed data, so that parsing fails after some sections have been read
+    broken = tmp_path / "broken.GladiusSave"
+    broken.write_bytes(good.read_bytes()[:len(good.read_bytes()) // 2])
+
+    manifest = batch_convert.run_batch(str(tmp_path), "unpack", config_path, workers=1)
+
+    assert manifest["files"][str(good)]["status"] == "done"
+    assert manifest["files"][str(broken)]["status"] == "failed"
+    assert sorted(os.listdir(tmp_path / unpacked)) == ["good.ini", "good.json"]
+
+    # json files that weren't unpacked are left alone
+    (tmp_path / unpacked / "report.json").write_text(json.dumps({"sections": []}))
+    manifest = batch_convert.run_batch(str(tmp_path / unpacked), "pack", config_path, workers=1)
+
+    assert list(manifest["files"]) == [str(tmp_path / unpacked / "good.json")]
+    packed = tmp_path / unpacked / "good.GladiusSave"
+    assert savegame_tools.load_save(str(packed)) == savegame_tools.load_save(str(good))
+
+
+def test_failed_pack_leaves_nothing(tmp_path, monkeypatch):
+    path = tmp_path / "save.json"
+    savegame_tools.write_data(synthetic_save.make_data(1), str(path))
+    savegame_tools.write_header_config(dict(version="1", branch="", revision="", build="", steamuser="", turn=1,
+                                            checksum=0, mod_count=0), [], str(tmp_path / "save.ini"))
+
+    def failing_compress(data, level=-1):
+        raise MemoryError("Out of memory")
+
+    monkeypatch.setattr(savegame_tools.zlib, "compress", failing_compress)
+    versions = savegame_tools.read_config(config_path)["GLADIUS"]
+    with pytest.raises(MemoryError):
+        batch_convert.pack(str(path), versions)
+    assert sorted(os.listdir(tmp_path)) == ["save.ini", "save.json"]
@@ -0,0 +1,62 @@
+"""
+Tests for binarizer.py. Run with pytest from this directory.
+"""
+
+import gc
+import mmap
+import pytest
+import binarizer as b
+
+
+@pytest.fixture
+def reader(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(bytes(range(256)) * 4)
+    with open(path, 'rb') as file:
+        binary = b.BinReader(file.fileno(), 0, access=mmap.ACCESS_READ)
+    binary.enable_views(16)
+    return binary
+
+
+def test_views_survive_close(reader):
+    reader.seek(10)
+    view = reader.read_opaque(100)
+    held = [view]  # Another reference, which used to make close think there were views when there weren't
+    reader.close()
+    assert reader.closed
+    assert bytes(held[0]) == bytes(range(10, 110))
+    assert view == bytes(range(10, 110))
+
+
+def test_close_without_views(reader):
+    view = reader.read_opaque(100)
+    del view
+    backing = reader._backing
+    assert len(backing.views) == 0
+    reader.close()
+    assert reader.closed
+    # Nothing was copied, so the backing still refers to the memory map, which has been released
+    with pytest.raises(ValueError):
+        backing.data.tobytes()
+
+
+def test_close_with_memoryview_left(reader):
+    memory = reader.read_opaque(100).memory()
+    reader.close()
+    # Can't be closed while the memoryview refers to it, but nothing goes wrong
+    assert not reader.closed
+    assert memory.tobytes() == bytes(range(100))
+    memory.release()
+    del memory
+    gc.collect()
+
+
+def test_short_fields_are_copied(reader):
+    assert isinstance(reader.read_opaque(8), bytes)
+    assert isinstance(reader.read_opaque(16), b.BytesView)
+
+
+def test_repeated_struct_cache_is_bounded():
+    for count in range(3000):
+        b._repeated_struct("i", count)
+    assert b._repeated_struct.cache_info().currsize <= b._repeated_struct.cache_info().maxsize == 1024
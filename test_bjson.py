@@ -0,0 +1,52 @@
+"""
+Tests for bjson.py. Run with pytest from this directory.
+"""
+
+import json
+import pytest
+import binarizer as b
+import bjson
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, -1, 1 << 31, -(1 << 63), 1 << 100, -(1 << 100), 1.5, float("inf"), "", "Units/Ork/Boy",
+    "ünïcode", b"", b"\x00\xff" * 100, [], {}, [1, 2, 3], [1, 1 << 40], [1.0, 2.5], [True, False], ["a", "bc"],
+    [b"a", b"\x00"], [1, "a", None, 2.0], [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}], [{"a": 1}, {"b": 2}, {"a": 3}],
+    [[1, 2], [3, 4], [5, 6]], [[1], [2, 3], []], {"nested": {"list": [[{"x": b"\x01"}]]}},
+    ["a", "b", "a", "a"], ["ü", "ü", ""], [b"x", b"", b"x", b"x"],
+    [{"it's": 1, 'say "{}"': 2}, {"it's": 3, 'say "{}"': 4}],
+])
+def test_round_trip(value):
+    assert bjson.loads(bjson.dumps(value)) == value
+
+
+def test_tuples_become_lists():
+    assert bjson.loads(bjson.dumps((1, (2, 3)))) == [1, [2, 3]]
+
+
+def test_made_up_save_round_trip():
+    data = synthetic_save.make_data(0)
+    # Compared as json, as the passes come back as lists rather than tuples
+    encoded = json.dumps(data, cls=b.BytesJSONEncoder)
+    assert json.dumps(bjson.loads(bjson.dumps(data)), cls=b.BytesJSONEncoder) == encoded
+
+
+def test_default_for_unknown_types():
+    with pytest.raises(TypeError):
+        bjson.dumps(object())
+    assert bjson.loads(bjson.dumps([{1, 2}], default=sorted)) == [[1, 2]]
+
+
+def test_bad_magic():
+    with pytest.raises(ValueError):
+        bjson.loads(b"NOPE" + bjson.dumps(1)[4:])
+
+
+def test_reads_version_1():
+    # Nothing in it has been added since version 1
+    data = bytearray(bjson.dumps([{"a": 1, "b": ["x", "y"]}, {"a": 2, "b": ["z"]}]))
+    data[len(bjson.MAGIC)] = 1
+    assert bjson.loads(data) == [{"a": 1, "b": ["x", "y"]}, {"a": 2, "b": ["z"]}]
@@ -0,0 +1,158 @@
+"""
+Tests for json_editor_tools.GladiusSave, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import random
+import json_editor_tools
+import references
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def make_save(seed=0):
+    return json_editor_tools.GladiusSave(synthetic_save.make_data(seed))
+
+
+def test_delete_player_units_keeps_references_intact():
+    save = make_save()
+    assert save.check_integrity() == []
+    owned = {unit[0]["id"] for unit in save.entries("units") if unit[1]["owner"] == 0}
+    assert owned
+
+    save.delete_player_units(0)
+
+    assert save.check_integrity() == []
+    assert not any(unit[1]["owner"] == 0 for unit in save.entries("units"))
+    assert not any(tile[3]["unit"] in owned for tile in save.entries("tiles"))
+    # Nothing is left in the way of writing it
+    references.check_integrity(save.data)
+    savegame_tools.serialize(save.data)
+
+
+def test_delete_many_cascades():
+    save = make_save(1)
+    unit = next(unit for unit in save.entries("units") if unit[1]["actions"] and unit[1]["weapons"])
+    unit_id = unit[0]["id"]
+    tile_id = unit[3]["tile_id"]
+
+    deleted = save.delete_many([("units", unit_id)])
+
+    assert unit_id in deleted["units"]
+    assert set(unit[1]["actions"]) <= deleted["actions"]
+    assert set(unit[1]["weapons"]) <= deleted["weapons"]
+    assert ("units", unit_id) not in save
+    if tile_id != -1:
+        assert save.get("tiles", tile_id)[3]["unit"] != unit_id
+    assert save.check_integrity() == []
+
+
+def test_delete_transported_unit_leaves_transport():
+    save = make_save(2)
+    transport = next(unit for unit in save.entries("units") if unit[1]["transported_units"])
+    passenger_id = transport[1]["transported_units"][0]
+
+    save.delete_unit(passenger_id)
+
+    assert passenger_id not in save.get("units", transport[0]["id"])[1]["transported_units"]
+    assert save.check_integrity() == []
+
+
+def test_delete_transport_deletes_passengers():
+    save = make_save(3)
+    transport = next(unit for unit in save.entries("units") if unit[1]["transported_units"])
+    passengers = list(transport[1]["transported_units"])
+
+    deleted = save.delete_many([("units", transport[0]["id"])])
+
+    assert set(passengers) <= deleted["units"]
+    assert save.check_integrity() == []
+
+
+def test_delete_then_save_bin_splices(tmp_path):
+    original = tmp_path / "save.bin"
+    synthetic_save.write_bin(synthetic_save.make_data(4), str(original))
+    save = json_editor_tools.GladiusSave.load(str(original))
+    save.delete_player_units(1)
+    assert (3, "tiles") in save.dirty
+    edited = tmp_path / "edited.bin"
+    save.save(str(edited))
+    save.close()
+
+    reloaded = json_editor_tools.GladiusSave.load(str(edited))
+    data = reloaded.data
+    reloaded.close()
+    assert edited.read_bytes() == savegame_tools.serialize(data)
+    assert references.check_integrity(data) == []
+
+
+def test_clear_notifications():
+    save = make_save(5)
+    save.clear_notifications()
+
+    assert list(save.entries("notifications")) == []
+    data = save.data
+    assert data["notifications"] == []
+    cleared = dict(synthetic_save.make_data(5), notifications=[])
+    assert savegame_tools.serialize(data) == savegame_tools.serialize(cleared)
+
+
+def test_delete_unit_with_only_two_passes():
+    # As benchmark_editing.py makes them, without the pass that says which tile they're on
+    save = json_editor_tools.GladiusSave(dict(units=[
+        [dict(id=id_), dict(actions=[], traits=[], weapons=[], transported_units=[], transport=-1)]
+        for id_ in range(3)], tiles=[]))
+
+    save.delete_unit(1)
+
+    assert [unit[0]["id"] for unit in save.entries("units")] == [0, 2]
+
+
+def on_tiles_brute_force(save, matches):
+    """
+    :param matches: Called with each tile, and says whether what's on it should be found.
+    :return: What SpatialIndex.on_tiles should return, found by looking at every object, with each list sorted.
+    """
+    tiles = {tile[0]["id"]: tile for tile in save.entries("tiles")}
+    found = dict(units=[], features=[], buildings=[])
+    for unit in save.entries("units"):
+        if unit[3]["tile_id"] in tiles and matches(tiles[unit[3]["tile_id"]]):
+            found["units"].append(unit[0]["id"])
+    for feature in save.entries("features"):
+        if feature[1]["tile_id"] in tiles and matches(tiles[feature[1]["tile_id"]]):
+            found["features"].append(feature[0]["id"])
+    for tile in tiles.values():
+        if matches(tile):
+            found["buildings"].extend(tile[1]["building_ids"])
+    return {type_: sorted(ids) for type_, ids in found.items()}
+
+
+def test_spatial_index_matches_brute_force_after_edits():
+    save = make_save(6)
+    # Built first, so that it has to keep up with the edits rather than being made from the edited data
+    index = save.spatial_index()
+    random_ = random.Random(6)
+    empty_tiles = [tile[0]["id"] for tile in save.entries("tiles") if tile[3]["unit"] == -1]
+    on_map = [unit[0]["id"] for unit in save.entries("units") if unit[3]["tile_id"] != -1]
+    for unit_id, tile_id in zip(random_.sample(on_map, 10), random_.sample(empty_tiles, 10)):
+        save.move_unit(unit_id, tile_id)
+    save.delete_many([("units", unit_id) for unit_id in random_.sample(on_map, 10) if ("units", unit_id) in save] +
+                     [("features", feature[0]["id"]) for feature in list(save.entries("features"))[::3]])
+    assert save.spatial_index() is index
+
+    def sort(found):
+        return {type_: sorted(ids) for type_, ids in found.items()}
+
+    positions = [(tile[0]["x"], tile[0]["y"]) for tile in save.entries("tiles")]
+    for _ in range(20):
+        (x1, y1), (x2, y2) = random_.sample(positions, 2)
+        x_min, x_max, y_min, y_max = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+        assert sort(index.in_box(x_min, y_min, x_max, y_max)) == on_tiles_brute_force(
+            save, lambda tile: x_min <= tile[0]["x"] <= x_max and y_min <= tile[0]["y"] <= y_max)
+        radius = random_.uniform(0, 10)
+        assert sort(index.in_radius(x1, y1, radius)) == on_tiles_brute_force(
+            save, lambda tile: (tile[0]["x"] - x1) ** 2 + (tile[0]["y"] - y1) ** 2 <= radius ** 2)
+    for region in {tile[0]["region_name"] for tile in save.entries("tiles")}:
+        assert sort(index.in_region(region)) == on_tiles_brute_force(
+            save, lambda tile: tile[0]["region_name"] == region)
@@ -0,0 +1,34 @@
+"""
+Tests for instrumentation.py, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import gc
+import io
+import binarizer as b
+import bulk_parser
+import instrumentation
+import json_stream
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def test_no_section_reports_negative_allocations():
+    bulk = savegame_tools.serialize(synthetic_save.make_data(0))
+    binary = b.BinReader(-1, len(bulk))
+    binary.write(bulk)
+    binary.seek(0)
+    instrument = instrumentation.Instrument()
+    sections = bulk_parser.iter_bulk(binary, instrument.locations())
+    instrument.begin()
+    # As serial_to_json.py does when streaming, which lets go of each section as soon as it's been written
+    json_stream.dump_bulk(instrument.iter_sections(sections, binary.tell), io.StringIO())
+    instrument.finish()
+    report = instrument.report()
+    assert gc.isenabled()
+
+    assert sum(section["bytes"] for section in report["sections"]) == len(bulk)
+    negative = [(section["pass_number"], section["section"], section["allocated_bytes"])
+                for section in report["sections"] if section["allocated_bytes"] < 0]
+    assert negative == []
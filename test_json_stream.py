@@ -0,0 +1,74 @@
+"""
+Tests for json_stream.py and the json and bjson files, on saves made up with synthetic_save.py. Run with pytest from
+this directory.
+"""
+
+import io
+import json
+import pytest
+import binarizer as b
+import bulk_parser
+import bulk_writer
+import json_stream
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def bin_sections(data):
+    """
+    :return: The sections of the bulk data of data, as read by bulk_parser.iter_bulk.
+    """
+    bulk = savegame_tools.serialize(data)
+    binary = b.BinReader(-1, len(bulk))
+    binary.write(bulk)
+    binary.seek(0)
+    return bulk_parser.iter_bulk(binary)
+
+
+def test_dump_bulk_matches_json_dump():
+    data = synthetic_save.make_data(0)
+    streamed = io.StringIO()
+    json_stream.dump_bulk(bin_sections(data), streamed)
+    whole = io.StringIO()
+    json.dump(bulk_parser.zip_passes(bulk_parser.collect_passes(bin_sections(data))), whole, cls=b.BytesJSONEncoder,
+              indent="    ")
+    assert streamed.getvalue() == whole.getvalue()
+
+
+def test_iter_sections_round_trip():
+    data = synthetic_save.make_data(1)
+    streamed = io.StringIO()
+    json_stream.dump_bulk(bin_sections(data), streamed)
+    streamed.seek(0)
+    binary = io.BytesIO()
+    writer = b.BinWriter(binary)
+    bulk_writer.write_bulk_sections(writer, json_stream.iter_sections(streamed))
+    writer.flush()
+    assert binary.getvalue() == savegame_tools.serialize(data)
+
+
+@pytest.mark.parametrize("extension", [".json", ".bjson"])
+def test_write_data_round_trip(tmp_path, extension):
+    data = synthetic_save.make_data(2)
+    path = str(tmp_path / ("save" + extension))
+    savegame_tools.write_data(data, path)
+    assert savegame_tools.serialize(savegame_tools.read_data(path)) == savegame_tools.serialize(data)
+    assert [file.name for file in tmp_path.iterdir()] == ["save" + extension]
+
+
+def test_failed_dump_leaves_nothing_behind(tmp_path):
+    data = synthetic_save.make_data(3)
+    path = str(tmp_path / "save.json")
+
+    def failing_sections():
+        for number, section in enumerate(bin_sections(data)):
+            if number == 5:
+                raise FileNotFoundError("No weapons")
+            yield section
+
+    with pytest.raises(FileNotFoundError):
+        with savegame_tools.replacing(path) as temporary_path, open(temporary_path, 'w') as file:
+            json_stream.dump_bulk(failing_sections(), file)
+    assert list(tmp_path.iterdir()) == []
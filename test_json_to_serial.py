@@ -0,0 +1,61 @@
+"""
+Tests for json_to_serial.py, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import os
+import runpy
+import sys
+import pytest
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_to_serial.py")
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", [script, *args])
+    runpy.run_path(script, run_name="__main__")
+
+
+@pytest.fixture
+def dangling(tmp_path):
+    """
+    A .json file with a reference to a weapon that doesn't exist.
+    """
+    data = synthetic_save.make_data(0)
+    data["units"][0][1]["weapons"].append(999999)
+    path = tmp_path / "save.json"
+    savegame_tools.write_data(data, str(path))
+    return path, data
+
+
+def test_problems_are_only_printed(monkeypatch, capsys, dangling):
+    path, data = dangling
+    run(monkeypatch, str(path))
+
+    assert "units 0 refers to weapons 999999" in capsys.readouterr().out
+    assert (path.parent / "save_2.bin").read_bytes() == savegame_tools.serialize(data)
+
+
+def test_strict_writes_nothing(monkeypatch, dangling):
+    path, data = dangling
+    with pytest.raises(SystemExit) as exit_info:
+        run(monkeypatch, str(path), "--strict")
+
+    assert "Nothing was written" in str(exit_info.value)
+    assert not (path.parent / "save_2.bin").exists()
+
+
+def test_malformed_json_leaves_nothing(monkeypatch, tmp_path):
+    path = tmp_path / "save.json"
+    savegame_tools.write_data(synthetic_save.make_data(1), str(path))
+    # Cut off partway through, after the first few sections
+    text = path.read_text()
+    path.write_text(text[:len(text) // 2])
+
+    with pytest.raises(Exception):
+        run(monkeypatch, str(path))
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["save.json"]
@@ -0,0 +1,69 @@
+"""
+Tests for quest_scanner.py, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import binarizer as b
+import bulk_parser
+import quest_scanner
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def chunked(data, size=1 << 14):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read_bin(bulk):
+    binary = b.BinReader(-1, len(bulk))
+    binary.write(bulk)
+    binary.seek(0)
+    return bulk_parser.zip_passes(bulk_parser.parse_bulk(binary))
+
+
+def test_quests_read_back_from_bin():
+    data = synthetic_save.make_data(0, quests=12)
+    parsed = read_bin(savegame_tools.serialize(data))
+    assert parsed["quests"] == data["quests"]
+
+
+def test_stream_reader_reads_the_same():
+    data = synthetic_save.make_data(1, quests=12)
+    bulk = savegame_tools.serialize(data)
+    streamed = bulk_parser.zip_passes(bulk_parser.parse_bulk(b.StreamReader(chunked(bulk))))
+    assert streamed == read_bin(bulk)
+
+
+def test_quests_with_something_like_a_quest_inside():
+    data = synthetic_save.make_data(2, quests=3)
+    # A false start of a quest in the middle of a block, which isn't followed by a readable quest
+    data["quests"][0][0]["bin1"] = b"abc" + quest_scanner.quest_name_prefix + b"\x01\x02" + data["quests"][0][0]["bin1"]
+    assert read_bin(savegame_tools.serialize(data))["quests"] == data["quests"]
+
+
+def test_no_quests():
+    data = synthetic_save.make_data(3, quests=0)
+    assert read_bin(savegame_tools.serialize(data))["quests"] == [[], b""]
+
+
+def test_read_quests2_only_reads_a_little_ahead(monkeypatch):
+    # Big enough that there's more after the quests than the scanner is allowed to search
+    data = synthetic_save.make_data(4, quests=32, notifications=20000, width=96, height=96)
+    bulk = savegame_tools.serialize(data)
+    # How far the reader had to read ahead of where the second pass of the quests ended
+    lookahead = []
+    read_quests2 = quest_scanner.read_quests2
+
+    def measured(binary, quest_count, notification_types):
+        block = read_quests2(binary, quest_count, notification_types)
+        lookahead.append(binary._start + len(binary._buffer) - binary.tell())
+        return block
+
+    monkeypatch.setattr(quest_scanner, "read_quests2", measured)
+    streamed = bulk_parser.zip_passes(bulk_parser.parse_bulk(b.StreamReader(chunked(bulk))))
+
+    assert streamed["quests"] == data["quests"]
+    # Rather than the max_payload bytes for each of the 32 quests that it's allowed to search
+    assert len(lookahead) == 1 and lookahead[0] < 4 * quest_scanner.max_payload
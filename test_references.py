@@ -0,0 +1,66 @@
+"""
+Tests for references.py, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import pytest
+import references
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def test_made_up_save_has_no_problems():
+    assert references.check_integrity(synthetic_save.make_data(0)) == []
+
+
+def test_dangling_reference_is_an_error():
+    data = synthetic_save.make_data(1)
+    unit = data["units"][0]
+    unit[1]["weapons"].append(999999)
+
+    problems = references.check_integrity(data)
+
+    assert problems == [references.Problem("dangling", "units", unit[0]["id"], "weapons", "weapons", 999999)]
+    with pytest.raises(references.IntegrityError):
+        references.raise_problems(problems)
+
+
+def test_tile_holding_a_missing_unit_is_only_a_warning():
+    data = synthetic_save.make_data(2)
+    tile = data["tiles"][0]
+    tile[3]["unit"] = 999999
+
+    problems = references.check_integrity(data)
+
+    assert [problem.field for problem in problems] == ["unit"]
+    assert references.raise_problems(problems) == problems
+
+
+def test_duplicate_and_repeated_ids():
+    data = synthetic_save.make_data(3)
+    data["features"][1][0]["id"] = data["features"][0][0]["id"]
+    player = data["players"][0]
+    player[1]["tiles_revealed"] = [data["tiles"][0][0]["id"]] * 2
+
+    problems = references.check_integrity(data)
+
+    assert references.Problem("duplicate id", "features", data["features"][0][0]["id"], None, None, None) in problems
+    assert any(problem.kind == "repeated" and problem.id_ == player[0]["id"] for problem in problems)
+
+
+def test_streamed_check_matches_whole_check():
+    data = synthetic_save.make_data(4)
+    data["tiles"][5][1]["city_id"] = 999999
+    checker = references.IntegrityChecker()
+    for key, value in data.items():
+        checker.add_section(key, value)
+
+    assert checker.problems() == references.check_integrity(data) != []
+
+
+def test_referrers():
+    data = synthetic_save.make_data(5)
+    unit = next(unit for unit in data["units"] if unit[1]["weapons"])
+    graph = references.ReferenceGraph(data)
+
+    assert ("units", unit[0]["id"], "weapons") in graph.referrers("weapons", unit[1]["weapons"][0])
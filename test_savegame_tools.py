@@ -0,0 +1,40 @@
+"""
+Tests for savegame_tools.py, on saves made up with synthetic_save.py. Run with pytest from this directory.
+"""
+
+import io
+import zlib
+import pytest
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def test_decompressed_chunks():
+    data = bytes(range(256)) * 20000
+    compressed = zlib.compress(data)
+    chunks = list(savegame_tools.decompressed_chunks(io.BytesIO(compressed), chunk_size=1000, max_output=1 << 16))
+    assert b"".join(chunks) == data
+    assert max(map(len, chunks)) <= 1 << 16
+
+
+def test_decompressed_chunks_truncated():
+    compressed = zlib.compress(bytes(range(256)) * 1000)
+    with pytest.raises(zlib.error):
+        list(savegame_tools.decompressed_chunks(io.BytesIO(compressed[:len(compressed) // 2])))
+
+
+def test_load_and_dump_save(tmp_path):
+    path = str(tmp_path / "save.GladiusSave")
+    synthetic_save.write_savegame(synthetic_save.make_data(0), path)
+    model = savegame_tools.load_save(path)
+    copy = str(tmp_path / "copy.GladiusSave")
+    savegame_tools.dump_save(model, copy)
+
+    assert savegame_tools.load_save(copy) == model
+    header, mods, offset = savegame_tools.read_savegame_header(path)
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        bulk = b"".join(savegame_tools.decompressed_chunks(file))
+    assert bulk == savegame_tools.serialize(model["data"])
@@ -0,0 +1,81 @@
+"""
+Tests for saving .bin files by splicing in only what's changed (bulk_writer.splice_bulk), on saves made up with
+synthetic_save.py. Run with pytest from this directory.
+"""
+
+import pytest
+import json_editor_tools
+import savegame_tools
+import synthetic_save
+
+synthetic_save.use_synthetic_weapons()
+
+
+def first_unit(save):
+    return next(save.entries("units"))[0]["id"]
+
+
+edits = {
+    "nothing": lambda save: None,
+    "reveal_map": lambda save: save.reveal_map(next(save.entries("players"))[0]["id"]),
+    "hide_map": lambda save: save.hide_map(next(save.entries("players"))[0]["id"]),
+    "delete_unit": lambda save: save.delete_unit(first_unit(save)),
+    "delete_player_units": lambda save: save.delete_player_units(0),
+    "flood_height": lambda save: save.flood_terrain(None, 1),
+    "clear_notifications": lambda save: save.clear_notifications(),
+    "move_unit": lambda save: save.move_unit(first_unit(save), next(
+        tile[0]["id"] for tile in save.entries("tiles") if tile[3]["unit"] == -1)),
+}
+
+
+def saved(save, path):
+    """
+    :return: (the bytes save wrote to path, the data as it was saved)
+    """
+    save.save(str(path))
+    data = save.data
+    return path.read_bytes(), data
+
+
+@pytest.mark.parametrize("edit", list(edits))
+def test_splice_matches_serialize(tmp_path, edit):
+    original = tmp_path / "save.bin"
+    synthetic_save.write_bin(synthetic_save.make_data(0), str(original))
+    save = json_editor_tools.GladiusSave.load(str(original))
+    edits[edit](save)
+    assert save.dirty is not None
+
+    written, data = saved(save, tmp_path / "edited.bin")
+
+    assert written == savegame_tools.serialize(data)
+    save.close()
+
+
+def test_saving_again_only_writes_new_changes(tmp_path):
+    original = tmp_path / "save.bin"
+    synthetic_save.write_bin(synthetic_save.make_data(1), str(original))
+    save = json_editor_tools.GladiusSave.load(str(original))
+    save.delete_player_units(1)
+    save.save(str(original))
+    assert save.dirty == set()
+
+    save.reveal_map(next(save.entries("players"))[0]["id"])
+    assert save.dirty == {(1, "players")}
+    written, data = saved(save, original)
+
+    assert written == savegame_tools.serialize(data)
+    save.close()
+
+
+def test_unknown_changes_write_everything(tmp_path):
+    original = tmp_path / "save.bin"
+    synthetic_save.write_bin(synthetic_save.make_data(2), str(original))
+    save = json_editor_tools.GladiusSave.load(str(original))
+    # Handing out the data means anything might have changed
+    save.data["units"][0][0]["health"] += 1
+    assert save.dirty is None
+
+    written, data = saved(save, tmp_path / "edited.bin")
+
+    assert written == savegame_tools.serialize(data) != original.read_bytes()
+    save.close()
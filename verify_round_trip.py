@@ -0,0 +1,328 @@
+"""
+Checks that .bin files survive a round trip through serial_to_json.py and json_to_serial.py byte for byte, and if one
+doesn't, says where it first goes wrong: the pass, section, record and field.
+
+Each pair of files is compared a large chunk at a time through memory maps, which takes about as long as reading them.
+Only when a pair differs is the original parsed (or its index read, if it has an up-to-date one; see record_index.py)
+to find out what the offset of the first difference is part of. Pairs are checked in parallel.
+
+Run it on two files, or on directories, where every X.bin with an X_2.bin next to it (as written by json_to_serial.py)
+is checked.
+"""
+
+import argparse
+import bisect
+import collections
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import binarizer as b
+import bulk_parser as bp
+import quest_scanner
+import record_index
+from bulk_reader_tools import *
+
+Divergence = collections.namedtuple("Divergence", "original copy offset original_size copy_size original_byte "
+                                                  "copy_byte pass_number section record id_ field")
+Divergence.__doc__ = """
+Where a pair of files first differ. original_byte and copy_byte are None past the end of the file. pass_number,
+section, record, id_ and field are None where they don't apply or couldn't be worked out.
+"""
+
+
+def _mismatch(a, b_):
+    """
+    :return: The index of the first byte that differs between two different, equally long bytes objects.
+    """
+    low, high = 0, len(a)
+    # Everything before low matches, and the first difference is before high
+    while high - low > 1:
+        middle = (low + high) // 2
+        if a[low:middle] == b_[low:middle]:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def first_difference(original_path, copy_path, chunk_size=1 << 22):
+    """
+    :return: The offset of the first byte that differs between two files, or None if they're the same. If one is the
+    start of the other, that's the length of the shorter one.
+    """
+    with open(original_path, 'rb') as original_file, open(copy_path, 'rb') as copy_file:
+        original_size = os.fstat(original_file.fileno()).st_size
+        copy_size = os.fstat(copy_file.fileno()).st_size
+        size = min(original_size, copy_size)
+        if size == 0:
+            # Empty files can't be memory-mapped
+            return None if original_size == copy_size else 0
+        original = mmap.mmap(original_file.fileno(), 0, access=mmap.ACCESS_READ)
+        copy = mmap.mmap(copy_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start in range(0, size, chunk_size):
+                original_chunk = original[start:start + chunk_size]
+                copy_chunk = copy[start:start + chunk_size]
+                if original_chunk != copy_chunk:
+                    end = min(len(original_chunk), len(copy_chunk))
+                    if original_chunk[:end] == copy_chunk[:end]:
+                        # The chunk is only different because one file ends in it
+                        return start + end
+                    return start + _mismatch(original_chunk[:end], copy_chunk[:end])
+        finally:
+            original.close()
+            copy.close()
+    return None if original_size == copy_size else size
+
+
+# ==== Working out what an offset is part of ==== #
+
+def _field_path(binary, structure, offset):
+    """
+    Reads a structure from binary's current position until it gets past offset.
+    :return: A list of the dict keys and list indexes leading to the innermost value that offset is in, or None if the
+    structure ends before offset.
+    """
+    if isinstance(structure, b.DataFormat):
+        if isinstance(structure.until, re.Pattern):
+            # Can't be read on its own, but it runs up to the next record, which is known to be after offset
+            return []
+        binary.fpop(*structure)
+        return [] if offset < binary.tell() else None
+    elif isinstance(structure, dict):
+        parts = structure.items()
+    elif isinstance(structure, list):
+        if len(structure) == 1 or isinstance(structure[1], b.DataFormat):
+            count = binary.fpop(*(structure[1] if len(structure) == 2 else b.UINT))
+            if offset < binary.tell():
+                return ["count"]
+        else:
+            count = structure[1]
+        parts = ((n, structure[0]) for n in range(count))
+    else:
+        parts = enumerate(structure)
+    for name, substructure in parts:
+        path = _field_path(binary, substructure, offset)
+        if path is not None:
+            return [name] + path
+    return None
+
+
+def format_field(path):
+    """
+    Turns a path from _field_path into a string like "weapons[2].id".
+    """
+    text = ""
+    for part in path:
+        text += f"[{part}]" if isinstance(part, int) else f".{part}"
+    return text.lstrip(".")
+
+
+def _record_structure(binary, pass_number, key, first_pass_offset):
+    """
+    :param first_pass_offset: Where the first-pass record of the same object starts, for the sections whose later
+    records depend on it.
+    """
+    if key == "quests":
+        return quest_structure
+    elif key not in ("actions", "notifications"):
+        return bp.record_structures[pass_number].get(key)
+    binary.seek(first_pass_offset)
+    first_pass_record = bp.read_record(binary, 0, key)
+    if key == "actions":
+        if pass_number == 0:
+            if first_pass_record["path"].endswith("CycleWeapon"):
+                return action_cycle_weapon_structure
+            return action_structure
+        elif is_weapon(first_pass_record["path"]):
+            return action2_weapon_structure
+        return action2_normal_structure
+    if pass_number == 0:
+        return notification_structures[first_pass_record["type"]]
+    return notification2_structures[first_pass_record["type"]]
+
+
+# Structures of the sections that aren't lists of records
+_section_structures = {(0, "world_params"): world_params_structure,
+                       (0, "events"): b.UINT,
+                       (1, "world_params"): dict(current_player=b.UINT)}
+
+
+def _record_start(spec, offset):
+    """
+    :param spec: One pass of a section from a record index.
+    :return: (record number, where it starts), or None if offset is before the first record.
+    """
+    if "offsets" in spec:
+        record = bisect.bisect_right(spec["offsets"], offset) - 1
+        return None if record < 0 else (record, spec["offsets"][record])
+    elif "start" in spec:
+        if offset < spec["start"]:
+            return None
+        record = (offset - spec["start"]) // spec["stride"]
+        return record, spec["start"] + record * spec["stride"]
+    return None
+
+
+def locate(bin_path, offset, index=None):
+    """
+    Works out what part of a .bin file an offset is in.
+    :param index: The file's record index. If not given, it's read from the file's .idx if that's up to date, and built
+    otherwise.
+    :return: (pass number, section, record number, record id, field), with None for whatever doesn't apply.
+    """
+    if index is None:
+        index_path = record_index.index_path_for(bin_path)
+        if os.path.isfile(index_path):
+            index = record_index.read_index(index_path)
+        if index is None or not record_index.is_current(index, bin_path):
+            index = record_index.build_index(bin_path)
+
+    # The locations are in the order the sections appear in the file
+    found = None
+    for pass_number, sections in enumerate(index["locations"]):
+        for key, start in sections.items():
+            if start <= offset:
+                found = pass_number, key, start
+    if found is None:
+        return None, None, None, None, None
+    pass_number, key, section_start = found
+
+    with open(bin_path, 'rb') as file:
+        binary = b.BinReader(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if offset >= len(binary):
+            return pass_number, key, None, None, None
+        section = index["sections"].get(key)
+        if key == "quests" and pass_number == 0:
+            # Not in the index, so they're found again
+            binary.seek(section_start)
+            offsets = []
+            quest_scanner.read_quests(binary, offsets)
+            section = dict(ids=None, passes=[dict(offsets=offsets)])
+        elif section is None:
+            structure = _section_structures.get((pass_number, key))
+            if structure is None:
+                # Quests in the second pass, which are a single block of bytes
+                return pass_number, key, None, None, None
+            binary.seek(section_start)
+            path = _field_path(binary, structure, offset)
+            return pass_number, key, None, None, format_field(path) if path else None
+
+        spec = section["passes"][pass_number]
+        found = _record_start(spec, offset)
+        if found is None:
+            # The count at the start of the section
+            return pass_number, key, None, None, "count"
+        record, record_start = found
+        first_pass_offset = None
+        if key in ("actions", "notifications"):
+            first_pass_offset = section["passes"][0]["offsets"][record]
+        structure = _record_structure(binary, pass_number, key, first_pass_offset)
+        binary.seek(record_start)
+        path = _field_path(binary, structure, offset)
+        id_ = section["ids"][record] if section["ids"] is not None and record < len(section["ids"]) else None
+        return pass_number, key, record, id_, format_field(path) if path else None
+    finally:
+        binary.close()
+
+
+def verify_pair(original_path, copy_path):
+    """
+    :return: A Divergence, or None if the files are the same.
+    """
+    offset = first_difference(original_path, copy_path)
+    if offset is None:
+        return None
+    original_size = os.path.getsize(original_path)
+    copy_size = os.path.getsize(copy_path)
+
+    def byte_at(path, size):
+        if offset >= size:
+            return None
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            return file.read(1)[0]
+
+    return Divergence(original_path, copy_path, offset, original_size, copy_size,
+                      byte_at(original_path, original_size), byte_at(copy_path, copy_size),
+                      *locate(original_path, offset))
+
+
+def _verify_pair_safely(pair):
+    try:
+        return verify_pair(*pair), None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+
+
+def find_pairs(directory):
+    """
+    :return: A sorted list of (original, copy) paths for every X.bin under directory with an X_2.bin next to it.
+    """
+    pairs = []
+    for subdirectory, _, files in os.walk(directory):
+        names = set(files)
+        for name in files:
+            stem, extension = os.path.splitext(name)
+            if extension.lower() == ".bin" and not stem.endswith("_2") and stem + "_2" + extension in names:
+                pairs.append((os.path.join(subdirectory, name), os.path.join(subdirectory, stem + "_2" + extension)))
+    return sorted(pairs)
+
+
+def verify_pairs(pairs, workers=None):
+    """
+    Checks many pairs of files in parallel.
+    :param pairs: A list of (original, copy) paths.
+    :param workers: How many processes to use. Defaults to the number of cores.
+    :return: A list of (Divergence or None, error message or None), one for each pair, in the same order.
+    """
+    if len(pairs) <= 1 or workers == 1:
+        return [_verify_pair_safely(pair) for pair in pairs]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return list(executor.map(_verify_pair_safely, pairs, chunksize=max(1, len(pairs) // (8 * os.cpu_count()))))
+
+
+def describe(divergence):
+    def show(value):
+        return "end of file" if value is None else f"{value:02X}"
+
+    where = []
+    if divergence.section is not None:
+        where.append(f"pass {divergence.pass_number}, {divergence.section}")
+    if divergence.record is not None:
+        where.append(f"record {divergence.record}" + (f" (id {divergence.id_})" if divergence.id_ is not None else ""))
+    if divergence.field is not None:
+        where.append(f"field {divergence.field}")
+    return f"differs at offset {divergence.offset} ({', '.join(where) or 'unknown section'}): " \
+           f"{show(divergence.original_byte)} in the original, {show(divergence.copy_byte)} in the copy" \
+           + (f"; sizes {divergence.original_size} and {divergence.copy_size}"
+              if divergence.original_size != divergence.copy_size else "")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that .bin files are reproduced exactly by a round trip "
+                                                 "through json, and finds where they first differ if not.")
+    parser.add_argument("paths", nargs="+",
+                        help="Either an original .bin file and its copy, or directories to search for X.bin and "
+                             "X_2.bin pairs.")
+    parser.add_argument("--workers", type=int, default=None, help="Defaults to the number of cores.")
+    args = parser.parse_args()
+
+    if len(args.paths) == 2 and all(os.path.isfile(path) for path in args.paths):
+        pairs = [tuple(os.path.abspath(path) for path in args.paths)]
+    else:
+        pairs = [pair for directory in args.paths for pair in find_pairs(os.path.abspath(directory))]
+
+    failures = 0
+    for (original, copy), (divergence, error) in zip(pairs, verify_pairs(pairs, args.workers)):
+        if error is not None:
+            print(f"ERROR: {original}: {error}")
+            failures += 1
+        elif divergence is not None:
+            print(f"DIFFERENT: {original} {describe(divergence)}")
+            failures += 1
+    print(f"{len(pairs) - failures} of {len(pairs)} identical")
+    sys.exit(1 if failures else 0)